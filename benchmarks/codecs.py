@@ -0,0 +1,62 @@
+import json
+import time
+from typing import Any, Callable, Tuple
+
+from mqttprocessor import serialization
+
+ROUNDS = 20_000
+STRUCT_TYPE = "google.protobuf.struct_pb2.Struct"
+
+
+def _create_document() -> Any:
+    # A typical sensor reading
+    return {
+        "device": "site-1/building-3/room-042",
+        "timestamp": 1700000000,
+        "temperature": 21.5,
+        "humidity": 40,
+        "status": "ok",
+        "battery": {"voltage": 3.29, "level": 87},
+        "samples": [21.4, 21.5, 21.5, 21.6, 21.5],
+    }
+
+
+def _measure(callback: Callable[[], Any]) -> float:
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        callback()
+    return (time.perf_counter() - start) / ROUNDS
+
+
+def _codecs() -> Tuple[Tuple[str, Callable[[Any], bytes], Callable[[bytes], Any]], ...]:
+    return (
+        ("json", lambda data: json.dumps(data).encode("utf8"), json.loads),
+        ("msgpack", serialization.encode_msgpack, serialization.decode_msgpack),
+        ("cbor", serialization.encode_cbor, serialization.decode_cbor),
+        (
+            "protobuf (Struct)",
+            lambda data: serialization.encode_protobuf(data, STRUCT_TYPE),
+            lambda binary: serialization.decode_protobuf(binary, STRUCT_TYPE),
+        ),
+    )
+
+
+def main():
+    document = _create_document()
+
+    for name, encode, decode in _codecs():
+        try:
+            payload = encode(document)
+        except ImportError as e:
+            print(f"{name}: skipped, {e}")
+            continue
+
+        encoding = _measure(lambda: encode(document))
+        decoding = _measure(lambda: decode(payload))
+        print(
+            f"{name}: {len(payload)} B, encode {encoding * 1e6:.1f} us, decode {decoding * 1e6:.1f} us"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import json
+import os
+import random
+import tempfile
+import time
+from typing import Callable, List
+
+from mqttprocessor import compression
+
+ROUNDS = 50
+SMALL_ROUNDS = 5000
+
+
+def _create_batch() -> bytes:
+    # About 240 KB batch of historian readings
+    random.seed(0)
+    return json.dumps([
+        {
+            "tag": f"site-1/line-{n % 8}/sensor-{n % 64}",
+            "timestamp": 1700000000 + n,
+            "value": round(random.uniform(20, 25), 2),
+            "quality": "good",
+        }
+        for n in range(2500)
+    ]).encode("utf8")
+
+
+def _create_readings() -> List[bytes]:
+    random.seed(1)
+    return [
+        json.dumps({
+            "tag": f"site-1/line-{n % 8}/sensor-{n % 64}",
+            "timestamp": 1700000000 + n,
+            "value": round(random.uniform(20, 25), 2),
+            "quality": "good",
+        }).encode("utf8")
+        for n in range(2000)
+    ]
+
+
+def _measure(payloads: List[bytes], compress: Callable[[bytes], bytes], rounds: int):
+    start = time.perf_counter()
+    compressed = 0
+    for index in range(rounds):
+        compressed = len(compress(payloads[index % len(payloads)]))
+    elapsed = (time.perf_counter() - start) / rounds
+
+    return compressed, elapsed
+
+
+def _report(name: str, payloads: List[bytes], compress: Callable[[bytes], bytes], rounds: int):
+    try:
+        compressed = [len(compress(payload)) for payload in payloads[:100]]
+    except ImportError as e:
+        print(f"  {name}: skipped, {e}")
+        return
+
+    _, elapsed = _measure(payloads, compress, rounds)
+    original = sum(len(payload) for payload in payloads[:100])
+    print(
+        f"  {name}: ratio {original / sum(compressed):.1f}, "
+        f"{elapsed * 1e6:.0f} us ({len(payloads[0]) / elapsed / 2 ** 20:.0f} MiB/s)"
+    )
+
+
+def _train_dictionary(samples: List[bytes]) -> str:
+    from mqttprocessor.serialization import import_codec
+    zstandard = import_codec("zstandard", "zstd")
+
+    path = os.path.join(tempfile.mkdtemp(), "readings.dict")
+    with open(path, "wb") as f:
+        f.write(zstandard.train_dictionary(4096, samples).as_bytes())
+
+    return path
+
+
+def main():
+    batch = _create_batch()
+    print(f"Batch of {len(batch) / 1000:.0f} KB")
+    for level in [1, 6, 9]:
+        _report(f"gzip {level}", [batch], lambda data: compression.gzip_compress(data, level), ROUNDS)
+    for level in [1, 3, 9, 19]:
+        _report(f"zstd {level}", [batch], lambda data: compression.zstd_compress(data, level), ROUNDS)
+    for level in [0, 9]:
+        _report(f"lz4 {level}", [batch], lambda data: compression.lz4_compress(data, level), ROUNDS)
+
+    readings = _create_readings()
+    training, testing = readings[:1000], readings[1000:]
+    print(f"Single readings of {sum(map(len, testing)) / len(testing):.0f} B")
+    _report("gzip 6", testing, compression.gzip_compress, SMALL_ROUNDS)
+    _report("zstd 3", testing, compression.zstd_compress, SMALL_ROUNDS)
+
+    try:
+        dictionary = _train_dictionary(training)
+    except ImportError as e:
+        print(f"  zstd 3 with dictionary: skipped, {e}")
+        return
+
+    _report(
+        "zstd 3 with dictionary", testing,
+        lambda data: compression.zstd_compress(data, dictionary=dictionary), SMALL_ROUNDS
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import io
+import json
+import logging
+import time
+
+from mqttprocessor.definitions import ProcessorFunctionType
+from mqttprocessor.errors import ErrorPolicy
+from mqttprocessor.functions import ProcessorFunction
+from mqttprocessor.messages import TopicName
+from mqttprocessor.routing import Processor
+
+NUMBER_OF_MESSAGES = 20_000
+
+
+def _parse(payload, special_params):
+    return json.loads(payload)
+
+
+def _measure(log_interval: float) -> float:
+    processor = Processor(
+        "parser",
+        [ProcessorFunction(ProcessorFunctionType.CONVERTER, _parse, False, False)],
+        [TopicName("{w1}/in")], TopicName("{w1}/out"),
+        error_policy=ErrorPolicy("parser", log_interval=log_interval),
+    )
+
+    start = time.perf_counter()
+    for _ in range(NUMBER_OF_MESSAGES):
+        processor.process_message("device/in", b'{"value": 1', timestamp=0)
+    return time.perf_counter() - start
+
+
+def main():
+    # Logged records are formatted, including their tracebacks, as by a real handler
+    handler = logging.StreamHandler(io.StringIO())
+    logging.getLogger().addHandler(handler)
+
+    every = _measure(log_interval=0)
+    limited = _measure(log_interval=10)
+
+    print(f"{NUMBER_OF_MESSAGES} malformed payloads")
+    print(f"Every traceback logged: {NUMBER_OF_MESSAGES / every:.0f} msg/s")
+    print(f"One traceback per 10 s: {NUMBER_OF_MESSAGES / limited:.0f} msg/s ({every / limited:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
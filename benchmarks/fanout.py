@@ -0,0 +1,75 @@
+import io
+import json
+import time
+
+from mqttprocessor.dispatch import Dispatcher
+from mqttprocessor.functions import converter, rule
+from mqttprocessor.loader import load_config
+from mqttprocessor.routing import ProcessorCreator
+
+NUMBER_OF_PROCESSORS = 50
+NUMBER_OF_MESSAGES = 20_000
+
+
+@rule
+def fanout_is_valid(message):
+    return "value" in message
+
+
+@converter
+def fanout_field(message, field):
+    return message["value"] * field
+
+
+@rule
+def fanout_above(message, field):
+    return message["value"] > field
+
+
+def _create_config(branch: str) -> str:
+    config = "processors:\n"
+    for i in range(NUMBER_OF_PROCESSORS):
+        config += (
+            f"  - source: building/{{w1}}/{{w2}}\n"
+            f"    sink: processed/{i}/{{w1}}/{{w2}}\n"
+            f"    function:\n"
+            f"      - fanout_is_valid\n"
+            f"      - name: {branch}\n"
+            f"        arguments:\n"
+            f"          field: {i}\n"
+        )
+
+    return config
+
+
+def _measure(name: str, branch: str, shared_stages: bool, payload: bytes):
+    config = load_config(io.StringIO(_create_config(branch)))
+    dispatcher = Dispatcher(
+        [ProcessorCreator(proc).create() for proc in config.processors], shared_stages
+    )
+
+    start = time.perf_counter()
+    for i in range(NUMBER_OF_MESSAGES):
+        dispatcher.process_message(f"building/floor{i % 10}/device{i % 1000}", payload)
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"{name}: {NUMBER_OF_MESSAGES} messages to {NUMBER_OF_PROCESSORS} processors in "
+        f"{elapsed:.3f} s ({NUMBER_OF_MESSAGES / elapsed:.0f} msg/s)"
+    )
+
+
+def main():
+    payload = json.dumps({
+        "value": 21.5, "unit": "C", "device": {"id": "abc", "firmware": "1.2.3"},
+        "samples": list(range(20)),
+    }).encode("utf8")
+
+    _measure("Independent processors, converters", "fanout_field", False, payload)
+    _measure("Shared stages, converters", "fanout_field", True, payload)
+    _measure("Independent processors, rules", "fanout_above", False, payload)
+    _measure("Shared stages, rules", "fanout_above", True, payload)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import time
+import tracemalloc
+from typing import List, Tuple
+
+from mqttprocessor.definitions import ProcessorFunctionType
+from mqttprocessor.functions import ProcessorFunction
+from mqttprocessor.joining import JoinStage
+from mqttprocessor.messages import TopicName
+from mqttprocessor.routing import Processor
+
+NUMBER_OF_KEYS = 100_000
+ROUNDS = 3
+
+
+def _create_processor() -> Processor:
+    def comfort(values, special_params):
+        return values["temperature"] - values["humidity"] / 10
+
+    return Processor(
+        name="comfort",
+        functions=[ProcessorFunction(ProcessorFunctionType.CONVERTER, comfort, False, False)],
+        sources=[TopicName("{w1}/temperature"), TopicName("{w1}/humidity")],
+        sink=TopicName("{w1}/comfort"),
+        input_functions=[
+            ProcessorFunction(ProcessorFunctionType.CONVERTER, lambda val, _: float(val), False, False)
+        ],
+        join=JoinStage("comfort", ["temperature", "humidity"], key="w1", max_keys=NUMBER_OF_KEYS),
+    )
+
+
+def _create_messages() -> List[Tuple[str, bytes]]:
+    messages = list()
+    for device in range(NUMBER_OF_KEYS):
+        messages.append((f"device{device}/temperature", b"21.5"))
+        messages.append((f"device{device}/humidity", b"40"))
+
+    return messages
+
+
+def main():
+    processor = _create_processor()
+    messages = _create_messages()
+
+    start = time.perf_counter()
+    joined = 0
+    for _ in range(ROUNDS):
+        for topic, payload in messages:
+            joined += len(processor.process_message(topic, payload, timestamp=0))
+    elapsed = time.perf_counter() - start
+
+    total = len(messages) * ROUNDS
+    print(
+        f"{total} messages of {NUMBER_OF_KEYS} devices joined into {joined} messages "
+        f"in {elapsed:.3f} s ({total / elapsed:.0f} msg/s)"
+    )
+
+    join = JoinStage("memory", ["temperature", "humidity"], key="w1", max_keys=NUMBER_OF_KEYS)
+    keys = [f"device{device}" for device in range(NUMBER_OF_KEYS)]
+
+    tracemalloc.start()
+    for key in keys:
+        join.add("temperature", key, 21.5, 0)
+        join.add("humidity", key, 40.0, 0)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(
+        f"Join memory {memory / 2 ** 20:.1f} MiB for {len(join)} keys "
+        f"({memory / NUMBER_OF_KEYS:.0f} B/key, keys excluded)"
+    )
+
+
+if __name__ == "__main__":
+    main()
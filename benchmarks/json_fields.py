@@ -0,0 +1,45 @@
+import json
+import time
+
+from mqttprocessor.extraction import JsonFieldExtractor
+
+ROUNDS = 500
+
+
+def _create_document() -> bytes:
+    # About 100 KB, the metadata first and the samples after it, as devices usually send them
+    document = {
+        "device": "device-1",
+        "timestamp": 1700000000,
+        "status": {"code": 1, "text": "ok"},
+        "samples": [
+            {"t": 1700000000 + n, "value": n * 0.25, "quality": "good", "tags": [f"s{n % 10}"]}
+            for n in range(1400)
+        ],
+        "summary": {"count": 1400, "mean": 212.375},
+    }
+    return json.dumps(document).encode("utf8")
+
+
+def _measure(callback, document: bytes) -> float:
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        callback(document)
+    return (time.perf_counter() - start) / ROUNDS
+
+
+def main():
+    document = _create_document()
+    print(f"Document of {len(document) / 1000:.0f} KB")
+
+    baseline = _measure(json.loads, document)
+    print(f"json.loads: {baseline * 1e6:.0f} us")
+
+    for paths in [["device"], ["device", "status.code"], ["summary.mean"], ["samples"]]:
+        extractor = JsonFieldExtractor(paths)
+        elapsed = _measure(extractor.extract, document)
+        print(f"Fields {paths}: {elapsed * 1e6:.0f} us ({baseline / elapsed:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
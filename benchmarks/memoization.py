@@ -0,0 +1,63 @@
+import json
+import random
+import time
+
+from mqttprocessor.definitions import ProcessorFunctionType
+from mqttprocessor.functions import ProcessorFunction
+from mqttprocessor.memoization import ResultCache
+
+NUMBER_OF_PAYLOADS = 200
+NUMBER_OF_MESSAGES = 200_000
+
+
+def _convert_units(payload, special_params):
+    # Decodes a reading and converts its values, as a typical converter does
+    reading = json.loads(payload)
+    return {
+        "device": reading["device"],
+        "temperature": round(reading["temperature"] - 273.15, 2),
+        "pressure": round(reading["pressure"] / 100, 1),
+        "status": {0: "off", 1: "on", 2: "error"}.get(reading["status"], "unknown"),
+    }
+
+
+def _create_payloads():
+    random.seed(0)
+    payloads = [
+        json.dumps({
+            "device": f"device-{n}",
+            "temperature": 273.15 + n % 40,
+            "pressure": 101325 + n,
+            "status": n % 3,
+        }).encode("utf8")
+        for n in range(NUMBER_OF_PAYLOADS)
+    ]
+    return random.choices(payloads, k=NUMBER_OF_MESSAGES)
+
+
+def _measure(function: ProcessorFunction, messages) -> float:
+    start = time.perf_counter()
+    for message in messages:
+        function.callback(message, "device/reading", {})
+    return time.perf_counter() - start
+
+
+def main():
+    messages = _create_payloads()
+
+    plain = ProcessorFunction(ProcessorFunctionType.CONVERTER, _convert_units, False, False)
+    baseline = _measure(plain, messages)
+    print(f"Uncached: {len(messages) / baseline:.0f} msg/s")
+
+    for size in [50, 100, 200]:
+        cache = ResultCache("convert_units", size)
+        cached = ProcessorFunction(ProcessorFunctionType.CONVERTER, cache.wrap(_convert_units), False, False)
+        elapsed = _measure(cached, messages)
+        print(
+            f"Cache of {size} for {NUMBER_OF_PAYLOADS} payloads: {len(messages) / elapsed:.0f} msg/s "
+            f"({baseline / elapsed:.1f}x), hit rate {cache.hit_rate:.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
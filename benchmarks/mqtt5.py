@@ -0,0 +1,75 @@
+import random
+from typing import List
+
+from mqttprocessor.messages import Message, TopicName
+from mqttprocessor.publishing import Publisher
+
+NUMBER_OF_TOPICS = 500
+NUMBER_OF_MESSAGES = 200_000
+PAYLOAD = b"21.5"
+
+
+class _PacketSizeClient:
+    # Counts the bytes of the PUBLISH packets the client would send
+    def __init__(self):
+        self.sent_bytes = 0
+
+    def publish(self, topic, payload, qos=0, retain=False, properties=None):
+        remaining_length = 2 + len(topic.encode("utf8")) + len(payload)
+        if qos > 0:
+            remaining_length += 2
+        if properties is not None:
+            remaining_length += len(properties.pack())
+
+        header_length = 2
+        while remaining_length >= 128 ** (header_length - 1):
+            header_length += 1
+
+        self.sent_bytes += header_length + remaining_length
+
+
+def _create_messages() -> List[Message]:
+    # Sink topics of about 80 bytes, a few of them hot
+    topics = [
+        TopicName(
+            f"site-{n % 7}/building-{n % 13}/floor-{n % 5}/room-{n:04d}"
+            f"/sensors/environment/temperature/celsius"
+        )
+        for n in range(NUMBER_OF_TOPICS)
+    ]
+    weights = [1 / (rank + 1) for rank in range(NUMBER_OF_TOPICS)]
+
+    random.seed(0)
+    return [
+        Message(topic, PAYLOAD)
+        for topic in random.choices(topics, weights, k=NUMBER_OF_MESSAGES)
+    ]
+
+
+def _measure(messages: List[Message], v5: bool, topic_alias_maximum: int = 0) -> int:
+    client = _PacketSizeClient()
+    publisher = Publisher(client, v5=v5, topic_alias_maximum=topic_alias_maximum)
+    publisher.connected(65535)
+    publisher.publish(list(messages), qos=0, retain=False)
+
+    return client.sent_bytes
+
+
+def main():
+    messages = _create_messages()
+    topic_length = sum(len(m.sink_topic.rule) for m in messages) / len(messages)
+    print(f"{len(messages)} messages with {len(PAYLOAD)} B payloads and {topic_length:.0f} B topics")
+
+    baseline = _measure(messages, v5=False)
+    print(f"MQTT 3.1.1: {baseline / len(messages):.1f} B/msg")
+
+    for v5, maximum in [(True, 0), (True, 16), (True, 64), (True, 256), (True, 1024)]:
+        sent = _measure(messages, v5, maximum)
+        print(
+            f"MQTT 5, {maximum} topic aliases: {sent / len(messages):.1f} B/msg "
+            f"({sent / baseline:.0%} of 3.1.1)"
+        )
+
+
+if __name__ == "__main__":
+    main()
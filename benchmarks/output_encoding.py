@@ -0,0 +1,43 @@
+import json
+import time
+
+from mqttprocessor.serialization import encode_json
+
+ROUNDS = 100_000
+
+
+def _create_document():
+    return {
+        "device": "site-1/building-3/room-042",
+        "timestamp": 1700000000,
+        "temperature": 21.5,
+        "humidity": 40,
+        "status": "ok",
+        "samples": [21.4, 21.5, 21.5, 21.6, 21.5],
+    }
+
+
+def _measure(callback, document) -> float:
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        callback(document)
+    return (time.perf_counter() - start) / ROUNDS
+
+
+def main():
+    document = _create_document()
+
+    # What the MQTT client did with the `str` returned by the former `json_to_binary`
+    default = _measure(lambda data: json.dumps(data).encode("utf8"), document)
+    compact = _measure(
+        lambda data: json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf8"), document
+    )
+    reused = _measure(encode_json, document)
+
+    print(f"json.dumps: {default * 1e6:.2f} us, {len(json.dumps(document))} B")
+    print(f"json.dumps, compact: {compact * 1e6:.2f} us")
+    print(f"Reused compact encoder: {reused * 1e6:.2f} us, {len(encode_json(document))} B")
+
+
+if __name__ == "__main__":
+    main()
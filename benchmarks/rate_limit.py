@@ -0,0 +1,100 @@
+import heapq
+import time
+import tracemalloc
+from typing import List
+
+from mqttprocessor.definitions import RateLimitMode
+from mqttprocessor.messages import TopicName, Message
+from mqttprocessor.throttling import RateLimiter, TimingWheel
+
+NUMBER_OF_KEYS = 200_000
+ROUNDS = 5
+
+
+def _create_messages() -> List[Message]:
+    return [
+        Message(TopicName(f"building{i % 100}/device{i}/limited"), float(i))
+        for i in range(NUMBER_OF_KEYS)
+    ]
+
+
+def _run(limiter: RateLimiter, messages: List[Message]) -> int:
+    released = 0
+    now = 0.0
+    for _ in range(ROUNDS):
+        for msg in messages:
+            limiter.limit([msg], {}, now)
+        now += 0.1
+        released += len(limiter.tick(now))
+
+    while limiter.next_deadline() is not None:
+        now = limiter.next_deadline()
+        released += len(limiter.tick(now))
+
+    return released
+
+
+def _compare_timers():
+    # One timer per key in a heap, rescheduled on every message, against the timing wheel
+    deadlines = [(i % 1000) * 0.01 + 1 for i in range(NUMBER_OF_KEYS)]
+
+    start = time.perf_counter()
+    heap = list()
+    generations = dict()
+    for _ in range(ROUNDS):
+        for key, deadline in enumerate(deadlines):
+            generations[key] = generations.get(key, 0) + 1
+            heapq.heappush(heap, (deadline, key, generations[key]))
+    while heap:
+        _, key, generation = heapq.heappop(heap)
+        if generations.get(key) == generation:
+            del generations[key]
+    heap_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    wheel = TimingWheel()
+    for _ in range(ROUNDS):
+        for key, deadline in enumerate(deadlines):
+            wheel.schedule(key, deadline, 0)
+    wheel.advance(20)
+    wheel_elapsed = time.perf_counter() - start
+
+    print(
+        f"{NUMBER_OF_KEYS * ROUNDS} timer updates: heap {heap_elapsed:.3f} s, "
+        f"timing wheel {wheel_elapsed:.3f} s"
+    )
+
+
+def main():
+    messages = _create_messages()
+
+    for mode in RateLimitMode:
+        limiter = RateLimiter("benchmark", rate=1, burst=2, mode=mode)
+
+        start = time.perf_counter()
+        released = _run(limiter, messages)
+        elapsed = time.perf_counter() - start
+
+        total = NUMBER_OF_KEYS * ROUNDS
+        print(
+            f"{mode.value}: {total} messages to {NUMBER_OF_KEYS} buckets in {elapsed:.3f} s "
+            f"({total / elapsed:.0f} msg/s), {limiter.dropped} dropped, {released} released later"
+        )
+
+    _compare_timers()
+
+    tracemalloc.start()
+    limiter = RateLimiter("benchmark", rate=1, burst=2, mode=RateLimitMode.LATEST)
+    for msg in messages:
+        limiter.limit([msg, msg, msg], {}, 0)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(
+        f"Limiter memory {memory / 2 ** 20:.1f} MiB for {NUMBER_OF_KEYS} buckets with pending "
+        f"messages ({memory / NUMBER_OF_KEYS:.0f} B/bucket, messages excluded)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import time
+import tracemalloc
+
+from mqttprocessor.definitions import ProcessorFunctionType
+from mqttprocessor.functions import ProcessorFunction
+from mqttprocessor.messages import Message, RoutedMessage, TopicName
+from mqttprocessor.routing import Processor
+
+NUMBER_OF_ROUTED_MESSAGES = 10_000
+NUMBER_OF_MESSAGES = 100_000
+ROUNDS = 20
+
+
+def _create_processor() -> Processor:
+    def fan_out(values, special_params):
+        # Every value to its own topic, nested in groups of 100 values sent to one topic
+        return RoutedMessage({
+            f"{{w1}}/values/{group}": RoutedMessage(values[group * 100:(group + 1) * 100])
+            for group in range(len(values) // 100)
+        })
+
+    return Processor(
+        name="fan-out",
+        functions=[ProcessorFunction(ProcessorFunctionType.CONVERTER, fan_out, False, False)],
+        sources=[TopicName("{w1}/batch")],
+        sink=TopicName("{w1}/values"),
+    )
+
+
+def main():
+    processor = _create_processor()
+    values = list(range(NUMBER_OF_ROUTED_MESSAGES))
+
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        output_messages = processor.process_message("device1/batch", values)
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"{ROUNDS} batches of {len(output_messages)} routed messages in {elapsed:.3f} s "
+        f"({ROUNDS * len(output_messages) / elapsed:.0f} msg/s)"
+    )
+
+    tracemalloc.start()
+    processor.process_message("device1/batch", values)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"Peak memory of a batch {peak / 2 ** 20:.2f} MiB ({peak / NUMBER_OF_ROUTED_MESSAGES:.0f} B/msg)")
+
+    topic = TopicName("device1/values")
+    tracemalloc.start()
+    messages = [Message(topic, index) for index in range(NUMBER_OF_MESSAGES)]
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{len(messages)} messages take {memory / 2 ** 20:.1f} MiB ({memory / len(messages):.0f} B/msg)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import tempfile
+import time
+from pathlib import Path
+
+from mqttprocessor.app import _create_processors
+from mqttprocessor.functions import converter, rule
+
+NUMBER_OF_PROCESSORS = 5000
+
+
+@rule
+def benchmark_rule(message, bound):
+    return message["value"] > bound
+
+
+@converter
+def benchmark_converter(message, source_topic, matches):
+    return message
+
+
+def _write_config(path: Path):
+    with open(path, "w") as f:
+        f.write("processors:\n")
+        for i in range(NUMBER_OF_PROCESSORS):
+            f.write(
+                f"  - source: building{i % 50}/{{w1}}/device{i}/{{W1}}\n"
+                f"    sink: processed/{{w1}}/device{i}/{{W1}}\n"
+                f"    function:\n"
+                f"      - name: benchmark_rule\n"
+                f"        arguments:\n"
+                f"          bound: {i}\n"
+                f"      - benchmark_converter\n"
+            )
+
+
+def _measure(name: str, config_path: Path, cache_dir: str | None):
+    start = time.perf_counter()
+    processors = _create_processors(str(config_path), cache_dir)
+    elapsed = time.perf_counter() - start
+
+    print(f"{name:<20} {len(processors)} processors in {elapsed:.3f} s")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        config_path = Path(tmp) / "config.yaml"
+        cache_dir = str(Path(tmp) / "cache")
+        _write_config(config_path)
+
+        _measure("no cache", config_path, None)
+        _measure("cold artifact cache", config_path, cache_dir)
+        _measure("warm artifact cache", config_path, cache_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import time
+import tracemalloc
+from typing import List
+
+from mqttprocessor.state import StateStore
+
+NUMBER_OF_KEYS = 1_000_000
+
+
+def _fill(topics: List[str]) -> StateStore:
+    store = StateStore(max_keys=NUMBER_OF_KEYS, ttl=3600)
+    for i, topic in enumerate(topics):
+        store.set(topic, float(i))
+
+    return store
+
+
+def main():
+    topics = [f"building{i % 100}/device{i}/temperature" for i in range(NUMBER_OF_KEYS)]
+
+    start = time.perf_counter()
+    store = _fill(topics)
+    elapsed = time.perf_counter() - start
+    print(f"{NUMBER_OF_KEYS} keys inserted in {elapsed:.3f} s ({NUMBER_OF_KEYS / elapsed:.0f} ops/s)")
+
+    start = time.perf_counter()
+    for topic in topics:
+        store.get(topic)
+    elapsed = time.perf_counter() - start
+    print(f"{NUMBER_OF_KEYS} lookups in {elapsed:.3f} s ({NUMBER_OF_KEYS / elapsed:.0f} ops/s)")
+
+    del store
+
+    # Measured separately, because tracing slows the allocations down
+    tracemalloc.start()
+    store = _fill(topics)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(
+        f"Store memory {memory / 2 ** 20:.1f} MiB for {len(store)} keys "
+        f"({memory / NUMBER_OF_KEYS:.0f} B/key, topic strings excluded)"
+    )
+
+
+if __name__ == "__main__":
+    main()
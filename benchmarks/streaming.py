@@ -0,0 +1,73 @@
+import time
+import tracemalloc
+
+from mqttprocessor.definitions import ProcessorFunctionType
+from mqttprocessor.dispatch import Dispatcher
+from mqttprocessor.functions import ProcessorFunction
+from mqttprocessor.messages import RoutedMessage, TopicName
+from mqttprocessor.publishing import Publisher
+from mqttprocessor.routing import Processor
+
+BATCH_BYTES = 50 * 2 ** 20
+LINE = b"device-0001,2024-01-01T00:00:00,temperature,21.5\n"
+
+
+class _NullClient:
+    def publish(self, topic, payload, qos=0, retain=False, properties=None):
+        return None
+
+
+def _split_routed(batch, special_params):
+    return RoutedMessage([line for line in batch.split(b"\n") if line])
+
+
+def _split_streamed(batch, special_params):
+    start = 0
+    while start < len(batch):
+        end = batch.find(b"\n", start)
+        if end < 0:
+            end = len(batch)
+
+        if end > start:
+            yield batch[start:end]
+
+        start = end + 1
+
+
+def _measure(name: str, converter, batch: bytes):
+    dispatcher = Dispatcher([
+        Processor(
+            name=name,
+            functions=[ProcessorFunction(ProcessorFunctionType.CONVERTER, converter, False, False)],
+            sources=[TopicName("batches/{w1}")],
+            sink=TopicName("values/{w1}"),
+        )
+    ])
+    publisher = Publisher(_NullClient())
+
+    start = time.perf_counter()
+    publisher.publish(dispatcher.process_message("batches/a", batch), qos=0, retain=False)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    publisher.publish(dispatcher.process_message("batches/a", batch), qos=0, retain=False)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    messages = batch.count(b"\n")
+    print(
+        f"{name}: {messages} messages in {elapsed:.2f} s ({messages / elapsed:.0f} msg/s), "
+        f"peak memory {peak / 2 ** 10:.0f} KiB"
+    )
+
+
+def main():
+    batch = LINE * (BATCH_BYTES // len(LINE))
+    print(f"Splitting a batch of {len(batch) / 2 ** 20:.0f} MiB")
+
+    _measure("routed list", _split_routed, batch)
+    _measure("generator", _split_streamed, batch)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import re
+import time
+
+from mqttprocessor.messages import TopicName, TopicRuleIndex
+
+ROUNDS = 10_000
+PATHOLOGICAL_LENGTHS = [16, 1_000, 100_000]
+NUMBER_OF_RULES = 1_000
+
+# The pattern the multi-level placeholders used to be matched with, for comparison
+NESTED_QUANTIFIER_REGEX = re.compile(r"^a\/(?P<W1>(.+)+?)\/end$")
+
+
+def _time_match(rule: TopicName, topic: TopicName, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        rule.matches(topic)
+
+    return (time.perf_counter() - start) / rounds
+
+
+def main():
+    topic = TopicName("building1/room2/device3/temperature")
+    for rule in ["building1/{w1}/{w2}/temperature", "{W1}/temperature", "building1/room{w1}/{W1}"]:
+        elapsed = _time_match(TopicName(rule), topic, ROUNDS)
+        print(f"{rule}: {elapsed * 1e6:.2f} us/match")
+
+    start = time.perf_counter()
+    NESTED_QUANTIFIER_REGEX.search("a/" + "x" * 16 + "/nomatch")
+    print(f"Nested quantifier regex, 16 characters not matching: {(time.perf_counter() - start) * 1e3:.0f} ms")
+
+    # Long topics that almost match
+    for rule in ["a/{W1}/end", "a/x{W1}/end"]:
+        for length in PATHOLOGICAL_LENGTHS:
+            pathological = TopicName("a/" + "x/" * (length // 2) + "nomatch")
+            elapsed = _time_match(TopicName(rule), pathological, 10)
+            print(f"{rule}, {length} characters not matching: {elapsed * 1e6:.0f} us/match")
+
+    # Rules of many processors, matched one by one or all at once by the index
+    rules = [
+        f"site{n % 10}/{{w1}}/sensor{n}/{'{W1}' if n % 2 else 'value'}" for n in range(NUMBER_OF_RULES)
+    ]
+    rule_names = [TopicName(rule) for rule in rules]
+    index = TopicRuleIndex(rules)
+    topics = [TopicName(f"site{n % 10}/device/sensor{n}/value") for n in range(0, NUMBER_OF_RULES, 10)]
+
+    start = time.perf_counter()
+    for topic in topics:
+        for rule in rule_names:
+            rule.matches(topic)
+    separately = (time.perf_counter() - start) / len(topics)
+
+    start = time.perf_counter()
+    for topic in topics:
+        index.match(topic.rule)
+    indexed = (time.perf_counter() - start) / len(topics)
+
+    print(
+        f"{NUMBER_OF_RULES} rules, one by one: {separately * 1e6:.0f} us/topic, "
+        f"indexed: {indexed * 1e6:.1f} us/topic"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,26 @@
 import logging
 import os
 import random
+import time
 
 from dataclasses import dataclass
-from queue import SimpleQueue
-from typing import List
+from queue import SimpleQueue, Empty
+from typing import Iterable, List, Optional, Tuple, TYPE_CHECKING
 
-from paho.mqtt.client import Client, MQTTMessage
-
-from .loader import load_config
-from .messages import Message
+from .dispatch import Dispatcher
+from .messages import Message, MessageProperties
+from .publishing import ECHO_PROPERTY, Publisher
 from .routing import ProcessorCreator, Processor
 
+if TYPE_CHECKING:
+    from paho.mqtt.client import Client, MQTTMessage
+
+    from .models import ConfigModel
+    from .recorder import CaptureRecorder
+    from .state import StateBackend
+
 _logger: logging.Logger = logging.getLogger(__name__)
-_ingress_queue: SimpleQueue[MQTTMessage] = SimpleQueue[MQTTMessage]()
+_ingress_queue: SimpleQueue["MQTTMessage"] = SimpleQueue()
 
 
 @dataclass(frozen=True)
@@ -25,9 +32,31 @@ class EnvParameters:
         port: str
         username: str
         password: str
+        protocol: str
+        topic_alias_maximum: int
+        message_expiry: int | None
+        max_buffered: int
+
+        @property
+        def v5(self) -> bool:
+            return self.protocol == "5"
+
+    @dataclass(frozen=True)
+    class Capture:
+        file_path: str | None
+        compression: str
+        max_bytes: int | None
+
+    @dataclass(frozen=True)
+    class State:
+        file_path: str | None
+        snapshot_interval: float
 
     mqtt: Mqtt
+    capture: Capture
+    state: State
     config_file_path: str
+    config_cache_dir: str | None
     log_level: str
 
 
@@ -41,25 +70,97 @@ def _load_env() -> EnvParameters:
             port=os.getenv("MQTT_PORT", 1883),
             username=os.getenv("MQTT_USERNAME"),
             password=os.getenv("MQTT_PASSWORD"),
+            protocol=os.getenv("MQTT_PROTOCOL", "3.1.1"),
+            topic_alias_maximum=_getenv_int("MQTT_TOPIC_ALIAS_MAXIMUM") or 0,
+            message_expiry=_getenv_int("MQTT_MESSAGE_EXPIRY"),
+            max_buffered=_getenv_int("MQTT_MAX_BUFFERED_MESSAGES") or 1000,
+        ),
+        capture=EnvParameters.Capture(
+            file_path=os.getenv("CAPTURE_FILE") or None,
+            compression=os.getenv("CAPTURE_COMPRESSION", "none").lower(),
+            max_bytes=_getenv_int("CAPTURE_MAX_BYTES"),
+        ),
+        state=EnvParameters.State(
+            file_path=os.getenv("STATE_FILE") or None,
+            snapshot_interval=float(os.getenv("STATE_SNAPSHOT_INTERVAL", 10)),
         ),
         config_file_path=os.getenv("CONFIG_FILE", "config.yaml"),
+        config_cache_dir=os.getenv("CONFIG_CACHE_DIR") or None,
         log_level=os.getenv("LOG_LEVEL", "WARNING").upper()
     )
 
 
-def _create_processors(config_file_path: str) -> List[Processor]:
-    with open(config_file_path, "r") as f:
-        config = load_config(f)
+def _getenv_int(name: str) -> int | None:
+    value = os.getenv(name)
+    return None if not value else int(value)
+
+
+def _load_config(config_file_path: str, config_cache_dir: str | None = None) -> "ConfigModel":
+    # yaml and pydantic are imported only when a config is actually loaded
+    from .loader import load_config, load_config_cached
+
+    if config_cache_dir is None:
+        with open(config_file_path, "r") as f:
+            return load_config(f)
 
-    return [ProcessorCreator(proc).create() for proc in config.processors]
+    return load_config_cached(config_file_path, config_cache_dir)
+
+
+def _create_processors(
+    config_file_path: str, config_cache_dir: str | None = None,
+    state_backend: Optional["StateBackend"] = None,
+) -> List[Processor]:
+    config = _load_config(config_file_path, config_cache_dir)
+
+    return [
+        ProcessorCreator(proc, state_backend).create() for proc in config.processors
+    ]
+
+
+def _create_state_backend(state_config: EnvParameters.State) -> Optional["StateBackend"]:
+    if state_config.file_path is None:
+        return None
+
+    from .state import SqliteStateBackend
+
+    return SqliteStateBackend(
+        state_config.file_path, snapshot_interval=state_config.snapshot_interval
+    )
+
+
+def _create_capture_recorder(
+    capture_config: EnvParameters.Capture
+) -> Optional["CaptureRecorder"]:
+    if capture_config.file_path is None:
+        return None
+
+    # The capture is imported only when the traffic is recorded
+    from .capture import CaptureCompression
+    from .recorder import CaptureRecorder
+
+    recorder = CaptureRecorder(
+        capture_config.file_path,
+        compression=CaptureCompression(capture_config.compression),
+        max_bytes=capture_config.max_bytes,
+    )
+    recorder.start()
+
+    return recorder
 
 
 def _create_mqtt_client(
-    processors: List[Processor], mqtt_config: EnvParameters.Mqtt
-) -> Client:
-    def on_connect(client, userdata, flags, rc):
+    processors: List[Processor], mqtt_config: EnvParameters.Mqtt,
+    recorder: Optional["CaptureRecorder"] = None,
+) -> Tuple["Client", Publisher]:
+    from paho.mqtt.client import Client, MQTTv311, MQTTv5
+
+    if mqtt_config.protocol not in ("3.1.1", "5"):
+        raise ValueError(f"Unsupported MQTT protocol `{mqtt_config.protocol}`")
+
+    def on_connect(client, userdata, flags, rc, properties=None):
         if rc == 0:
             _logger.info("MQTT client connected!")
+            publisher.connected(getattr(properties, "TopicAliasMaximum", 0))
             for processor in processors:
                 for topic in processor.source_topics:
                     _logger.info("Subscribing to %s", topic.convert_rule_to_mqtt_format())
@@ -67,14 +168,31 @@ def _create_mqtt_client(
         else:
             _logger.error("MQTT client connection failed with code %s", rc)
 
-    def on_disconnect(client, userdata, reason_code):
+    def on_disconnect(client, userdata, reason_code, properties=None):
         _logger.error("MQTT client disconnected: %s", reason_code)
 
-    def on_message(client, userdata, message: MQTTMessage):
+    def on_message(client, userdata, message: "MQTTMessage"):
+        if publisher.is_echo(message):
+            _logger.debug("Ignoring message at %s already routed internally", message.topic)
+            return
+
         _logger.debug("Inserting message to the queue")
         _ingress_queue.put(message)
 
-    client = Client(mqtt_config.client_id)
+        if recorder is not None:
+            recorder.record(message.topic, message.payload, message.qos, message.retain)
+
+    client = Client(
+        mqtt_config.client_id, protocol=MQTTv5 if mqtt_config.v5 else MQTTv311
+    )
+    publisher = Publisher(
+        client,
+        v5=mqtt_config.v5,
+        message_expiry=mqtt_config.message_expiry,
+        topic_alias_maximum=mqtt_config.topic_alias_maximum,
+        max_buffered=mqtt_config.max_buffered,
+        echo_tag=mqtt_config.client_id,
+    )
     if mqtt_config.username is not None and mqtt_config.password is not None:
         client.username_pw_set(mqtt_config.username, mqtt_config.password)
 
@@ -85,36 +203,94 @@ def _create_mqtt_client(
 
     client.loop_start()
 
-    return client
+    return client, publisher
 
 
-def _process_messages(processors: List[Processor], mqtt_client: Client):
-    output_messages: List[Message] = list()
+def _process_messages(
+    processors: List[Processor], publisher: Publisher,
+    state_backend: Optional["StateBackend"] = None,
+):
+    dispatcher = Dispatcher(processors, tag_echoes=publisher.tags_echoes)
 
     while True:
-        received_message = _ingress_queue.get()
+        received_message = _receive_message(_get_next_deadline(dispatcher, state_backend))
+        now = time.time()
+
+        if state_backend is not None and now >= state_backend.next_snapshot:
+            state_backend.snapshot()
+
+        publisher.publish(dispatcher.tick(now), qos=0, retain=False)
+        if received_message is None:
+            continue
+
         _logger.debug("Received message at %s", received_message.topic)
 
-        for processor in processors:
-            output_messages += processor.process_message(
-                received_message.topic, received_message.payload
-            )
+        properties = _read_message_properties(received_message)
+        output_messages: Iterable[Message] = dispatcher.process_message(
+            received_message.topic, received_message.payload, now, properties,
+            received_message.qos, received_message.retain,
+        )
+        # User properties are passed through to the messages produced from the message
+        publisher.publish(
+            output_messages, qos=received_message.qos, retain=received_message.retain,
+            user_properties=None if properties is None else properties.user_properties,
+        )
+
 
-        while len(output_messages) > 0:
-            msg = output_messages.pop()
-            _logger.debug("Sending message to %s", msg.sink_topic.rule)
+def _get_next_deadline(
+    dispatcher: Dispatcher, state_backend: Optional["StateBackend"]
+) -> Optional[float]:
+    deadline = dispatcher.next_deadline()
+    if state_backend is None:
+        return deadline
 
-            mqtt_client.publish(
-                msg.sink_topic.rule,
-                msg.message_body,
-                qos=received_message.qos,
-                retain=received_message.retain,
-            )
+    if deadline is None:
+        return state_backend.next_snapshot
+
+    return min(deadline, state_backend.next_snapshot)
+
+
+def _receive_message(deadline: Optional[float]) -> Optional["MQTTMessage"]:
+    try:
+        if deadline is None:
+            return _ingress_queue.get()
+
+        return _ingress_queue.get(timeout=max(0.0, deadline - time.time()))
+    except Empty:
+        return None
+
+
+def _read_message_properties(message: "MQTTMessage") -> Optional[MessageProperties]:
+    # Messages received over MQTT 3.1.1 have no properties
+    properties = getattr(message, "properties", None)
+    if properties is None:
+        return None
+
+    # Echo tags of other instances aren't passed through, they would drop the messages
+    return MessageProperties(
+        content_type=getattr(properties, "ContentType", None),
+        user_properties=tuple(
+            tuple(user_property) for user_property in getattr(properties, "UserProperty", ())
+            if user_property[0] != ECHO_PROPERTY
+        ),
+    )
 
 
 def run():
     env = _load_env()
     logging.basicConfig(level=logging.getLevelName(env.log_level))
-    processors = _create_processors(env.config_file_path)
-    mqtt = _create_mqtt_client(processors, env.mqtt)
-    _process_messages(processors, mqtt)
+    state_backend = _create_state_backend(env.state)
+    processors = _create_processors(
+        env.config_file_path, env.config_cache_dir, state_backend
+    )
+    recorder = _create_capture_recorder(env.capture)
+    _, publisher = _create_mqtt_client(processors, env.mqtt, recorder)
+
+    try:
+        _process_messages(processors, publisher, state_backend)
+    finally:
+        if recorder is not None:
+            recorder.stop()
+
+        if state_backend is not None:
+            state_backend.close()
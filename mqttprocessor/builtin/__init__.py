@@ -1 +1,2 @@
 from .converters import *
+from .rules import *
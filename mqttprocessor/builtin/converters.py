@@ -1,6 +1,11 @@
 import json
+from functools import lru_cache
+from typing import List, Optional
 
+from mqttprocessor import compression, serialization
+from mqttprocessor.extraction import JsonFieldExtractor
 from mqttprocessor.functions import converter
+from mqttprocessor.messages import encode_message_body
 
 
 @converter
@@ -14,10 +19,80 @@ def binary_to_json(binary: bytes):
 
 
 @converter
-def json_to_binary(json_data: bytes):
-    return json.dumps(json_data)
+def extract_json_fields(binary: bytes, fields: List[str]):
+    return _create_field_extractor(tuple(fields)).extract(binary)
+
+
+@lru_cache(maxsize=256)
+def _create_field_extractor(fields: tuple) -> JsonFieldExtractor:
+    return JsonFieldExtractor(list(fields))
+
+
+@converter
+def json_to_binary(json_data):
+    return serialization.encode_json(json_data)
+
+
+@converter
+def string_to_binary(string: str, encoding="utf8"):
+    return string.encode(encoding=encoding)
+
+
+@converter
+def msgpack_to_json(binary: bytes):
+    return serialization.decode_msgpack(binary)
+
+
+@converter
+def json_to_msgpack(json_data):
+    return serialization.encode_msgpack(json_data)
+
+
+@converter
+def cbor_to_json(binary: bytes):
+    return serialization.decode_cbor(binary)
+
+
+@converter
+def json_to_cbor(json_data):
+    return serialization.encode_cbor(json_data)
+
+
+@converter
+def protobuf_to_json(binary: bytes, message_type: str):
+    return serialization.decode_protobuf(binary, message_type)
+
+
+@converter
+def json_to_protobuf(json_data, message_type: str):
+    return serialization.encode_protobuf(json_data, message_type)
+
+
+@converter
+def gzip_to_binary(binary: bytes):
+    return compression.gzip_decompress(binary)
+
+
+@converter
+def binary_to_gzip(binary, level: Optional[int]):
+    return compression.gzip_compress(encode_message_body(binary), level)
+
+
+@converter
+def zstd_to_binary(binary: bytes, dictionary: Optional[str]):
+    return compression.zstd_decompress(binary, dictionary)
+
+
+@converter
+def binary_to_zstd(binary, level: Optional[int], dictionary: Optional[str]):
+    return compression.zstd_compress(encode_message_body(binary), level, dictionary)
+
+
+@converter
+def lz4_to_binary(binary: bytes):
+    return compression.lz4_decompress(binary)
 
 
 @converter
-def string_to_binary(string: bytes, encoding="utf8"):
-    return string.decode(encoding=encoding)
+def binary_to_lz4(binary, level: Optional[int]):
+    return compression.lz4_compress(encode_message_body(binary), level)
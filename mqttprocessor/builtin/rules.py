@@ -0,0 +1,47 @@
+from mqttprocessor.functions import rule
+from mqttprocessor.state import StateStore
+
+_MISSING = object()
+
+
+@rule
+def deadband_absolute(value: float, threshold: float, source_topic: str, state: StateStore):
+    last_value = state.get(source_topic)
+    if last_value is not None and abs(value - last_value) < threshold:
+        return False
+
+    state.set(source_topic, value)
+    return True
+
+
+@rule
+def deadband_percent(value: float, percent: float, source_topic: str, state: StateStore):
+    last_value = state.get(source_topic)
+    if last_value is not None:
+        # With last value of zero, the band is empty, so only real changes pass
+        difference = abs(value - last_value)
+        if difference == 0 or difference < abs(last_value) * percent / 100:
+            return False
+
+    state.set(source_topic, value)
+    return True
+
+
+@rule
+def value_changed(value, source_topic: str, state: StateStore):
+    if state.get(source_topic, _MISSING) == value:
+        return False
+
+    state.set(source_topic, value)
+    return True
+
+
+@rule
+def min_interval(value, interval: float, source_topic: str, state: StateStore, timestamp: float):
+    # Timed by the message, so the offline replay passes the same messages
+    last_sent = state.get(source_topic)
+    if last_sent is not None and timestamp - last_sent < interval:
+        return False
+
+    state.set(source_topic, timestamp)
+    return True
@@ -0,0 +1,358 @@
+import base64
+import bisect
+import gzip
+import io
+import itertools
+import json
+import logging
+import mmap
+import os
+import struct
+import zlib
+from array import array
+from dataclasses import dataclass
+from enum import Enum
+from typing import BinaryIO, Iterator, Optional, Iterable, List, Tuple
+
+CAPTURE_MAGIC = b"MQTTCAP1"
+CAPTURE_INDEX_MAGIC = b"MQTTIDX1"
+
+_GZIP_MAGIC = b"\x1f\x8b"
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# timestamp, qos, retain, topic length, payload length
+_RECORD_HEADER = struct.Struct("<dBBHI")
+# size of the indexed capture, number of records
+_INDEX_HEADER = struct.Struct("<QQ")
+
+_logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CapturedMessage:
+    topic: str
+    payload: bytes
+    qos: int = 0
+    retain: bool = False
+    timestamp: Optional[float] = None
+
+
+@dataclass(frozen=True)
+class CapturedMessageView:
+    topic: str
+    payload: memoryview
+    qos: int
+    retain: bool
+    timestamp: float
+
+    def to_message(self) -> CapturedMessage:
+        return CapturedMessage(
+            topic=self.topic, payload=bytes(self.payload),
+            qos=self.qos, retain=self.retain, timestamp=self.timestamp
+        )
+
+
+class CaptureFormat(Enum):
+    BINARY = "binary"
+    JSON_LINES = "jsonl"
+
+    @classmethod
+    def from_path(cls, path: str) -> "CaptureFormat":
+        if path.endswith(".jsonl") or path.endswith(".json"):
+            return cls.JSON_LINES
+
+        return cls.BINARY
+
+
+class CaptureCompression(Enum):
+    NONE = "none"
+    GZIP = "gzip"
+    ZSTD = "zstd"
+
+
+class CaptureWriter:
+    _stream: BinaryIO
+    _capture_format: CaptureFormat
+
+    def __init__(self, stream: BinaryIO, capture_format: CaptureFormat):
+        self._stream = stream
+        self._capture_format = capture_format
+
+        if capture_format == CaptureFormat.BINARY:
+            self._stream.write(CAPTURE_MAGIC)
+
+    def write(self, message: CapturedMessage) -> int:
+        if self._capture_format == CaptureFormat.BINARY:
+            return self._stream.write(encode_binary_record(message))
+        else:
+            return self._stream.write(encode_json_record(message))
+
+    def flush(self):
+        self._stream.flush()
+
+
+def encode_binary_record(message: CapturedMessage) -> bytes:
+    topic = message.topic.encode("utf8")
+    timestamp = 0.0 if message.timestamp is None else message.timestamp
+
+    return b"".join((
+        _RECORD_HEADER.pack(
+            timestamp, message.qos, message.retain, len(topic), len(message.payload)
+        ),
+        topic,
+        message.payload,
+    ))
+
+
+def encode_json_record(message: CapturedMessage) -> bytes:
+    record = {
+        "topic": message.topic,
+        "qos": message.qos,
+        "retain": message.retain,
+        "timestamp": message.timestamp,
+    }
+
+    try:
+        record["payload"] = message.payload.decode("utf8")
+    except UnicodeDecodeError:
+        record["payload_base64"] = base64.b64encode(message.payload).decode("ascii")
+
+    return json.dumps(record).encode("utf8") + b"\n"
+
+
+def open_capture(path: str) -> BinaryIO:
+    with open(path, "rb") as f:
+        magic = f.read(len(_ZSTD_MAGIC))
+
+    if magic.startswith(_GZIP_MAGIC):
+        return gzip.open(path, "rb")
+    elif magic == _ZSTD_MAGIC:
+        zstandard = _import_zstandard()
+        return io.BufferedReader(
+            zstandard.ZstdDecompressor().stream_reader(open(path, "rb"))
+        )
+
+    return open(path, "rb")
+
+
+def open_capture_for_writing(
+    path: str, compression: CaptureCompression, compression_level: int | None = None
+) -> BinaryIO:
+    if compression == CaptureCompression.GZIP:
+        return gzip.open(
+            path, "wb", compresslevel=6 if compression_level is None else compression_level
+        )
+    elif compression == CaptureCompression.ZSTD:
+        zstandard = _import_zstandard()
+        compressor = zstandard.ZstdCompressor(
+            level=3 if compression_level is None else compression_level
+        )
+        return compressor.stream_writer(open(path, "wb"))
+
+    return open(path, "wb")
+
+
+def _import_zstandard():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError(
+            "zstd compressed captures require the `zstandard` package"
+        ) from e
+
+    return zstandard
+
+
+def read_capture(stream: BinaryIO) -> Iterator[CapturedMessage]:
+    magic = stream.read(len(CAPTURE_MAGIC))
+    if magic == CAPTURE_MAGIC:
+        return _read_binary_records(stream)
+
+    # Compressed streams can't seek back, so the consumed bytes are put back in front
+    return _read_json_records(itertools.chain([magic + stream.readline()], stream))
+
+
+def _read_binary_records(stream: BinaryIO) -> Iterator[CapturedMessage]:
+    while True:
+        header = stream.read(_RECORD_HEADER.size)
+        if len(header) == 0:
+            return
+
+        if len(header) < _RECORD_HEADER.size:
+            raise ValueError("Truncated capture record")
+
+        timestamp, qos, retain, topic_length, payload_length = _RECORD_HEADER.unpack(header)
+        topic = stream.read(topic_length)
+        payload = stream.read(payload_length)
+        if len(topic) != topic_length or len(payload) != payload_length:
+            raise ValueError("Truncated capture record")
+
+        yield CapturedMessage(
+            topic=topic.decode("utf8"), payload=payload,
+            qos=qos, retain=bool(retain), timestamp=timestamp
+        )
+
+
+def _read_json_records(lines: Iterable[bytes]) -> Iterator[CapturedMessage]:
+    for line in lines:
+        if len(line.strip()) == 0:
+            continue
+
+        record = json.loads(line)
+        if "payload_base64" in record:
+            payload = base64.b64decode(record["payload_base64"])
+        else:
+            payload = record.get("payload", "").encode("utf8")
+
+        yield CapturedMessage(
+            topic=record["topic"], payload=payload,
+            qos=record.get("qos", 0), retain=record.get("retain", False),
+            timestamp=record.get("timestamp")
+        )
+
+
+class MappedCapture:
+    _path: str
+    _file: BinaryIO
+    _map: mmap.mmap
+    _offsets: array
+    _timestamps: array
+
+    def __init__(self, path: str):
+        self._path = path
+        self._file = open(path, "rb")
+
+        if self._file.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            self._file.close()
+            raise ValueError("Only uncompressed binary captures can be memory-mapped")
+
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._offsets, self._timestamps = self._load_index()
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __enter__(self) -> "MappedCapture":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        # Fails with BufferError while any payload view is still referenced
+        self._map.close()
+        self._file.close()
+
+    def messages(self, start: int = 0, stop: int | None = None) -> Iterator[CapturedMessageView]:
+        if stop is None:
+            stop = len(self._offsets)
+
+        return self._read_records(self._offsets[start:stop])
+
+    def select(self, records: Iterable[int]) -> Iterator[CapturedMessageView]:
+        return self._read_records(self._offsets[record] for record in records)
+
+    def find_timestamp(self, timestamp: float) -> int:
+        # Records are appended as the messages arrive, so the timestamps are sorted
+        return bisect.bisect_left(self._timestamps, timestamp)
+
+    def partition(self, partitions: int) -> List[array]:
+        # Numbers of the records of every partition. Records are partitioned by their topic,
+        # so all the records of a topic are in the same partition.
+        records = [array("Q") for _ in range(partitions)]
+        topic_partitions = dict()
+        for record, offset in enumerate(self._offsets):
+            topic_length = _RECORD_HEADER.unpack_from(self._map, offset)[3]
+            topic_start = offset + _RECORD_HEADER.size
+            topic = self._map[topic_start:topic_start + topic_length]
+
+            partition = topic_partitions.get(topic)
+            if partition is None:
+                partition = topic_partitions[topic] = zlib.crc32(topic) % partitions
+
+            records[partition].append(record)
+
+        return records
+
+    def _read_records(self, offsets: Iterable[int]) -> Iterator[CapturedMessageView]:
+        view = memoryview(self._map)
+        try:
+            for offset in offsets:
+                timestamp, qos, retain, topic_length, payload_length = _RECORD_HEADER.unpack_from(
+                    self._map, offset
+                )
+                topic_start = offset + _RECORD_HEADER.size
+                payload_start = topic_start + topic_length
+
+                yield CapturedMessageView(
+                    topic=self._map[topic_start:payload_start].decode("utf8"),
+                    payload=view[payload_start:payload_start + payload_length],
+                    qos=qos, retain=bool(retain), timestamp=timestamp
+                )
+        finally:
+            view.release()
+
+    def _load_index(self) -> Tuple[array, array]:
+        index_path = self._path + ".idx"
+
+        if os.path.exists(index_path):
+            with open(index_path, "rb") as f:
+                index = f.read()
+
+            if self._is_index_valid(index):
+                _, count = _INDEX_HEADER.unpack_from(index, len(CAPTURE_INDEX_MAGIC))
+                offsets_start = len(CAPTURE_INDEX_MAGIC) + _INDEX_HEADER.size
+                timestamps_start = offsets_start + count * 8
+
+                offsets = array("Q", index[offsets_start:timestamps_start])
+                timestamps = array("d", index[timestamps_start:timestamps_start + count * 8])
+
+                return offsets, timestamps
+
+        offsets, timestamps = self._build_index()
+        self._store_index(index_path, offsets, timestamps)
+
+        return offsets, timestamps
+
+    def _is_index_valid(self, index: bytes) -> bool:
+        if not index.startswith(CAPTURE_INDEX_MAGIC):
+            return False
+
+        if len(index) < len(CAPTURE_INDEX_MAGIC) + _INDEX_HEADER.size:
+            return False
+
+        # An index of a capture that was appended to since is stale
+        size, count = _INDEX_HEADER.unpack_from(index, len(CAPTURE_INDEX_MAGIC))
+        expected_length = len(CAPTURE_INDEX_MAGIC) + _INDEX_HEADER.size + count * 16
+
+        return size == len(self._map) and len(index) == expected_length
+
+    def _build_index(self) -> Tuple[array, array]:
+        offsets = array("Q")
+        timestamps = array("d")
+
+        offset = len(CAPTURE_MAGIC)
+        size = len(self._map)
+        while offset + _RECORD_HEADER.size <= size:
+            timestamp, _, _, topic_length, payload_length = _RECORD_HEADER.unpack_from(
+                self._map, offset
+            )
+            record_end = offset + _RECORD_HEADER.size + topic_length + payload_length
+            if record_end > size:
+                break
+
+            offsets.append(offset)
+            timestamps.append(timestamp)
+            offset = record_end
+
+        return offsets, timestamps
+
+    def _store_index(self, index_path: str, offsets: array, timestamps: array):
+        try:
+            with open(index_path, "wb") as f:
+                f.write(CAPTURE_INDEX_MAGIC)
+                f.write(_INDEX_HEADER.pack(len(self._map), len(offsets)))
+                f.write(offsets.tobytes())
+                f.write(timestamps.tobytes())
+        except OSError:
+            _logger.warning("Can't store capture index to %s", index_path)
@@ -0,0 +1,98 @@
+import gzip
+import zlib
+from functools import lru_cache
+from typing import Any, Callable, Optional
+
+from mqttprocessor.serialization import import_codec
+
+GZIP_DEFAULT_LEVEL = 6
+ZSTD_DEFAULT_LEVEL = 3
+LZ4_DEFAULT_LEVEL = 0
+# Payloads of other producers are decompressed only up to the limit, so a small payload
+# can't expand without a bound
+MAX_DECOMPRESSED_SIZE = 64 * 1024 * 1024
+
+
+def gzip_compress(data: bytes, level: Optional[int] = None) -> bytes:
+    # Without the modification time, equal payloads are compressed to equal bytes
+    return gzip.compress(
+        data, compresslevel=GZIP_DEFAULT_LEVEL if level is None else level, mtime=0
+    )
+
+
+def gzip_decompress(data: bytes) -> bytes:
+    return _decompress_frames(data, lambda: zlib.decompressobj(16 + zlib.MAX_WBITS))
+
+
+def zstd_compress(data: bytes, level: Optional[int] = None, dictionary: Optional[str] = None) -> bytes:
+    return _create_zstd_compressor(level, dictionary).compress(data)
+
+
+def zstd_decompress(data: bytes, dictionary: Optional[str] = None) -> bytes:
+    with _create_zstd_decompressor(dictionary).stream_reader(
+        data, read_across_frames=True
+    ) as reader:
+        result = reader.read(MAX_DECOMPRESSED_SIZE + 1)
+
+    _check_decompressed_size(len(result))
+    return result
+
+
+def lz4_compress(data: bytes, level: Optional[int] = None) -> bytes:
+    return import_codec("lz4.frame", "lz4").compress(
+        data, compression_level=LZ4_DEFAULT_LEVEL if level is None else level
+    )
+
+
+def lz4_decompress(data: bytes) -> bytes:
+    return _decompress_frames(data, import_codec("lz4.frame", "lz4").LZ4FrameDecompressor)
+
+
+def _decompress_frames(data: bytes, create_decompressor: Callable[[], Any]) -> bytes:
+    # Payloads of producers compressing in chunks are concatenated frames (members of gzip)
+    frames = list()
+    size = 0
+    while len(data) > 0:
+        decompressor = create_decompressor()
+        frame = decompressor.decompress(data, MAX_DECOMPRESSED_SIZE + 1 - size)
+        size += len(frame)
+        _check_decompressed_size(size)
+
+        if not decompressor.eof:
+            raise EOFError("Compressed payload ended before the end of its frame")
+
+        frames.append(frame)
+        data = decompressor.unused_data or b""
+
+    return b"".join(frames)
+
+
+def _check_decompressed_size(size: int):
+    if size > MAX_DECOMPRESSED_SIZE:
+        raise ValueError(f"Decompressed payload exceeds {MAX_DECOMPRESSED_SIZE} bytes")
+
+
+# Compressors are reused, so the dictionaries are loaded and digested just once
+@lru_cache(maxsize=None)
+def _create_zstd_compressor(level: Optional[int], dictionary: Optional[str]):
+    zstandard = import_codec("zstandard", "zstd")
+    return zstandard.ZstdCompressor(
+        level=ZSTD_DEFAULT_LEVEL if level is None else level,
+        dict_data=_load_zstd_dictionary(dictionary),
+    )
+
+
+@lru_cache(maxsize=None)
+def _create_zstd_decompressor(dictionary: Optional[str]):
+    zstandard = import_codec("zstandard", "zstd")
+    return zstandard.ZstdDecompressor(dict_data=_load_zstd_dictionary(dictionary))
+
+
+@lru_cache(maxsize=None)
+def _load_zstd_dictionary(path: Optional[str]):
+    if path is None:
+        return None
+
+    zstandard = import_codec("zstandard", "zstd")
+    with open(path, "rb") as f:
+        return zstandard.ZstdCompressionDict(f.read())
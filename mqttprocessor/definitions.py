@@ -17,6 +17,8 @@ BodyType = str | bytes | JsonType
 RawRuleType = Callable[..., bool]
 RawConverterType = Callable[..., Any]
 
+TOPIC_NAME_REGEX_PATTERN = r"^(?:\/?(?:(?:(?:{[^{}\/]+})|(?:[^{}\/]+))+\/?)+)\/?$"
+
 RuleType = Callable[[Any, Dict[str, Any]], bool]
 ConverterType = Callable[[Any, Dict[str, Any]], Any]
 
@@ -24,3 +26,29 @@ ConverterType = Callable[[Any, Dict[str, Any]], Any]
 class ProcessorFunctionType(Enum):
     RULE = 1
     CONVERTER = 2
+
+
+class WindowType(Enum):
+    TUMBLING = "tumbling"
+    SLIDING = "sliding"
+    SESSION = "session"
+
+
+class RateLimitMode(Enum):
+    DROP = "drop"
+    LATEST = "latest"
+    QUEUE = "queue"
+
+
+class RoutedMessageShape(Enum):
+    DICT_OF_ROUTES_AND_MESSAGES = 1
+    LIST_OF_MESSAGES_WITHOUT_ROUTES = 2
+    SINGLE_ROUTE_AND_LIST_OF_MESSAGES = 3
+    SINGLE_ROUTE_AND_SINGLE_MESSAGE = 4
+    UNKNOWN = 5
+
+
+class SourceMatchMode(Enum):
+    FIRST_OUTPUT = "first_output"
+    FIRST_MATCH = "first_match"
+    ALL_MATCHES = "all_matches"
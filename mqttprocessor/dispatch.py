@@ -0,0 +1,170 @@
+import itertools
+import logging
+from dataclasses import replace
+from typing import Dict, List, Optional, Iterable
+
+from mqttprocessor.fanout import MessageContext, share_stages
+from mqttprocessor.messages import (
+    Message, MessageBody, MessageProperties, TopicName, TopicRuleIndex, encode_message_body
+)
+from mqttprocessor.routing import Processor
+
+# Guards against cycles created at runtime by routed messages, static routes are checked
+# when the config is loaded
+_MAX_INTERNAL_DEPTH = 16
+
+
+class Dispatcher:
+    _logger: logging.Logger
+    _processors: List[Processor]
+    _timed_processors: List[Processor]
+    _rule_index: TopicRuleIndex
+    _rule_processors: Dict[str, List[int]]
+    _tag_echoes: bool
+
+    @property
+    def processors(self) -> List[Processor]:
+        return self._processors
+
+    def __init__(
+            self, processors: List[Processor], shared_stages: bool = True, tag_echoes: bool = True
+    ):
+        self._logger = logging.getLogger(__name__)
+        self._processors = processors
+        self._tag_echoes = tag_echoes
+        self._timed_processors = [p for p in processors if p.has_timers]
+        self._rule_index = TopicRuleIndex(
+            topic.rule for processor in processors for topic in processor.source_topics
+        )
+        self._rule_processors = dict()
+        for index, processor in enumerate(processors):
+            for topic in processor.source_topics:
+                self._rule_processors.setdefault(topic.rule, list()).append(index)
+
+        if shared_stages:
+            share_stages(processors)
+
+    def process_message(
+        self, source_topic: str, message: MessageBody, timestamp: Optional[float] = None,
+        properties: Optional[MessageProperties] = None, qos: Optional[int] = None,
+        retain: Optional[bool] = None,
+    ) -> Iterable[Message]:
+        self._logger.debug("Dispatching message from %s", source_topic)
+
+        return self._dispatch(source_topic, message, timestamp, properties, qos, retain, 0)
+
+    def tick(self, now: float) -> List[Message]:
+        output_messages: List[Message] = list()
+        for processor in self._timed_processors:
+            processor_messages = processor.tick(now)
+            if processor.internal and len(processor_messages) > 0:
+                output_messages += self._route_internally(
+                    processor, processor_messages, now, None, None, None, 0
+                )
+            else:
+                output_messages += processor_messages
+
+        return output_messages
+
+    def next_deadline(self) -> Optional[float]:
+        deadlines = [
+            deadline for deadline in (p.next_deadline() for p in self._timed_processors)
+            if deadline is not None
+        ]
+
+        return min(deadlines, default=None)
+
+    def _dispatch(
+        self, source_topic: str, message: MessageBody, timestamp: Optional[float],
+        properties: Optional[MessageProperties], qos: Optional[int], retain: Optional[bool],
+        depth: int
+    ) -> Iterable[Message]:
+        # The topic is parsed and matched against all the rules in one pass and the common
+        # function stages are evaluated just once for all the processors
+        context = MessageContext(
+            TopicName(source_topic), properties, self._rule_index, qos, retain
+        )
+
+        output_messages: List[Message] = list()
+        streams: List[Iterable[Message]] = list()
+        for processor in self._find_matched_processors(context):
+            processor_messages = processor.process_message(source_topic, message, timestamp, context)
+            if isinstance(processor_messages, list) and len(processor_messages) == 0:
+                continue
+
+            if processor.internal:
+                output_messages += self._route_internally(
+                    processor, processor_messages, timestamp, properties, qos, retain, depth
+                )
+            elif isinstance(processor_messages, list):
+                output_messages += processor_messages
+            else:
+                # Streamed messages are consumed lazily, after the other messages
+                streams.append(processor_messages)
+
+        if len(streams) > 0:
+            return itertools.chain(output_messages, *streams)
+
+        return output_messages
+
+    def _route_internally(
+        self, processor: Processor, messages: Iterable[Message], timestamp: Optional[float],
+        properties: Optional[MessageProperties], qos: Optional[int], retain: Optional[bool],
+        depth: int
+    ) -> List[Message]:
+        if depth >= _MAX_INTERNAL_DEPTH:
+            self._logger.error("Internal routes are nested too deep, dropping messages")
+            return []
+
+        output_messages: List[Message] = list()
+        for msg in messages:
+            if msg.sink_topic is None:
+                self._logger.error("Message produced without sink topic, ignoring")
+                continue
+
+            # Delivered the same way as received from the broker, so the downstream processors
+            # can't tell the difference
+            try:
+                payload = encode_message_body(msg.message_body)
+            except TypeError:
+                self._logger.error(
+                    "Message for %s has unsupported payload type %s",
+                    msg.sink_topic.rule, type(msg.message_body).__name__
+                )
+                continue
+
+            topic = msg.sink_topic.rule
+            subscribed = processor.publish and self._is_subscribed(topic)
+            if subscribed and not self._tag_echoes:
+                # The echo of the published message can't be told apart without tagging it,
+                # so the subscribed processors receive the message from the broker only
+                output_messages.append(msg)
+                continue
+
+            internal_messages = self._dispatch(
+                topic, payload, timestamp, properties, qos, retain, depth + 1
+            )
+            output_messages += internal_messages
+
+            if subscribed:
+                output_messages.append(replace(msg, echo=True))
+            elif processor.publish:
+                output_messages.append(msg)
+
+        return output_messages
+
+    def _find_matched_processors(self, context: MessageContext) -> List[Processor]:
+        # Only the processors of the rules matched by the index are offered the message, in
+        # the order of the config
+        matched_rules = context.matched_rules
+        if len(matched_rules) == 1:
+            indices = self._rule_processors[matched_rules[0]]
+        else:
+            indices = sorted({
+                index for rule in matched_rules for index in self._rule_processors[rule]
+            })
+
+        return [self._processors[index] for index in indices]
+
+    def _is_subscribed(self, topic: str) -> bool:
+        return len(self._rule_index.match(topic)) > 0
@@ -0,0 +1,164 @@
+import base64
+import heapq
+import itertools
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from mqttprocessor.messages import Message, MessageBody, MessageProperties, TopicName
+from mqttprocessor.serialization import encode_json
+
+
+@dataclass(frozen=True, slots=True)
+class FunctionFailure:
+    function: str
+    error: BaseException
+
+
+@dataclass(slots=True)
+class FailedMessage:
+    processor: Any
+    # Messages encoded after they were produced by windows and rate limiters have no source
+    source_topic: Optional[str]
+    properties: Optional[MessageProperties]
+    matches: Dict[str, str]
+    body: MessageBody
+    failure: FunctionFailure
+    attempts: int
+    timestamp: float
+    # Delivery of the received message, retried messages are published the same way
+    qos: Optional[int] = None
+    retain: Optional[bool] = None
+
+
+class FailureLog:
+    # Formatting a traceback is expensive, so under a flood of failures just one is logged
+    # per function and interval and the rest are counted
+    _logger: logging.Logger
+    _interval: float
+    _logged: Dict[str, Tuple[float, int]]
+
+    def __init__(self, logger: logging.Logger, interval: float = 10.0):
+        self._logger = logger
+        self._interval = interval
+        self._logged = dict()
+
+    def failed(self, function: str, error: BaseException, now: Optional[float] = None):
+        if now is None:
+            now = time.monotonic()
+
+        last_logged, suppressed = self._logged.get(function, (None, 0))
+        if last_logged is not None and now - last_logged < self._interval:
+            self._logged[function] = (last_logged, suppressed + 1)
+            return
+
+        self._logged[function] = (now, 0)
+        if suppressed > 0:
+            self._logger.error(
+                "Function %s failed to execute (%s more failures since the last report)",
+                function, suppressed, exc_info=error,
+            )
+        else:
+            self._logger.error("Function %s failed to execute", function, exc_info=error)
+
+
+class ErrorPolicy:
+    # Messages failing in a function are retried with an exponential backoff from a bounded
+    # queue, so the processing of other messages doesn't wait for them. Messages failing all
+    # the attempts are sent to the dead-letter topic, if any.
+    _name: str
+    _retries: int
+    _backoff: float
+    _max_backoff: float
+    _max_queue: int
+    _dead_letter: Optional[TopicName]
+    _failure_log: FailureLog
+    _queue: List[Tuple[float, int, FailedMessage]]
+    _sequence: "itertools.count[int]"
+    _dead_letters: List[Message]
+
+    @property
+    def failure_log(self) -> FailureLog:
+        return self._failure_log
+
+    @property
+    def dead_letter(self) -> Optional[TopicName]:
+        return self._dead_letter
+
+    @property
+    def has_retries(self) -> bool:
+        return self._retries > 0
+
+    def __init__(
+        self,
+        name: str,
+        retries: int = 0,
+        backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        max_queue: int = 1000,
+        dead_letter: Optional[TopicName] = None,
+        log_interval: float = 10.0,
+    ):
+        self._name = name
+        self._retries = retries
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._max_queue = max_queue
+        self._dead_letter = dead_letter
+        self._failure_log = FailureLog(logging.getLogger(__name__ + "=" + name), log_interval)
+        self._queue = list()
+        self._sequence = itertools.count()
+        self._dead_letters = list()
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def retry(self, failed: FailedMessage, now: float) -> bool:
+        if failed.attempts > self._retries or len(self._queue) >= self._max_queue:
+            return False
+
+        delay = min(self._backoff * 2 ** (failed.attempts - 1), self._max_backoff)
+        heapq.heappush(self._queue, (now + delay, next(self._sequence), failed))
+        return True
+
+    def pop_due(self, now: float) -> List[FailedMessage]:
+        due = list()
+        while len(self._queue) > 0 and self._queue[0][0] <= now:
+            due.append(heapq.heappop(self._queue)[2])
+
+        return due
+
+    def next_deadline(self) -> Optional[float]:
+        return self._queue[0][0] if len(self._queue) > 0 else None
+
+    def add_dead_letter(self, failed: FailedMessage, sink_topic: TopicName):
+        self._dead_letters.append(Message(sink_topic, self._encode_dead_letter(failed)))
+
+    def pop_dead_letters(self) -> List[Message]:
+        dead_letters, self._dead_letters = self._dead_letters, list()
+        return dead_letters
+
+    def _encode_dead_letter(self, failed: FailedMessage) -> bytes:
+        record = {
+            "processor": self._name,
+            "source_topic": failed.source_topic,
+            "function": failed.failure.function,
+            "error": type(failed.failure.error).__name__,
+            "error_message": str(failed.failure.error),
+            "attempts": failed.attempts,
+            "timestamp": failed.timestamp,
+        }
+
+        body = failed.body
+        if isinstance(body, str):
+            record["payload"] = body
+        elif isinstance(body, (bytes, bytearray)):
+            try:
+                record["payload"] = bytes(body).decode("utf8")
+            except UnicodeDecodeError:
+                record["payload_base64"] = base64.b64encode(body).decode("ascii")
+        else:
+            record["payload"] = repr(body)
+
+        return encode_json(record)
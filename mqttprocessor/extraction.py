@@ -0,0 +1,162 @@
+import json
+import re
+from json.decoder import scanstring, WHITESPACE
+from typing import Any, Dict, List, Optional, Tuple
+
+# Nested fields to extract, None marks a field taken as a whole
+_FieldTree = Dict[str, Optional["_FieldTree"]]
+
+_DECODER = json.JSONDecoder()
+_SCALAR = re.compile(
+    r'-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?|true|false|null|NaN|-?Infinity'
+)
+
+
+class JsonFieldExtractor:
+    # Extracts fields given by dotted paths from JSON objects. Members of the objects are
+    # walked by the json scanner, so just the members on the paths are decoded, and the
+    # walk stops once all fields are found. The rest of the document isn't validated then.
+    # Anything unexpected falls back to decoding the whole document.
+    _paths: Tuple[str, ...]
+    _tree: _FieldTree
+
+    @property
+    def paths(self) -> Tuple[str, ...]:
+        return self._paths
+
+    def __init__(self, paths: List[str]):
+        if len(paths) == 0:
+            raise ValueError("At least one field path required")
+
+        self._paths = tuple(paths)
+        self._tree = _create_field_tree(paths)
+
+    def extract(self, document: bytes | str) -> Dict[str, Any]:
+        text = document.decode("utf8") if isinstance(document, (bytes, bytearray)) else document
+
+        try:
+            position = WHITESPACE.match(text, 0).end()
+            if text[position] == "{":
+                extracted, _ = _extract_object(text, position, self._tree, stop_early=True)
+                return extracted
+        except (ValueError, IndexError):
+            pass
+
+        return _extract_decoded(json.loads(text), self._tree)
+
+
+def _create_field_tree(paths: List[str]) -> _FieldTree:
+    tree: _FieldTree = dict()
+    for path in paths:
+        keys = path.split(".")
+        if any(len(key) == 0 for key in keys):
+            raise ValueError(f"Invalid field path `{path}`")
+
+        node = tree
+        for key in keys[:-1]:
+            if key in node and node[key] is None:
+                break
+            node = node.setdefault(key, dict())
+        else:
+            # A field taken as a whole includes its nested fields
+            node[keys[-1]] = None
+
+    return tree
+
+
+def _extract_object(
+    text: str, position: int, tree: _FieldTree, stop_early: bool
+) -> Tuple[Dict[str, Any], Optional[int]]:
+    # Returns the extracted fields and the position after the object, or None if the walk
+    # stopped early
+    extracted = dict()
+    remaining = len(tree)
+
+    position = WHITESPACE.match(text, position + 1).end()
+    if text[position] == "}":
+        return extracted, position + 1
+
+    while True:
+        if text[position] != '"':
+            raise ValueError("Expected a member name")
+        key, position = scanstring(text, position + 1)
+
+        position = WHITESPACE.match(text, position).end()
+        if text[position] != ":":
+            raise ValueError("Expected a colon")
+        position = WHITESPACE.match(text, position + 1).end()
+
+        if key in tree and key not in extracted:
+            subtree = tree[key]
+            remaining -= 1
+            last = stop_early and remaining == 0
+
+            if subtree is None:
+                extracted[key], position = _DECODER.raw_decode(text, position)
+            elif text[position] == "{":
+                extracted[key], position = _extract_object(text, position, subtree, last)
+            else:
+                # Fields of anything else than an object are missing
+                position = _skip_value(text, position)
+
+            if last:
+                return extracted, None
+        else:
+            position = _skip_value(text, position)
+
+        position = WHITESPACE.match(text, position).end()
+        if text[position] == "}":
+            return extracted, position + 1
+        if text[position] != ",":
+            raise ValueError("Expected a comma")
+        position = WHITESPACE.match(text, position + 1).end()
+
+
+def _skip_value(text: str, position: int) -> int:
+    # Returns the position after the value. Strings are only delimited. Containers are
+    # decoded, the json scanner finds their end faster than matching the brackets.
+    first = text[position]
+    if first == '"':
+        return _skip_string(text, position)
+
+    if first == "{" or first == "[":
+        return _DECODER.raw_decode(text, position)[1]
+
+    match = _SCALAR.match(text, position)
+    if match is None:
+        raise ValueError("Expected a value")
+
+    return match.end()
+
+
+def _skip_string(text: str, position: int) -> int:
+    # Finding the quotes is faster than matching the characters in between
+    end = position
+    while True:
+        end = text.find('"', end + 1)
+        if end < 0:
+            raise ValueError("Unterminated string")
+
+        # The quote is escaped by an odd number of backslashes
+        backslash = end - 1
+        while text[backslash] == "\\":
+            backslash -= 1
+        if (end - backslash) % 2 == 1:
+            return end + 1
+
+
+def _extract_decoded(document: Any, tree: _FieldTree) -> Dict[str, Any]:
+    extracted = dict()
+    if not isinstance(document, dict):
+        return extracted
+
+    for key, subtree in tree.items():
+        if key not in document:
+            continue
+
+        if subtree is None:
+            extracted[key] = document[key]
+        elif isinstance(document[key], dict):
+            extracted[key] = _extract_decoded(document[key], subtree)
+
+    return extracted
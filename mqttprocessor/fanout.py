@@ -0,0 +1,96 @@
+import copy
+import pickle
+from collections import Counter
+from typing import Dict, List, Any, Hashable, Optional, TYPE_CHECKING
+
+from mqttprocessor.messages import TopicName, MessageProperties, TopicRuleIndex
+
+if TYPE_CHECKING:
+    from mqttprocessor.routing import Processor
+
+_MISSING = object()
+_IMMUTABLE_TYPES = (str, bytes, int, float, bool, type(None))
+
+
+class MessageContext:
+    # Everything derived from a received message that processors can share: the parsed
+    # topic, its properties and delivery, the matches of source rules and the outputs of
+    # shared function stages. With an index of the rules, all of them are matched at once.
+    __slots__ = (
+        "source_topic", "properties", "qos", "retain", "timestamp", "stages", "consumers",
+        "_matches", "_rule_index",
+    )
+
+    def __init__(
+        self, source_topic: TopicName, properties: Optional[MessageProperties] = None,
+        rule_index: Optional[TopicRuleIndex] = None, qos: Optional[int] = None,
+        retain: Optional[bool] = None,
+    ):
+        self.source_topic = source_topic
+        self.properties = properties
+        self.qos = qos
+        self.retain = retain
+        # Set by the processors, received messages without a timestamp get the current time
+        self.timestamp: Optional[float] = None
+        self.stages: Dict[int, Any] = dict()
+        # Processors yet to use the shared stages, by the first stage of their chains
+        self.consumers: Dict[int, int] = dict()
+        self._rule_index = rule_index
+        self._matches: Dict[str, Optional[Dict[str, str]]] = (
+            dict() if rule_index is None else rule_index.match(source_topic.rule)
+        )
+
+    @property
+    def matched_rules(self) -> List[str]:
+        return [rule for rule, matches in self._matches.items() if matches is not None]
+
+    def match(self, source_topic_rule: TopicName) -> Optional[Dict[str, str]]:
+        matches = self._matches.get(source_topic_rule.rule, _MISSING)
+        if matches is _MISSING:
+            if self._rule_index is not None and source_topic_rule.rule in self._rule_index:
+                return None
+
+            matches = source_topic_rule.matches(self.source_topic)
+            self._matches[source_topic_rule.rule] = matches
+
+        return matches
+
+
+def share_stages(processors: List["Processor"]):
+    # A stage is identified by the source rule and all the functions up to it, so equal
+    # prefixes of function chains get the same stage and are evaluated once per message
+    stage_ids: Dict[Hashable, int] = dict()
+    stage_counts: Counter = Counter()
+    chains = list()
+
+    for processor in processors:
+        for source_processor in processor.source_processors:
+            prefix: Hashable = source_processor.source_topic.rule
+            stages = list()
+
+            for function in source_processor.stage_functions:
+                # Stateful functions have no stage key, every use of them is evaluated
+                if function.stage_key is None:
+                    break
+
+                prefix = (prefix, function.stage_key)
+                stages.append(stage_ids.setdefault(prefix, len(stage_ids)))
+
+            stage_counts.update(stages)
+            chains.append((source_processor, stages))
+
+    for source_processor, stages in chains:
+        shared = [stage for stage in stages if stage_counts[stage] > 1]
+        source_processor.share_stages(shared, stage_counts[shared[0]] if shared else 0)
+
+
+def copy_value(value: Any) -> Any:
+    # Shared outputs are copied before they are passed to converters that could modify them.
+    # Pickling copies decoded documents several times faster than deepcopy.
+    if type(value) in _IMMUTABLE_TYPES:
+        return value
+
+    try:
+        return pickle.loads(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return copy.deepcopy(value)
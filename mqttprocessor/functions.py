@@ -1,9 +1,11 @@
 import inspect
+import json
 import logging
+import time
 from dataclasses import dataclass
-from functools import wraps
+from functools import wraps, lru_cache
 from importlib import import_module
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Tuple, Hashable, Optional, TYPE_CHECKING
 
 from .definitions import (
     BodyType,
@@ -13,11 +15,20 @@ from .definitions import (
     ConverterType,
     RuleType,
 )
-from .models import ExtendedFunctionModel
+from .memoization import ResultCache
+from .messages import MessageProperties
+from .state import StateStore, StateBackend
 
-_SPECIAL_PARAMETERS = ["source_topic", "matches"]
+if TYPE_CHECKING:
+    from .models import ExtendedFunctionModel
+
+_SPECIAL_PARAMETERS = ["source_topic", "matches", "state", "properties", "timestamp"]
+
+_NO_PROPERTIES = MessageProperties()
 
 _REGISTERED_PROCESSOR_FUNCTIONS: Dict[str, "ProcessorFunctionDefinition"] = dict()
+_RESULT_CACHES: Dict[Hashable, ResultCache] = dict()
+_builtin_functions_registered = False
 
 _logger = logging.getLogger(__name__)
 
@@ -27,6 +38,8 @@ class ProcessorFunctionDefinition:
     name: str
     ptype: ProcessorFunctionType
     callback: RawRuleType | RawConverterType
+    pure: bool = False
+    cache_size: int = 0
 
     def __eq__(self, other) -> bool:
         if other is None:
@@ -46,21 +59,41 @@ class ProcessorFunctionDefinition:
 
 class ProcessorFunction:
     ptype: ProcessorFunctionType
+    stage_key: Optional[Hashable]
 
     _callback: RuleType | ConverterType
     _expects_matches: bool
     _expects_source_topic: bool
+    _expects_properties: bool
+    _expects_timestamp: bool
+    _state: StateStore | None
+
+    @property
+    def name(self) -> str:
+        return getattr(self._callback, "__name__", type(self._callback).__name__)
 
     def __init__(
             self, ptype: ProcessorFunctionType, callback: RuleType | ConverterType,
-            expects_matches: bool, expects_source_topic: bool
+            expects_matches: bool, expects_source_topic: bool, state: StateStore | None = None,
+            stage_key: Optional[Hashable] = None, expects_properties: bool = False,
+            expects_timestamp: bool = False,
     ):
         self.ptype = ptype
+        self.stage_key = stage_key
         self._callback = callback
         self._expects_matches = expects_matches
         self._expects_source_topic = expects_source_topic
+        self._expects_properties = expects_properties
+        self._expects_timestamp = expects_timestamp
+        self._state = state
+
+    def callback(
+            self, val: Any, source_topic: str, matches: Dict[str, str],
+            properties: Optional[MessageProperties] = None, timestamp: Optional[float] = None,
+    ):
+        if timestamp is None and (self._state is not None or self._expects_timestamp):
+            timestamp = time.time()
 
-    def callback(self, val: Any, source_topic: str, matches: Dict[str, str]):
         special_params = dict()
         if self._expects_matches:
             special_params["matches"] = matches
@@ -68,14 +101,28 @@ class ProcessorFunction:
         if self._expects_source_topic:
             special_params["source_topic"] = source_topic
 
+        if self._state is not None:
+            self._state.advance(timestamp)
+            special_params["state"] = self._state
+
+        if self._expects_properties:
+            special_params["properties"] = (
+                _NO_PROPERTIES if properties is None else properties
+            )
+
+        if self._expects_timestamp:
+            special_params["timestamp"] = timestamp
+
         return self._callback(val, special_params)
 
 
 def create_functions(
-    functions_config: List[ExtendedFunctionModel],
+    functions_config: List["ExtendedFunctionModel"],
     register: Dict[str, ProcessorFunctionDefinition] = None,
+    state_backend: StateBackend | None = None,
+    state_namespace: str = "",
 ) -> List[ProcessorFunction]:
-    import_module(".builtin", "mqttprocessor")
+    _register_builtin_functions()
 
     functions = list()
 
@@ -84,29 +131,49 @@ def create_functions(
     else:
         global_function_store = register
 
-    for function_config in functions_config:
+    for index, function_config in enumerate(functions_config):
         if function_config.name.__root__ not in global_function_store:
             raise ValueError(f"Function `{function_config.name.__root__}` undefined")
 
         function_definition = global_function_store[function_config.name.__root__]
 
         _verify_function_arguments(function_config, function_definition)
-        function = _create_function_representation(function_config, function_definition)
+        function = _create_function_representation(
+            function_config, function_definition, state_backend,
+            f"{state_namespace}/{index}/{function_definition.name}"
+        )
 
         functions.append(function)
 
     return functions
 
 
+def _register_builtin_functions():
+    global _builtin_functions_registered
+    if _builtin_functions_registered:
+        return
+
+    import_module(".builtin", "mqttprocessor")
+    _builtin_functions_registered = True
+
+
 def _verify_function_arguments(
-    function_config: ExtendedFunctionModel,
+    function_config: "ExtendedFunctionModel",
     function_definition: ProcessorFunctionDefinition,
 ):
-    function_signature = inspect.signature(function_definition.callback)
+    # Arguments can't be named like the special parameters, they would be overridden
+    reserved_arguments = [
+        name for name in _SPECIAL_PARAMETERS if name in function_config.arguments
+    ]
+    if len(reserved_arguments) > 0:
+        raise ValueError(
+            f"Arguments {', '.join(reserved_arguments)} of function "
+            f"`{function_config.name.__root__}` use reserved names of special parameters"
+        )
 
     non_special_parameters = filter(
         lambda parameter: parameter.name not in _SPECIAL_PARAMETERS,
-        function_signature.parameters.values()
+        _get_function_parameters(function_definition.callback)
     )
 
     number_of_nondefault_params = [
@@ -122,42 +189,131 @@ def _verify_function_arguments(
 
 
 def _create_function_representation(
-    function_config: ExtendedFunctionModel,
+    function_config: "ExtendedFunctionModel",
     function_definition: ProcessorFunctionDefinition,
+    state_backend: StateBackend | None = None,
+    state_namespace: str = "",
 ) -> ProcessorFunction:
     @wraps(function_definition.callback)
     def _cbk_wrapper(val: Any, special_params: Dict[str, Any]):
         return function_definition.callback(val, **function_config.arguments, **special_params)
 
-    function_signature = inspect.signature(function_definition.callback)
     function_parameter_names = list(map(
         lambda parameter: parameter.name,
-        function_signature.parameters.values()
+        _get_function_parameters(function_definition.callback)
     ))
 
     expects_source_topic = "source_topic" in function_parameter_names
     expects_matches = "matches" in function_parameter_names
+    expects_properties = "properties" in function_parameter_names
+    expects_timestamp = "timestamp" in function_parameter_names
+
+    # Every use of a stateful function in the config gets its own state. Streams of
+    # generator functions can be consumed just once, so they can't be shared either.
+    state = None
+    stage_key = None
+    if "state" in function_parameter_names:
+        state = _create_function_state(function_config, state_backend, state_namespace)
+    elif not inspect.isgeneratorfunction(function_definition.callback):
+        stage_key = _create_stage_key(function_config, function_definition)
+
+    callback = _cbk_wrapper
+    if function_definition.pure:
+        callback = _get_result_cache(function_config, function_definition).wrap(_cbk_wrapper)
 
     return ProcessorFunction(
-        function_definition.ptype, _cbk_wrapper,
+        function_definition.ptype, callback,
         expects_source_topic=expects_source_topic,
-        expects_matches=expects_matches
+        expects_matches=expects_matches,
+        state=state,
+        stage_key=stage_key,
+        expects_properties=expects_properties,
+        expects_timestamp=expects_timestamp,
     )
 
 
+def _create_stage_key(
+    function_config: "ExtendedFunctionModel",
+    function_definition: ProcessorFunctionDefinition,
+) -> Hashable:
+    # Uses of a function with equal arguments produce equal outputs, so they can be shared
+    arguments = json.dumps(function_config.arguments, sort_keys=True, default=repr)
+    return function_definition.name, arguments
+
+
+def _get_result_cache(
+    function_config: "ExtendedFunctionModel",
+    function_definition: ProcessorFunctionDefinition,
+) -> ResultCache:
+    # Uses of a pure function with equal arguments share the cached outputs
+    arguments = json.dumps(function_config.arguments, sort_keys=True, default=repr)
+    key = function_definition.callback, arguments
+    if key not in _RESULT_CACHES:
+        _RESULT_CACHES[key] = ResultCache(
+            f"{function_definition.name}({arguments})", function_definition.cache_size
+        )
+
+    return _RESULT_CACHES[key]
+
+
+def get_result_caches() -> List[ResultCache]:
+    return list(_RESULT_CACHES.values())
+
+
+def _create_function_state(
+    function_config: "ExtendedFunctionModel",
+    state_backend: StateBackend | None,
+    state_namespace: str,
+) -> StateStore:
+    state_parameters = dict()
+    if function_config.state is not None:
+        state_parameters = dict(max_keys=function_config.state.max_keys, ttl=function_config.state.ttl)
+
+    if state_backend is None:
+        return StateStore(**state_parameters)
+
+    return state_backend.create_store(state_namespace, **state_parameters)
+
+
+@lru_cache(maxsize=None)
+def _get_function_parameters(
+    callback: RawRuleType | RawConverterType,
+) -> Tuple[inspect.Parameter, ...]:
+    # Signature introspection is slow and the same registered function is usually
+    # referenced by many processors, so it is done once per function
+    return tuple(inspect.signature(callback).parameters.values())
+
+
 def _register_processor_function(
-    name: str, func: RawRuleType | RawConverterType, ptype: ProcessorFunctionType
+    name: str, func: RawRuleType | RawConverterType, ptype: ProcessorFunctionType,
+    pure: bool = False, cache_size: int = 0,
 ):
     _logger.info("Registering function %s", name)
     if name in _REGISTERED_PROCESSOR_FUNCTIONS:
         _logger.error("Function '%s' already registered", name)
         raise ValueError("Names must be unique")
 
+    if pure:
+        _verify_pure_function(name, func, cache_size)
+
     _REGISTERED_PROCESSOR_FUNCTIONS[name] = ProcessorFunctionDefinition(
-        name=name, ptype=ptype, callback=func
+        name=name, ptype=ptype, callback=func, pure=pure, cache_size=cache_size
     )
 
 
+def _verify_pure_function(name: str, func: RawConverterType, cache_size: int):
+    if cache_size <= 0:
+        raise ValueError(f"Cache size of pure function '{name}' must be positive")
+
+    # Outputs of stateful functions depend on previous messages and streams can be
+    # consumed just once, so neither can be cached
+    if "state" in map(lambda parameter: parameter.name, _get_function_parameters(func)):
+        raise ValueError(f"Pure function '{name}' can't have a state")
+
+    if inspect.isgeneratorfunction(func):
+        raise ValueError(f"Pure function '{name}' can't be a generator")
+
+
 def create_processor_register() -> Dict[str, ProcessorFunctionDefinition]:
     return dict(_REGISTERED_PROCESSOR_FUNCTIONS)
 
@@ -181,13 +337,17 @@ def rule(original_function=None, *, name: str = None):
     return decorator
 
 
-def converter(original_function=None, *, name: str = None):
+def converter(
+    original_function=None, *, name: str = None, pure: bool = False, cache_size: int = 1024
+):
     def decorator(func):
         if name is None:
             rule_name = func.__name__
         else:
             rule_name = name
-        _register_processor_function(rule_name, func, ProcessorFunctionType.CONVERTER)
+        _register_processor_function(
+            rule_name, func, ProcessorFunctionType.CONVERTER, pure=pure, cache_size=cache_size
+        )
 
         @wraps(func)
         def wrapper(body: BodyType):
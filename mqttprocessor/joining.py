@@ -0,0 +1,107 @@
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Any, Set
+
+_MISSING = object()
+
+
+class _JoinEntry:
+    __slots__ = ("values", "updated")
+
+    def __init__(self, size: int):
+        # Values and the times they were received, interleaved in one list to save memory
+        self.values: List[Any] = [_MISSING, 0.0] * size
+        self.updated = 0.0
+
+
+class JoinStage:
+    _logger: logging.Logger
+    _fields: List[str]
+    _field_indexes: Dict[str, int]
+    _key: str
+    _triggers: Set[str]
+    _require_all: bool
+    _max_keys: int
+    _ttl: Optional[float]
+    _entries: "OrderedDict[str, _JoinEntry]"
+
+    @property
+    def fields(self) -> List[str]:
+        return self._fields
+
+    @property
+    def key(self) -> str:
+        return self._key
+
+    def __init__(
+        self,
+        name: str,
+        fields: List[str],
+        key: str,
+        triggers: Optional[List[str]] = None,
+        require_all: bool = True,
+        max_keys: int = 100000,
+        ttl: Optional[float] = None,
+    ):
+        self._logger = logging.getLogger(__name__ + "=" + name)
+        self._fields = fields
+        self._field_indexes = {field: index for index, field in enumerate(fields)}
+        self._key = key
+        self._triggers = set(fields if triggers is None else triggers)
+        self._require_all = require_all
+        self._max_keys = max_keys
+        self._ttl = ttl
+        self._entries = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, field: str, key: str, value: Any, timestamp: float) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = _JoinEntry(len(self._fields))
+            self._entries[key] = entry
+        else:
+            self._entries.move_to_end(key)
+
+        index = self._field_indexes[field] * 2
+        entry.values[index] = value
+        entry.values[index + 1] = timestamp
+        entry.updated = max(entry.updated, timestamp)
+
+        self._evict(timestamp)
+
+        if field not in self._triggers:
+            return None
+
+        return self._join(entry, timestamp)
+
+    def _join(self, entry: _JoinEntry, timestamp: float) -> Optional[Dict[str, Any]]:
+        joined = dict()
+        for field, index in self._field_indexes.items():
+            value, received = entry.values[index * 2], entry.values[index * 2 + 1]
+
+            if value is _MISSING or (self._ttl is not None and timestamp - received >= self._ttl):
+                if self._require_all:
+                    return None
+                continue
+
+            joined[field] = value
+
+        return joined
+
+    def _evict(self, now: float):
+        # Entries are ordered by their last update, so the stale ones are at the front
+        while len(self._entries) > self._max_keys:
+            key, _ = self._entries.popitem(last=False)
+            self._logger.debug("Too many join keys, dropping values of `%s`", key)
+
+        if self._ttl is None:
+            return
+
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if now - entry.updated < self._ttl:
+                break
+
+            del self._entries[key]
@@ -1,10 +1,83 @@
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+from io import StringIO
+from pathlib import Path
 from typing import TextIO
 
+import pydantic
 import yaml
 
+import mqttprocessor.definitions
+import mqttprocessor.models
 from mqttprocessor.models import ConfigModel
 
+_CONFIG_ARTIFACT_VERSION = 1
+# Artifacts contain the validated models, so they are invalidated by any change of them,
+# even without a new version
+_MODEL_SOURCES = (mqttprocessor.models.__file__, mqttprocessor.definitions.__file__)
+
+_logger = logging.getLogger(__name__)
+
 
 def load_config(stream: TextIO) -> ConfigModel:
     data = yaml.load(stream, yaml.CLoader)
     return ConfigModel(**data)
+
+
+def load_config_cached(config_file_path: str, cache_dir: str) -> ConfigModel:
+    with open(config_file_path, "rb") as f:
+        raw_config = f.read()
+
+    artifact_path = Path(cache_dir) / "config-{0}.pickle".format(
+        _get_config_hash(raw_config)
+    )
+
+    if artifact_path.exists():
+        try:
+            with open(artifact_path, "rb") as f:
+                config = pickle.load(f)
+
+            if isinstance(config, ConfigModel):
+                _logger.info("Loaded precompiled config from %s", artifact_path)
+                return config
+
+            _logger.warning("Precompiled config %s is invalid, ignoring", artifact_path)
+        except Exception:
+            _logger.warning(
+                "Precompiled config %s can't be loaded, ignoring", artifact_path
+            )
+
+    config = load_config(StringIO(raw_config.decode("utf8")))
+    _store_config_artifact(config, artifact_path)
+
+    return config
+
+
+def _get_config_hash(raw_config: bytes) -> str:
+    config_hash = hashlib.sha256()
+    config_hash.update(
+        "{0}:{1}:".format(_CONFIG_ARTIFACT_VERSION, pydantic.VERSION).encode("utf8")
+    )
+    for source_path in _MODEL_SOURCES:
+        config_hash.update(Path(source_path).read_bytes())
+    config_hash.update(raw_config)
+
+    return config_hash.hexdigest()
+
+
+def _store_config_artifact(config: ConfigModel, artifact_path: Path):
+    try:
+        artifact_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Written to a temporary file first, so concurrently starting instances never
+        # read a partially written artifact
+        fd, tmp_path = tempfile.mkstemp(dir=artifact_path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(config, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        os.replace(tmp_path, artifact_path)
+    except OSError:
+        _logger.warning("Can't store precompiled config to %s", artifact_path)
@@ -0,0 +1,118 @@
+import pickle
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from mqttprocessor.fanout import copy_value
+
+_MISSING = object()
+_HASHABLE_TYPES = (str, bytes, int, float, bool, type(None))
+# Longer payloads are represented by their digest, so the cache doesn't hold them
+_MAX_KEY_LENGTH = 256
+
+
+class ResultCache:
+    # Outputs of a pure function in the least recently used order. Outputs are copied when
+    # stored and when returned, so functions down the chain can't modify the cached ones.
+    _name: str
+    _max_size: int
+    _results: "OrderedDict[Hashable, Any]"
+    _hits: int
+    _misses: int
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def hits(self) -> int:
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        return self._misses
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self._hits + self._misses
+        return 0.0 if lookups == 0 else self._hits / lookups
+
+    def __init__(self, name: str, max_size: int):
+        if max_size <= 0:
+            raise ValueError("Cache size must be positive")
+
+        self._name = name
+        self._max_size = max_size
+        self._results = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    def wrap(
+        self, callback: Callable[[Any, Dict[str, Any]], Any]
+    ) -> Callable[[Any, Dict[str, Any]], Any]:
+        def cached_callback(val: Any, special_params: Dict[str, Any]) -> Any:
+            key = _create_key(val, special_params)
+            if key is None:
+                return callback(val, special_params)
+
+            return self.get_or_call(key, lambda: callback(val, special_params))
+
+        cached_callback.__name__ = getattr(callback, "__name__", self._name)
+        return cached_callback
+
+    def get_or_call(self, key: Hashable, call: Callable[[], Any]) -> Any:
+        result = self._results.get(key, _MISSING)
+        if result is not _MISSING:
+            self._hits += 1
+            self._results.move_to_end(key)
+            return copy_value(result)
+
+        self._misses += 1
+        result = call()
+
+        self._results[key] = copy_value(result)
+        if len(self._results) > self._max_size:
+            self._results.popitem(last=False)
+
+        return result
+
+
+def _create_key(val: Any, special_params: Dict[str, Any]) -> Optional[Hashable]:
+    value_key = _create_value_key(val)
+    if value_key is None:
+        return None
+
+    if len(special_params) == 0:
+        return value_key
+
+    params_key = list()
+    for name, param in sorted(special_params.items()):
+        if isinstance(param, dict):
+            param = tuple(sorted(param.items()))
+        params_key.append((name, param))
+
+    return value_key, tuple(params_key)
+
+
+def _create_value_key(val: Any) -> Optional[Hashable]:
+    # Values are compared by their type too, so e.g. 1 and True are cached separately
+    if type(val) in _HASHABLE_TYPES:
+        if isinstance(val, (str, bytes)) and len(val) > _MAX_KEY_LENGTH:
+            return type(val), _digest(val.encode("utf8") if isinstance(val, str) else val)
+
+        return type(val), val
+
+    # Decoded documents are keyed by the digest of their serialization
+    try:
+        return type(val), _digest(pickle.dumps(val, pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return None
+
+
+def _digest(data: bytes) -> bytes:
+    # Imported here, hashlib loads OpenSSL and takes a noticeable part of the app import
+    import hashlib
+
+    return hashlib.blake2b(data, digest_size=16).digest()
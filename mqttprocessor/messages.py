@@ -1,8 +1,10 @@
 import re
-from dataclasses import dataclass
-from typing import Dict, Any, Iterable, Pattern, Set, List, Sequence
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from typing import Dict, Any, Iterable, Pattern, Set, List, Sequence, Optional, Tuple
 
-from mqttprocessor.models import TOPIC_NAME_REGEX_PATTERN
+from mqttprocessor.definitions import TOPIC_NAME_REGEX_PATTERN, RoutedMessageShape
+from mqttprocessor.serialization import encode_json
 
 
 class PatternGroupCreator:
@@ -26,7 +28,8 @@ class RegexPatternCreator:
     _MULTI_LEVEL_REGEX = re.compile(r"{(W[0-9]+)}")
 
     _SINGLE_LEVEL_PATTERN = r"[^\/]+"
-    _MULTI_LEVEL_PATTERN = r"(.+)+?"
+    # Nested quantifiers like `(.+)+?` backtrack exponentially on topics that don't match
+    _MULTI_LEVEL_PATTERN = r".+"
 
     _rule: List[str]
 
@@ -60,11 +63,192 @@ class RegexPatternCreator:
         return re.compile("^" + r"\/".join(levels) + "$")
 
 
+_REGEX_RULE_FORMAT = re.compile(TOPIC_NAME_REGEX_PATTERN)
+_WHOLE_LEVEL_PLACEHOLDER = re.compile(r"^{([wW][0-9]+)}$")
+
+_LITERAL_LEVEL = 0
+_SINGLE_LEVEL = 1
+_MULTI_LEVEL = 2
+
+
+@lru_cache(maxsize=None)
+def _create_rule_regex(rule: str) -> Pattern:
+    if _REGEX_RULE_FORMAT.match(rule) is None:
+        raise ValueError("Invalid topic name")
+
+    return RegexPatternCreator(rule).create_regex()
+
+
+def _parse_rule_levels(rule: str) -> Optional[List[Tuple[int, str]]]:
+    # Rules with placeholders that are just a part of a level can't be parsed into levels
+    levels = list()
+    for level in rule.split("/"):
+        placeholder = _WHOLE_LEVEL_PLACEHOLDER.match(level)
+        if placeholder is not None:
+            name = placeholder.group(1)
+            levels.append((_SINGLE_LEVEL if name[0] == "w" else _MULTI_LEVEL, name))
+        elif "{" in level:
+            return None
+        else:
+            levels.append((_LITERAL_LEVEL, level))
+
+    return levels
+
+
+class SegmentMatcher:
+    # Matches rules made of literal levels and whole-level placeholders level by level,
+    # without a regex. Multi-level placeholders take as many levels as possible, so the
+    # matches are the same as those of the regex.
+    __slots__ = (
+        "_levels", "_min_levels", "_multi_level_after", "_has_multi_level", "_literals",
+        "_placeholders",
+    )
+
+    _levels: List[Tuple[int, str]]
+    _min_levels: List[int]
+    _multi_level_after: List[bool]
+    _has_multi_level: bool
+    _literals: List[Tuple[int, str]]
+    _placeholders: List[Tuple[int, str]]
+
+    def __init__(self, levels: List[Tuple[int, str]]):
+        self._levels = levels
+        self._has_multi_level = any(kind == _MULTI_LEVEL for kind, _ in levels)
+
+        # Positions of the levels, used by rules without multi-level placeholders, which
+        # match topics with the same number of levels only
+        self._literals = [
+            (index, value) for index, (kind, value) in enumerate(levels) if kind == _LITERAL_LEVEL
+        ]
+        self._placeholders = [
+            (index, value) for index, (kind, value) in enumerate(levels) if kind == _SINGLE_LEVEL
+        ]
+
+        # Every level of the rule takes at least one level of the topic
+        self._min_levels = [len(levels) - index for index in range(len(levels) + 1)]
+        self._multi_level_after = [
+            any(kind == _MULTI_LEVEL for kind, _ in levels[index:])
+            for index in range(len(levels) + 1)
+        ]
+
+    @property
+    def levels(self) -> List[Tuple[int, str]]:
+        return self._levels
+
+    @staticmethod
+    def create(rule: str) -> Optional["SegmentMatcher"]:
+        levels = _parse_rule_levels(rule)
+        return None if levels is None else SegmentMatcher(levels)
+
+    def match(self, topic: str) -> Dict[str, str] | None:
+        return self.match_levels(topic.split("/"))
+
+    def match_levels(self, topic_levels: List[str]) -> Dict[str, str] | None:
+        if self._has_multi_level:
+            return self._match_levels(topic_levels, 0, 0, {})
+
+        if len(topic_levels) != len(self._levels):
+            return None
+
+        for index, value in self._literals:
+            if topic_levels[index] != value:
+                return None
+
+        groups = dict()
+        for index, name in self._placeholders:
+            topic_level = topic_levels[index]
+            if topic_level == "" or groups.setdefault(name, topic_level) != topic_level:
+                return None
+
+        return groups
+
+    def _match_levels(
+        self, topic_levels: List[str], index: int, topic_index: int, groups: Dict[str, str]
+    ) -> Dict[str, str] | None:
+        levels = self._levels
+        while index < len(levels):
+            kind, value = levels[index]
+
+            if kind == _MULTI_LEVEL:
+                return self._match_multi_level(topic_levels, index, topic_index, groups)
+
+            if topic_index == len(topic_levels):
+                return None
+
+            topic_level = topic_levels[topic_index]
+            if kind == _LITERAL_LEVEL:
+                if topic_level != value:
+                    return None
+            elif topic_level == "":
+                return None
+            else:
+                captured = groups.setdefault(value, topic_level)
+                if captured != topic_level:
+                    return None
+
+            index += 1
+            topic_index += 1
+
+        return groups if topic_index == len(topic_levels) else None
+
+    def _match_multi_level(
+        self, topic_levels: List[str], index: int, topic_index: int, groups: Dict[str, str]
+    ) -> Dict[str, str] | None:
+        name = self._levels[index][1]
+
+        # Without another multi-level placeholder, the rest of the rule takes a fixed number
+        # of levels, so there's just one option to try
+        last_end = len(topic_levels) - self._min_levels[index + 1]
+        first_end = topic_index + 1
+        if not self._multi_level_after[index + 1]:
+            first_end = max(first_end, last_end)
+
+        for end in range(last_end, first_end - 1, -1):
+            captured = "/".join(topic_levels[topic_index:end])
+            if captured == "" or groups.get(name, captured) != captured:
+                continue
+
+            result = self._match_levels(topic_levels, index + 1, end, {**groups, name: captured})
+            if result is not None:
+                return result
+
+        return None
+
+
+class _RegexMatcher:
+    # Fallback for rules with placeholders that are just a part of a level
+    __slots__ = ("_regex",)
+
+    _regex: Pattern
+
+    def __init__(self, regex: Pattern):
+        self._regex = regex
+
+    def match(self, topic: str) -> Dict[str, str] | None:
+        search_result = self._regex.search(topic)
+        if search_result is None:
+            return None
+
+        return search_result.groupdict()
+
+
+@lru_cache(maxsize=None)
+def _create_rule_matcher(rule: str) -> SegmentMatcher | _RegexMatcher:
+    if _REGEX_RULE_FORMAT.match(rule) is None:
+        raise ValueError("Invalid topic name")
+
+    matcher = SegmentMatcher.create(rule)
+    if matcher is None:
+        return _RegexMatcher(_create_rule_regex(rule))
+
+    return matcher
+
+
 class TopicName:
-    # TODO: Caching: 1) rule format check, 2) rule regex compilation, 3) rule regex matching, 4) rule regex composing
-    _regex_rule_format = re.compile(TOPIC_NAME_REGEX_PATTERN)
+    # TODO: Caching: 3) rule regex matching, 4) rule regex composing
+    __slots__ = ("_matcher", "_rule", "_rule_is_static")
 
-    _regex_topic_name_extract: Pattern[str]
+    _matcher: SegmentMatcher | _RegexMatcher
     _rule: str
     _rule_is_static: bool
 
@@ -81,27 +265,14 @@ class TopicName:
             self._rule_is_static = True
 
         if not self._rule_is_static:
-            if self._regex_rule_format.match(self._rule) is None:
-                raise ValueError("Invalid topic name")
-
-            regex_creator = RegexPatternCreator(rule)
-            self._regex_topic_name_extract = regex_creator.create_regex()
+            self._matcher = _create_rule_matcher(rule)
 
     def convert_rule_to_mqtt_format(self) -> str:
         if self._rule_is_static:
             return self._rule
 
-        rule = self._rule
-        search_result = self._regex_topic_name_extract.search(rule)
-
-        groups = search_result.groupdict()
-        for group_id, value in groups.items():
-            if group_id.startswith("W"):
-                rule = rule.replace("{{{0}}}".format(group_id), "#")
-            else:
-                rule = rule.replace("{{{0}}}".format(group_id), "+")
-
-        return rule
+        rule = RegexPatternCreator._SINGLE_LEVEL_REGEX.sub("+", self._rule)
+        return RegexPatternCreator._MULTI_LEVEL_REGEX.sub("#", rule)
 
     def matches(self, topic_rule: "TopicName") -> Dict[str, str] | None:
         checked_topic_name = topic_rule.rule
@@ -109,12 +280,7 @@ class TopicName:
         if self._rule_is_static:
             return {} if checked_topic_name == self._rule else None
 
-        search_result = self._regex_topic_name_extract.search(checked_topic_name)
-
-        if search_result is None:
-            return None
-        else:
-            return search_result.groupdict()
+        return self._matcher.match(checked_topic_name)
 
     def compose_sink_topic_from_source(
         self, extract_from: "TopicName", embed_into: "TopicName"
@@ -122,11 +288,10 @@ class TopicName:
         if self._rule_is_static:
             return embed_into
 
-        search_result = self._regex_topic_name_extract.search(extract_from.rule)
-        if search_result is None:
+        groups = self._matcher.match(extract_from.rule)
+        if groups is None:
             raise ValueError("Topic `extract_from` does not match the template")
 
-        groups = search_result.groupdict()
         sink_topic = embed_into.rule
         for group_id, value in groups.items():
             sink_topic = sink_topic.replace("{{{0}}}".format(group_id), value)
@@ -154,44 +319,250 @@ class TopicName:
         )
 
 
-@dataclass(frozen=True)
+class _RuleNode:
+    __slots__ = ("literals", "single_level", "multi_level", "repeats", "rules")
+
+    def __init__(self, repeats: bool = False):
+        self.literals: Dict[str, _RuleNode] = dict()
+        self.single_level: Optional[_RuleNode] = None
+        self.multi_level: Optional[_RuleNode] = None
+        # Nodes of multi-level placeholders can take any number of further levels
+        self.repeats = repeats
+        self.rules: List[Tuple[str, SegmentMatcher]] = list()
+
+
+class TopicRuleIndex:
+    # Rules parsed into levels share a trie, so a topic is matched against all of them in a
+    # single pass over its levels. Groups are extracted just for the rules that match.
+    # Rules with placeholders that are just a part of a level are matched one by one.
+    _root: _RuleNode
+    _rules: Set[str]
+    _regex_rules: List[Tuple[str, _RegexMatcher]]
+
+    def __init__(self, rules: Iterable[str]):
+        self._root = _RuleNode()
+        self._rules = set()
+        self._regex_rules = list()
+
+        for rule in rules:
+            self.add(rule)
+
+    def __contains__(self, rule: str) -> bool:
+        return rule in self._rules
+
+    def __len__(self) -> int:
+        return len(self._rules)
+
+    def add(self, rule: str):
+        if rule in self._rules:
+            return
+
+        if _REGEX_RULE_FORMAT.match(rule) is None:
+            raise ValueError("Invalid topic name")
+
+        self._rules.add(rule)
+
+        levels = _parse_rule_levels(rule)
+        if levels is None:
+            self._regex_rules.append((rule, _RegexMatcher(_create_rule_regex(rule))))
+            return
+
+        node = self._root
+        for kind, value in levels:
+            if kind == _LITERAL_LEVEL:
+                node = node.literals.setdefault(value, _RuleNode())
+            elif kind == _SINGLE_LEVEL:
+                if node.single_level is None:
+                    node.single_level = _RuleNode()
+                node = node.single_level
+            else:
+                if node.multi_level is None:
+                    node.multi_level = _RuleNode(repeats=True)
+                node = node.multi_level
+
+        node.rules.append((rule, SegmentMatcher(levels)))
+
+    def match(self, topic: str) -> Dict[str, Dict[str, str]]:
+        topic_levels = topic.split("/")
+
+        matches = dict()
+        for node in self._walk(topic_levels):
+            for rule, matcher in node.rules:
+                # The trie ignores repeated placeholders and empty multi-level matches
+                groups = matcher.match_levels(topic_levels)
+                if groups is not None:
+                    matches[rule] = groups
+
+        for rule, matcher in self._regex_rules:
+            groups = matcher.match(topic)
+            if groups is not None:
+                matches[rule] = groups
+
+        return matches
+
+    def _walk(self, topic_levels: List[str]) -> Iterable[_RuleNode]:
+        nodes = [self._root]
+        for topic_level in topic_levels:
+            # Different paths can lead to the same node through multi-level placeholders
+            next_nodes: Dict[int, _RuleNode] = dict()
+            for node in nodes:
+                literal = node.literals.get(topic_level)
+                if literal is not None:
+                    next_nodes[id(literal)] = literal
+                if node.single_level is not None and topic_level != "":
+                    next_nodes[id(node.single_level)] = node.single_level
+                if node.multi_level is not None:
+                    next_nodes[id(node.multi_level)] = node.multi_level
+                if node.repeats:
+                    next_nodes[id(node)] = node
+
+            if len(next_nodes) == 0:
+                return []
+
+            nodes = next_nodes.values()
+
+        return nodes
+
+
+@dataclass(frozen=True, slots=True)
 class Message:
     sink_topic: TopicName
     message_body: "MessageBody"
+    # Delivery of the received message is used, unless overridden by the processor or the
+    # routed message
+    qos: Optional[int] = None
+    retain: Optional[bool] = None
+    # Set on published messages the local processors already received in-process, their
+    # echo from the broker is dropped
+    echo: bool = False
+
+
+@dataclass(frozen=True, slots=True)
+class MessageProperties:
+    # MQTT v5 properties of a received message, which are passed to functions
+    content_type: Optional[str] = None
+    user_properties: Tuple[Tuple[str, str], ...] = ()
 
 
 class RoutedMessage:
+    # The shape of the payload is classified once, when the message is created
+    __slots__ = ("payload", "qos", "retain", "shape")
+
     payload: Dict[str, Any] | Sequence[Any]
+    qos: Optional[int]
+    retain: Optional[bool]
+    shape: RoutedMessageShape
+
+    def __init__(self, payload: Any, qos: Optional[int] = None, retain: Optional[bool] = None):
+        if qos is not None and qos not in (0, 1, 2):
+            raise ValueError("QoS must be 0, 1 or 2")
 
-    def __init__(self, payload: Any):
         self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.shape = _classify_routed_payload(payload)
 
     @property
     def is_dict_of_routes_and_messages(self) -> bool:
-        return isinstance(self.payload, dict)
+        return self.shape == RoutedMessageShape.DICT_OF_ROUTES_AND_MESSAGES
 
     @property
     def is_list_of_messages_without_routes(self) -> bool:
-        return isinstance(self.payload, list)
+        return self.shape == RoutedMessageShape.LIST_OF_MESSAGES_WITHOUT_ROUTES
 
     @property
     def is_single_route_and_list_of_messages(self) -> bool:
-        return (
-            isinstance(self.payload, tuple)
-            and len(self.payload) == 2
-            and isinstance(self.payload[0], str)
-            and isinstance(self.payload[1], list)
-        )
+        return self.shape == RoutedMessageShape.SINGLE_ROUTE_AND_LIST_OF_MESSAGES
 
     @property
     def is_single_route_and_single_message(self) -> bool:
-        return (
-            isinstance(self.payload, tuple)
-            and len(self.payload) == 2
-            and isinstance(self.payload[0], str)
-            and not isinstance(self.payload[1], list)
-        )
+        return self.shape == RoutedMessageShape.SINGLE_ROUTE_AND_SINGLE_MESSAGE
+
+
+def _classify_routed_payload(payload: Any) -> RoutedMessageShape:
+    if isinstance(payload, dict):
+        return RoutedMessageShape.DICT_OF_ROUTES_AND_MESSAGES
+    elif isinstance(payload, list):
+        return RoutedMessageShape.LIST_OF_MESSAGES_WITHOUT_ROUTES
+    elif isinstance(payload, tuple) and len(payload) == 2 and isinstance(payload[0], str):
+        if isinstance(payload[1], list):
+            return RoutedMessageShape.SINGLE_ROUTE_AND_LIST_OF_MESSAGES
+
+        return RoutedMessageShape.SINGLE_ROUTE_AND_SINGLE_MESSAGE
+
+    return RoutedMessageShape.UNKNOWN
 
 
 MessageBody = Any
 routedmessage = RoutedMessage
+
+
+def set_delivery(
+    messages: Iterable[Message], qos: Optional[int], retain: Optional[bool]
+) -> Iterable[Message]:
+    # Fills in the QoS and the retain flag of messages that don't have their own. Streams
+    # of messages stay lazy.
+    if qos is None and retain is None:
+        return messages
+
+    delivered = (
+        replace(
+            msg,
+            qos=qos if msg.qos is None else msg.qos,
+            retain=retain if msg.retain is None else msg.retain,
+        )
+        for msg in messages
+    )
+
+    return list(delivered) if isinstance(messages, list) else delivered
+
+
+def encode_message_body(message_body: MessageBody) -> bytes:
+    # Mirrors the payload types accepted by the MQTT client, JSON structures of processors
+    # without an output format are sent as JSON
+    if type(message_body) is bytes:
+        return message_body
+    elif isinstance(message_body, bytearray):
+        return bytes(message_body)
+    elif isinstance(message_body, str):
+        return message_body.encode("utf8")
+    elif isinstance(message_body, (int, float)):
+        return str(message_body).encode("ascii")
+    elif message_body is None:
+        return b""
+    elif isinstance(message_body, (dict, list, tuple)):
+        return encode_json(message_body)
+
+    raise TypeError("Unsupported payload type")
+
+
+def topic_rules_overlap(first_rule: str, second_rule: str) -> bool:
+    # Conservative: levels with a wildcard are assumed to match anything, so the rules may
+    # be reported to overlap even if no topic matches both
+    return _levels_overlap(first_rule.split("/"), second_rule.split("/"))
+
+
+def _levels_overlap(first: List[str], second: List[str]) -> bool:
+    if len(first) == 0 or len(second) == 0:
+        return len(first) == len(second)
+
+    if "{W" in first[0]:
+        return any(_levels_overlap(first[1:], second[skip:]) for skip in range(1, len(second) + 1))
+
+    if "{W" in second[0]:
+        return _levels_overlap(second, first)
+
+    return _level_overlaps(first[0], second[0]) and _levels_overlap(first[1:], second[1:])
+
+
+def _level_overlaps(first: str, second: str) -> bool:
+    if "{" in first and "{" in second:
+        return True
+
+    if "{" in first:
+        return _create_rule_regex(first).match(second) is not None
+
+    if "{" in second:
+        return _create_rule_regex(second).match(first) is not None
+
+    return first == second
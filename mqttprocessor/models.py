@@ -4,8 +4,10 @@ from typing import List, Optional, Any, Dict
 
 import pydantic
 
-
-TOPIC_NAME_REGEX_PATTERN = r"^(?:\/?(?:(?:(?:{[^{}\/]+})|(?:[^{}\/]+))+\/?)+)\/?$"
+from mqttprocessor.definitions import (
+    TOPIC_NAME_REGEX_PATTERN, WindowType, RateLimitMode, SourceMatchMode
+)
+from mqttprocessor.messages import topic_rules_overlap
 
 
 class TopicNameModel(pydantic.BaseModel):
@@ -20,11 +22,39 @@ class MessageFormat(Enum):
     BINARY = "binary"
     STRING = "string"
     JSON = "json"
+    MSGPACK = "msgpack"
+    CBOR = "cbor"
+    PROTOBUF = "protobuf"
+
+
+class PayloadCompression(Enum):
+    GZIP = "gzip"
+    ZSTD = "zstd"
+    LZ4 = "lz4"
+
+
+class CompressionModel(pydantic.BaseModel):
+    type: PayloadCompression
+    level: Optional[int]
+    dictionary: Optional[str]
+
+    @pydantic.root_validator(skip_on_failure=True)
+    def dictionary_of_zstd(cls, values):
+        if values.get("dictionary") is not None and values["type"] != PayloadCompression.ZSTD:
+            raise ValueError("Only zstd compression supports `dictionary`")
+
+        return values
+
+
+class StateModel(pydantic.BaseModel):
+    max_keys: pydantic.PositiveInt = 100000
+    ttl: Optional[pydantic.PositiveFloat]
 
 
 class ExtendedFunctionModel(pydantic.BaseModel):
     name: FunctionNameModel
     arguments: Optional[Dict[str, Any]]
+    state: Optional[StateModel]
 
     @pydantic.root_validator(pre=True)
     def args_set(cls, values):
@@ -34,12 +64,83 @@ class ExtendedFunctionModel(pydantic.BaseModel):
         return values
 
 
+class WindowModel(pydantic.BaseModel):
+    type: WindowType = WindowType.TUMBLING
+    size: Optional[pydantic.PositiveFloat]
+    slide: Optional[pydantic.PositiveFloat]
+    gap: Optional[pydantic.PositiveFloat]
+    key: str = "topic"
+    field: Optional[str]
+    aggregates: List[
+        pydantic.constr(regex=r"^(count|sum|mean|min|max|p(100|[0-9]{1,2}(\.[0-9]+)?))$")
+    ] = ["count", "mean"]
+    max_keys: pydantic.PositiveInt = 10000
+    max_samples: pydantic.PositiveInt = 10000
+
+    @pydantic.root_validator(skip_on_failure=True)
+    def check_window_duration(cls, values):
+        if values["type"] == WindowType.SESSION:
+            if values.get("gap") is None:
+                raise ValueError("Session window requires `gap`")
+        elif values.get("size") is None:
+            raise ValueError("Tumbling and sliding windows require `size`")
+
+        return values
+
+
+class RateLimitModel(pydantic.BaseModel):
+    rate: pydantic.PositiveFloat
+    burst: pydantic.PositiveInt = 1
+    key: str = "topic"
+    mode: RateLimitMode = RateLimitMode.DROP
+    max_queue: pydantic.PositiveInt = 1000
+
+
+class JoinModel(pydantic.BaseModel):
+    key: str
+    fields: Optional[List[str]]
+    trigger: Optional[List[str]]
+    require_all: bool = True
+    max_keys: pydantic.PositiveInt = 100000
+    ttl: Optional[pydantic.PositiveFloat]
+
+    @pydantic.validator("trigger", pre=True)
+    def trigger_to_list(cls, value):
+        if isinstance(value, str):
+            return [value]
+
+        return value
+
+
+class ErrorPolicyModel(pydantic.BaseModel):
+    retries: pydantic.conint(ge=0) = 0
+    backoff: pydantic.PositiveFloat = 1.0
+    max_backoff: pydantic.PositiveFloat = 60.0
+    max_queue: pydantic.PositiveInt = 1000
+    dead_letter: Optional[TopicNameModel]
+    log_interval: pydantic.confloat(ge=0) = 10.0
+
+
 class ProcessorConfigModel(pydantic.BaseModel):
     name: Optional[str]
     source: List[TopicNameModel]
     sink: Optional[TopicNameModel]
     function: List[ExtendedFunctionModel]
     input_format: Optional[MessageFormat] = MessageFormat.JSON
+    output_format: Optional[MessageFormat]
+    protobuf_type: Optional[str]
+    input_compression: Optional[CompressionModel]
+    output_compression: Optional[CompressionModel]
+    json_fields: Optional[List[pydantic.constr(regex=r"^[^.]+(\.[^.]+)*$")]]
+    window: Optional[WindowModel]
+    rate_limit: Optional[RateLimitModel]
+    join: Optional[JoinModel]
+    internal: bool = False
+    publish: Optional[bool]
+    qos: Optional[pydantic.conint(ge=0, le=2)]
+    retain: Optional[bool]
+    match: SourceMatchMode = SourceMatchMode.FIRST_OUTPUT
+    on_error: Optional[ErrorPolicyModel]
 
     @pydantic.root_validator(pre=True)
     def unify_function_format(cls, values):
@@ -65,6 +166,13 @@ class ProcessorConfigModel(pydantic.BaseModel):
         else:
             return function
 
+    @pydantic.validator("input_compression", "output_compression", pre=True)
+    def compression_to_model(cls, value):
+        if isinstance(value, str):
+            return {"type": value}
+
+        return value
+
     @pydantic.root_validator(pre=True)
     def source_to_list(cls, values):
         if "source" not in values:
@@ -75,6 +183,74 @@ class ProcessorConfigModel(pydantic.BaseModel):
 
         return values
 
+    @pydantic.root_validator(skip_on_failure=True)
+    def window_has_sink(cls, values):
+        if values.get("window") is not None and values.get("sink") is None:
+            raise ValueError("Processor with a window requires `sink`")
+
+        return values
+
+    @pydantic.root_validator(skip_on_failure=True)
+    def protobuf_has_type(cls, values):
+        formats = (values.get("input_format"), values.get("output_format"))
+        if MessageFormat.PROTOBUF in formats and values.get("protobuf_type") is None:
+            raise ValueError("The protobuf format requires `protobuf_type`")
+
+        return values
+
+    @pydantic.root_validator(skip_on_failure=True)
+    def json_fields_of_json_input(cls, values):
+        if values.get("json_fields") is None:
+            return values
+
+        if values.get("input_format") != MessageFormat.JSON:
+            raise ValueError("`json_fields` require the json `input_format`")
+        if len(values["json_fields"]) == 0:
+            raise ValueError("`json_fields` require at least one field")
+
+        return values
+
+    @pydantic.root_validator(skip_on_failure=True)
+    def join_matches_sources(cls, values):
+        join = values.get("join")
+        if join is None:
+            return values
+
+        sources = [source.__root__ for source in values["source"]]
+        if len(sources) < 2:
+            raise ValueError("Join requires at least two sources")
+
+        if values.get("match") == SourceMatchMode.ALL_MATCHES:
+            raise ValueError("Joined messages are joined once, as the value of the first matching source")
+
+        on_error = values.get("on_error")
+        if on_error is not None and on_error.retries > 0:
+            raise ValueError("Joined messages can't be retried, they would be joined again")
+
+        for source in sources:
+            if "{" + join.key + "}" not in source:
+                raise ValueError(f"Join key `{join.key}` is not a wildcard of source `{source}`")
+
+        if join.fields is None:
+            join.fields = sources
+        elif len(join.fields) != len(sources) or len(set(join.fields)) != len(sources):
+            raise ValueError("Join requires one unique field name per source")
+
+        if join.trigger is not None and not set(join.trigger) <= set(join.fields):
+            raise ValueError("Join triggers must be join fields")
+
+        return values
+
+    @pydantic.root_validator(skip_on_failure=True)
+    def set_default_publish(cls, values):
+        # Messages routed internally are published only if asked for
+        if values.get("publish") is None:
+            values["publish"] = not values["internal"]
+        elif not values["publish"] and not values["internal"]:
+            raise ValueError("Processor has to either `publish` its messages or be `internal`")
+
+        return values
+
     @pydantic.root_validator
     def set_default_name(cls, values):
         name, function = values.get("name"), values.get("function")
@@ -92,3 +268,44 @@ class ProcessorConfigModel(pydantic.BaseModel):
 
 class ConfigModel(pydantic.BaseModel):
     processors: List[ProcessorConfigModel]
+
+    @pydantic.validator("processors")
+    def internal_routes_are_acyclic(cls, processors):
+        routes = {
+            index: [
+                target for target, target_processor in enumerate(processors)
+                if any(
+                    topic_rules_overlap(processor.sink.__root__, source.__root__)
+                    for source in target_processor.source
+                )
+            ]
+            for index, processor in enumerate(processors)
+            if processor.internal and processor.sink is not None
+        }
+
+        visited = set()
+        for start in routes:
+            cycle = cls._find_route_cycle(start, routes, visited, [])
+            if cycle is not None:
+                names = " -> ".join(processors[index].name for index in cycle)
+                raise ValueError(f"Internal routes form a cycle: {names}")
+
+        return processors
+
+    @classmethod
+    def _find_route_cycle(
+        cls, index: int, routes: Dict[int, List[int]], visited: set, path: List[int]
+    ) -> Optional[List[int]]:
+        if index in path:
+            return path[path.index(index):] + [index]
+
+        if index in visited:
+            return None
+
+        visited.add(index)
+        for target in routes.get(index, []):
+            cycle = cls._find_route_cycle(target, routes, visited, path + [index])
+            if cycle is not None:
+                return cycle
+
+        return None
@@ -0,0 +1,189 @@
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Iterable, Optional, Sequence, Tuple, TYPE_CHECKING
+
+from mqttprocessor.messages import Message, encode_message_body
+
+if TYPE_CHECKING:
+    from paho.mqtt.client import Client, MQTTMessage, MQTTMessageInfo
+
+UserProperties = Sequence[Tuple[str, str]]
+
+# User property tagging the published messages the local processors already received
+ECHO_PROPERTY = "mqttprocessor-echo"
+
+
+class TopicAliasTable:
+    # Aliases are assigned to the most recently published topics. Once all of them are
+    # used, the alias of the least recently published topic is reassigned.
+    _maximum: int
+    _aliases: "OrderedDict[str, int]"
+    _lock: threading.Lock
+
+    @property
+    def maximum(self) -> int:
+        return self._maximum
+
+    def __init__(self, maximum: int = 0):
+        self._maximum = maximum
+        self._aliases = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._aliases)
+
+    def reset(self, maximum: int):
+        # Aliases are valid only within a single connection
+        with self._lock:
+            self._maximum = maximum
+            self._aliases.clear()
+
+    def resolve(self, topic: str) -> Tuple[str, Optional[int]]:
+        # Returns the topic to be sent with the alias, the topic is empty once the broker
+        # already knows the alias
+        with self._lock:
+            if self._maximum == 0:
+                return topic, None
+
+            alias = self._aliases.get(topic)
+            if alias is not None:
+                self._aliases.move_to_end(topic)
+                return "", alias
+
+            if len(self._aliases) < self._maximum:
+                alias = len(self._aliases) + 1
+            else:
+                _, alias = self._aliases.popitem(last=False)
+
+            self._aliases[topic] = alias
+            return topic, alias
+
+
+class Publisher:
+    _logger: logging.Logger
+    _client: "Client"
+    _v5: bool
+    _message_expiry: Optional[int]
+    _topic_alias_maximum: int
+    _topic_aliases: TopicAliasTable
+    _max_buffered: int
+    _buffer_timeout: float
+    _buffered: "deque[MQTTMessageInfo]"
+    _echo_tag: Optional[Tuple[str, str]]
+
+    @property
+    def topic_aliases(self) -> TopicAliasTable:
+        return self._topic_aliases
+
+    @property
+    def tags_echoes(self) -> bool:
+        return self._echo_tag is not None
+
+    def __init__(
+        self,
+        client: "Client",
+        v5: bool = False,
+        message_expiry: Optional[int] = None,
+        topic_alias_maximum: int = 0,
+        max_buffered: int = 1000,
+        buffer_timeout: float = 10.0,
+        echo_tag: Optional[str] = None,
+    ):
+        self._logger = logging.getLogger(__name__)
+        self._client = client
+        self._v5 = v5
+        self._message_expiry = message_expiry
+        self._topic_alias_maximum = topic_alias_maximum if v5 else 0
+        self._topic_aliases = TopicAliasTable(0)
+        self._max_buffered = max_buffered
+        self._buffer_timeout = buffer_timeout
+        self._buffered = deque()
+        # Just MQTT v5 messages can carry the tag
+        self._echo_tag = None if echo_tag is None or not v5 else (ECHO_PROPERTY, echo_tag)
+
+    def connected(self, broker_topic_alias_maximum: int):
+        # The broker limits the aliases it accepts from clients in its CONNACK
+        self._topic_aliases.reset(min(self._topic_alias_maximum, broker_topic_alias_maximum))
+
+    def is_echo(self, message: "MQTTMessage") -> bool:
+        if self._echo_tag is None:
+            return False
+
+        properties = getattr(message, "properties", None)
+        return self._echo_tag in getattr(properties, "UserProperty", ())
+
+    def publish(
+        self, messages: Iterable[Message], qos: int, retain: bool,
+        user_properties: Optional[UserProperties] = None,
+    ):
+        for msg in messages:
+            topic = msg.sink_topic.rule
+            msg_qos = qos if msg.qos is None else msg.qos
+            msg_retain = retain if msg.retain is None else msg.retain
+            self._logger.debug("Sending message to %s", topic)
+
+            # Bodies encoded by the output format pass through unchanged
+            try:
+                payload = encode_message_body(msg.message_body)
+            except TypeError:
+                self._logger.error(
+                    "Message for %s has unsupported payload type %s",
+                    topic, type(msg.message_body).__name__
+                )
+                continue
+
+            if not self._v5:
+                info = self._client.publish(topic, payload, qos=msg_qos, retain=msg_retain)
+                self._limit_buffered(info)
+                continue
+
+            # Messages with a QoS above 0 may be resent after a reconnection, when the alias
+            # is no longer known, so they always carry the topic
+            alias = None
+            if msg_qos == 0:
+                topic, alias = self._topic_aliases.resolve(topic)
+
+            msg_user_properties = user_properties
+            if msg.echo and self._echo_tag is not None:
+                msg_user_properties = (*(user_properties or ()), self._echo_tag)
+
+            info = self._client.publish(
+                topic, payload, qos=msg_qos, retain=msg_retain,
+                properties=self._create_properties(alias, msg_user_properties),
+            )
+            self._limit_buffered(info)
+
+    def _limit_buffered(self, info: Optional["MQTTMessageInfo"]):
+        # Streams produce messages faster than the client sends them, so once too many are
+        # buffered, publishing waits until the oldest one is sent
+        if info is None or info.rc != 0:
+            return
+
+        self._buffered.append(info)
+        if len(self._buffered) <= self._max_buffered:
+            return
+
+        oldest = self._buffered.popleft()
+        oldest.wait_for_publish(self._buffer_timeout)
+        if not oldest.is_published():
+            self._logger.warning("Buffered messages are not being sent, not waiting for them")
+            self._buffered.clear()
+
+    def _create_properties(
+        self, alias: Optional[int], user_properties: Optional[UserProperties]
+    ):
+        from paho.mqtt.packettypes import PacketTypes
+        from paho.mqtt.properties import Properties
+
+        properties = Properties(PacketTypes.PUBLISH)
+        if alias is not None:
+            properties.TopicAlias = alias
+
+        if self._message_expiry is not None:
+            properties.MessageExpiryInterval = self._message_expiry
+
+        if user_properties:
+            properties.UserProperty = list(user_properties)
+
+        return properties
@@ -0,0 +1,166 @@
+import logging
+import threading
+import time
+from pathlib import Path
+from queue import Queue, Empty, Full
+from typing import BinaryIO, Tuple
+
+from mqttprocessor.capture import (
+    CAPTURE_MAGIC,
+    CapturedMessage,
+    CaptureCompression,
+    CaptureFormat,
+    CaptureWriter,
+    open_capture_for_writing,
+)
+
+_STOP = object()
+
+
+class CaptureRecorder:
+    _logger: logging.Logger
+    _path: Path
+    _compression: CaptureCompression
+    _compression_level: int | None
+    _max_bytes: int | None
+    _flush_interval: float
+    _queue: Queue
+    _thread: threading.Thread | None
+    _segment_index: int
+    _failed: bool
+    _dropped: int
+    _reported_dropped: int
+
+    @property
+    def dropped(self) -> int:
+        return self._dropped
+
+    def __init__(
+        self,
+        path: str,
+        compression: CaptureCompression = CaptureCompression.NONE,
+        compression_level: int | None = None,
+        max_bytes: int | None = None,
+        flush_interval: float = 1.0,
+        max_queue: int = 10000,
+    ):
+        self._logger = logging.getLogger(__name__)
+        self._path = Path(path)
+        self._compression = compression
+        self._compression_level = compression_level
+        self._max_bytes = max_bytes
+        self._flush_interval = flush_interval
+        self._queue = Queue(max_queue)
+        self._thread = None
+        self._segment_index = self._find_next_segment_index()
+        self._failed = False
+        self._dropped = 0
+        self._reported_dropped = 0
+
+    def record(self, topic: str, payload: bytes, qos: int, retain: bool):
+        # Called from the MQTT network thread, so everything else is left to the writer. When
+        # the writer can't keep up, messages are dropped from the capture instead of blocking.
+        if self._failed:
+            return
+
+        try:
+            self._queue.put_nowait((topic, payload, qos, retain, time.monotonic()))
+        except Full:
+            self._dropped += 1
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._write_records, name="CaptureRecorder", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+
+        # The writer stops consuming the queue when it fails
+        while self._thread.is_alive():
+            try:
+                self._queue.put(_STOP, timeout=self._flush_interval)
+                break
+            except Full:
+                continue
+
+        self._thread.join()
+        self._thread = None
+        self._report_dropped()
+
+    def segment_path(self, index: int) -> Path:
+        return self._path.with_name(
+            "{0}.{1:06d}{2}".format(self._path.stem, index, self._path.suffix)
+        )
+
+    def _find_next_segment_index(self) -> int:
+        index = 0
+        while self.segment_path(index).exists():
+            index += 1
+
+        return index
+
+    def _write_records(self):
+        try:
+            stream, writer = self._open_segment()
+        except Exception:
+            self._fail()
+            return
+
+        segment_size = len(CAPTURE_MAGIC)
+
+        while True:
+            try:
+                item = self._queue.get(timeout=self._flush_interval)
+            except Empty:
+                stream.flush()
+                self._report_dropped()
+                continue
+
+            if item is _STOP:
+                break
+
+            try:
+                segment_size += writer.write(CapturedMessage(*item))
+            except Exception:
+                self._logger.exception("Failed to write captured message")
+                continue
+
+            if self._max_bytes is not None and segment_size >= self._max_bytes:
+                stream.close()
+                try:
+                    stream, writer = self._open_segment()
+                except Exception:
+                    self._fail()
+                    return
+
+                segment_size = len(CAPTURE_MAGIC)
+                self._report_dropped()
+
+        stream.close()
+
+    def _fail(self):
+        self._logger.exception("Failed to open capture segment, recording stopped")
+        self._failed = True
+
+    def _report_dropped(self):
+        dropped = self._dropped
+        if dropped > self._reported_dropped:
+            self._logger.warning(
+                "Capture writer can't keep up, %s messages were not recorded",
+                dropped - self._reported_dropped
+            )
+            self._reported_dropped = dropped
+
+    def _open_segment(self) -> Tuple[BinaryIO, CaptureWriter]:
+        path = self.segment_path(self._segment_index)
+        self._segment_index += 1
+        self._logger.info("Recording traffic to %s", path)
+
+        stream = open_capture_for_writing(
+            str(path), self._compression, self._compression_level
+        )
+
+        return stream, CaptureWriter(stream, CaptureFormat.BINARY)
@@ -0,0 +1,318 @@
+import glob
+import itertools
+import logging
+import math
+import multiprocessing
+import os
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, List, Tuple, TYPE_CHECKING
+
+from mqttprocessor.app import _create_processors, _load_config
+from mqttprocessor.capture import (
+    CapturedMessage,
+    CaptureFormat,
+    CaptureWriter,
+    MappedCapture,
+    open_capture,
+    read_capture,
+)
+from mqttprocessor.dispatch import Dispatcher
+from mqttprocessor.messages import Message, encode_message_body
+
+if TYPE_CHECKING:
+    from mqttprocessor.models import ConfigModel
+
+_logger: logging.Logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ReplayParameters:
+    config_file_path: str
+    config_cache_dir: str | None
+    input_file_path: str
+    output_file_path: str | None
+    recorded_pace: bool
+    workers: int
+    log_level: str
+
+
+@dataclass(frozen=True)
+class ReplayStatistics:
+    input_messages: int
+    output_messages: int
+    failed_messages: int
+    elapsed_seconds: float
+
+    @property
+    def input_throughput(self) -> float:
+        if self.elapsed_seconds == 0:
+            return 0.0
+
+        return self.input_messages / self.elapsed_seconds
+
+    @property
+    def output_throughput(self) -> float:
+        if self.elapsed_seconds == 0:
+            return 0.0
+
+        return self.output_messages / self.elapsed_seconds
+
+
+def _load_env() -> ReplayParameters:
+    return ReplayParameters(
+        config_file_path=os.getenv("CONFIG_FILE", "config.yaml"),
+        config_cache_dir=os.getenv("CONFIG_CACHE_DIR") or None,
+        input_file_path=os.getenv("REPLAY_INPUT_FILE"),
+        output_file_path=os.getenv("REPLAY_OUTPUT_FILE") or None,
+        recorded_pace=os.getenv("REPLAY_PACE", "max").lower() == "recorded",
+        workers=int(os.getenv("REPLAY_WORKERS", 1)),
+        log_level=os.getenv("LOG_LEVEL", "WARNING").upper()
+    )
+
+
+def replay(
+    dispatcher: Dispatcher,
+    captured_messages: Iterable[CapturedMessage],
+    writer: Optional[CaptureWriter] = None,
+    recorded_pace: bool = False,
+) -> ReplayStatistics:
+    input_messages = 0
+    output_messages = 0
+    failed_messages = 0
+
+    first_timestamp: float | None = None
+    last_timestamp: float | None = None
+    start = time.perf_counter()
+
+    def write_output_messages(messages: Iterable[Message], qos: int, retain: bool):
+        nonlocal output_messages, failed_messages
+
+        for msg in messages:
+            if _write_output_message(writer, msg, qos, retain, last_timestamp):
+                output_messages += 1
+            else:
+                failed_messages += 1
+
+    for captured_message in captured_messages:
+        timestamp = captured_message.timestamp
+        if timestamp is not None:
+            if first_timestamp is None:
+                first_timestamp = timestamp
+
+            if recorded_pace:
+                _wait_until(start + timestamp - first_timestamp)
+
+            # Windows are driven by the recorded time, not by the time of the replay
+            last_timestamp = timestamp
+            write_output_messages(dispatcher.tick(timestamp), qos=0, retain=False)
+
+        input_messages += 1
+        write_output_messages(
+            dispatcher.process_message(
+                captured_message.topic, captured_message.payload, timestamp,
+                qos=captured_message.qos, retain=captured_message.retain,
+            ),
+            qos=captured_message.qos, retain=captured_message.retain
+        )
+
+    # End of the capture closes all pending windows
+    write_output_messages(dispatcher.tick(math.inf), qos=0, retain=False)
+
+    if writer is not None:
+        writer.flush()
+
+    return ReplayStatistics(
+        input_messages=input_messages,
+        output_messages=output_messages,
+        failed_messages=failed_messages,
+        elapsed_seconds=time.perf_counter() - start,
+    )
+
+
+def replay_parallel(
+    config_file_path: str,
+    capture_paths: List[str],
+    workers: int,
+    output_file_path: str | None = None,
+    config_cache_dir: str | None = None,
+) -> ReplayStatistics:
+    # Messages are partitioned by their topic, so every worker gets all the messages of its
+    # topics in the recorded order and the state kept per topic is complete
+    _check_partitioned_state(_load_config(config_file_path, config_cache_dir))
+
+    # The captures are partitioned once, every worker then reads just its own records
+    capture_partitions = list()
+    for capture_path in capture_paths:
+        with MappedCapture(capture_path) as capture:
+            capture_partitions.append((capture_path, capture.partition(workers)))
+
+    tasks = [
+        (
+            config_file_path, config_cache_dir,
+            [(capture_path, records[partition]) for capture_path, records in capture_partitions],
+            None if output_file_path is None else _get_part_path(output_file_path, partition),
+        )
+        for partition in range(workers)
+    ]
+
+    # Processors hold closures that can't be pickled, so every worker builds its own. Forked
+    # workers inherit the registered functions of the parent.
+    start = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("fork"),
+    ) as executor:
+        partial_statistics = list(executor.map(_replay_partition, tasks))
+
+    return ReplayStatistics(
+        input_messages=sum(s.input_messages for s in partial_statistics),
+        output_messages=sum(s.output_messages for s in partial_statistics),
+        failed_messages=sum(s.failed_messages for s in partial_statistics),
+        elapsed_seconds=time.perf_counter() - start,
+    )
+
+
+def _check_partitioned_state(config: "ConfigModel"):
+    for processor in config.processors:
+        keys = [
+            stage.key for stage in (processor.window, processor.rate_limit) if stage is not None
+        ]
+        if processor.join is not None or any(key != "topic" for key in keys):
+            raise ValueError(
+                f"Processor {processor.name} keeps state across topics, "
+                "it can't be replayed by more workers"
+            )
+
+
+def _get_part_path(output_file_path: str, part: int) -> str:
+    path = Path(output_file_path)
+    return str(path.with_name("{0}.{1:06d}{2}".format(path.stem, part, path.suffix)))
+
+
+def _replay_partition(
+    task: Tuple[str, str | None, List[Tuple[str, array]], str | None]
+) -> ReplayStatistics:
+    config_file_path, config_cache_dir, capture_records, output_file_path = task
+
+    dispatcher = Dispatcher(_create_processors(config_file_path, config_cache_dir))
+    captured_messages = _read_partition(capture_records)
+
+    if output_file_path is None:
+        return replay(dispatcher, captured_messages)
+
+    with open(output_file_path, "wb") as output_stream:
+        writer = CaptureWriter(output_stream, CaptureFormat.from_path(output_file_path))
+        return replay(dispatcher, captured_messages, writer)
+
+
+def _read_partition(capture_records: List[Tuple[str, array]]) -> Iterator[CapturedMessage]:
+    for capture_path, records in capture_records:
+        with MappedCapture(capture_path) as capture:
+            # Payloads are copied only here, because functions expect bytes, not views
+            yield from (view.to_message() for view in capture.select(records))
+
+
+def _wait_until(deadline: float):
+    delay = deadline - time.perf_counter()
+    if delay > 0:
+        time.sleep(delay)
+
+
+def _write_output_message(
+    writer: Optional[CaptureWriter], msg: Message, qos: int, retain: bool,
+    timestamp: Optional[float]
+) -> bool:
+    if msg.sink_topic is None:
+        _logger.error("Message produced without sink topic, ignoring")
+        return False
+
+    try:
+        payload = encode_message_body(msg.message_body)
+    except TypeError:
+        _logger.error(
+            "Message for %s has unsupported payload type %s",
+            msg.sink_topic.rule, type(msg.message_body).__name__
+        )
+        return False
+
+    if writer is not None:
+        writer.write(
+            CapturedMessage(
+                topic=msg.sink_topic.rule,
+                payload=payload,
+                qos=qos if msg.qos is None else msg.qos,
+                retain=retain if msg.retain is None else msg.retain,
+                timestamp=timestamp,
+            )
+        )
+
+    return True
+
+
+def _find_capture_files(path_pattern: str) -> List[str]:
+    # Recorded captures are split to segments, which are replayed in order
+    return sorted(glob.glob(path_pattern)) or [path_pattern]
+
+
+def _read_capture_files(paths: List[str]) -> Iterator[CapturedMessage]:
+    return itertools.chain.from_iterable(
+        _read_capture_file(path) for path in paths
+    )
+
+
+def _read_capture_file(path: str) -> Iterator[CapturedMessage]:
+    with open_capture(path) as stream:
+        yield from read_capture(stream)
+
+
+def run_replay() -> ReplayStatistics:
+    env = _load_env()
+    logging.basicConfig(level=logging.getLevelName(env.log_level))
+    capture_paths = _find_capture_files(env.input_file_path)
+
+    if env.workers > 1:
+        statistics = replay_parallel(
+            env.config_file_path,
+            capture_paths,
+            env.workers,
+            env.output_file_path,
+            env.config_cache_dir,
+        )
+        _print_statistics(statistics)
+        return statistics
+
+    dispatcher = Dispatcher(
+        _create_processors(env.config_file_path, env.config_cache_dir)
+    )
+
+    captured_messages = _read_capture_files(capture_paths)
+
+    if env.output_file_path is None:
+        statistics = replay(
+            dispatcher, captured_messages, recorded_pace=env.recorded_pace
+        )
+    else:
+        with open(env.output_file_path, "wb") as output_stream:
+            writer = CaptureWriter(
+                output_stream, CaptureFormat.from_path(env.output_file_path)
+            )
+            statistics = replay(
+                dispatcher, captured_messages, writer, env.recorded_pace
+            )
+
+    _print_statistics(statistics)
+    return statistics
+
+
+def _print_statistics(statistics: ReplayStatistics):
+    print(
+        "Replayed {0} messages into {1} messages ({2} failed) in {3:.3f} s, "
+        "{4:.0f} msg/s in, {5:.0f} msg/s out".format(
+            statistics.input_messages, statistics.output_messages,
+            statistics.failed_messages, statistics.elapsed_seconds,
+            statistics.input_throughput, statistics.output_throughput,
+        )
+    )
@@ -1,15 +1,29 @@
 import itertools
 import logging
-from typing import List, Optional, Any, Dict
-
-from mqttprocessor.definitions import ProcessorFunctionType
-from mqttprocessor.messages import RoutedMessage, TopicName, Message, MessageBody
-from mqttprocessor.models import (
-    ProcessorConfigModel,
-    MessageFormat,
-    ExtendedFunctionModel,
+import time
+from dataclasses import replace
+from types import GeneratorType
+from typing import (
+    List, Optional, Any, Callable, Dict, Generator, Iterable, Iterator, Tuple, TYPE_CHECKING
 )
+
+from mqttprocessor.definitions import ProcessorFunctionType, RoutedMessageShape, SourceMatchMode
+from mqttprocessor.errors import ErrorPolicy, FailedMessage, FunctionFailure
+from mqttprocessor.fanout import MessageContext, copy_value
+from mqttprocessor.messages import RoutedMessage, TopicName, Message, MessageBody, set_delivery
 from mqttprocessor.functions import ProcessorFunction, create_functions
+from mqttprocessor.joining import JoinStage
+from mqttprocessor.state import StateBackend
+from mqttprocessor.throttling import RateLimiter
+from mqttprocessor.windowing import WindowStage
+
+if TYPE_CHECKING:
+    from mqttprocessor.models import ProcessorConfigModel, ExtendedFunctionModel, CompressionModel
+
+_MISSING = object()
+_STOPPED = object()
+_UNSHAREABLE = object()
+_RESTART = object()
 
 
 class SingleSourceProcessor:
@@ -17,79 +31,383 @@ class SingleSourceProcessor:
     _logger: logging.Logger
     _source_topic_rule: TopicName
     _functions: List[ProcessorFunction]
+    _input_functions: List[ProcessorFunction]
     _default_sink_topic: Optional[TopicName]
+    _window: Optional[WindowStage]
+    _rate_limiter: Optional[RateLimiter]
+    _join: Optional[JoinStage]
+    _join_field: Optional[str]
+    _shared_stages: List[int]
+    _stage_consumers: int
+    _error_policy: ErrorPolicy
 
     @property
     def source_topic(self) -> TopicName:
         return TopicName(self._source_topic_rule.rule)
 
+    @property
+    def stage_functions(self) -> List[ProcessorFunction]:
+        # Functions applied directly to the received message, which can be shared
+        return self._input_functions if self._join is not None else self._functions
+
     def __init__(
         self,
         name: str,
         functions: List[ProcessorFunction],
         source_topic_rule: TopicName,
         default_sink_topic: Optional[TopicName],
+        window: Optional[WindowStage] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        input_functions: Optional[List[ProcessorFunction]] = None,
+        join: Optional[JoinStage] = None,
+        join_field: Optional[str] = None,
+        error_policy: Optional[ErrorPolicy] = None,
     ):
         self._logger = logging.getLogger(
             __name__ + "=" + name + "@" + source_topic_rule.rule
         )
-        self._functions = functions
+        self._error_policy = ErrorPolicy(name) if error_policy is None else error_policy
         self._source_topic_rule = source_topic_rule
         self._default_sink_topic = default_sink_topic
+        self._window = window
+        self._rate_limiter = rate_limiter
+        self._join = join
+        self._join_field = join_field
+        self._shared_stages = []
+        self._stage_consumers = 0
+
+        # Joined messages are decoded one by one, but processed together
+        input_functions = [] if input_functions is None else input_functions
+        if join is None:
+            self._input_functions = []
+            self._functions = input_functions + functions
+        else:
+            self._input_functions = input_functions
+            self._functions = functions
+
+    def share_stages(self, stages: List[int], consumers: int):
+        self._shared_stages = stages
+        self._stage_consumers = consumers
+
+    def match(self, context: MessageContext) -> Optional[Dict[str, str]]:
+        return context.match(self._source_topic_rule)
 
     def process_message(
-        self, actual_source_topic: str, message: MessageBody
-    ) -> List[Message]:
+        self, actual_source_topic: str, message: MessageBody,
+        timestamp: Optional[float] = None, context: Optional[MessageContext] = None,
+    ) -> Iterable[Message]:
         self._logger.debug("Received message to topic %s", actual_source_topic)
-        actual_source_topic = TopicName(actual_source_topic)
+        if context is None:
+            context = MessageContext(TopicName(actual_source_topic))
 
-        matches = self._source_topic_rule.matches(actual_source_topic)
+        matches = self.match(context)
         if matches is None:
             return []
 
-        output_message_body = self._process_message_content(message, actual_source_topic, matches)
-        return self._create_message_with_destination(
-            actual_source_topic, output_message_body
+        return self.process_matched_message(context, matches, message, timestamp)
+
+    def process_matched_message(
+        self, context: MessageContext, matches: Dict[str, str], message: MessageBody,
+        timestamp: Optional[float] = None, attempts: int = 0,
+    ) -> Iterable[Message]:
+        actual_source_topic = context.source_topic
+        if timestamp is None:
+            timestamp = time.time() if context.timestamp is None else context.timestamp
+        context.timestamp = timestamp
+
+        if self._join is not None:
+            joined_message = self._join_message(context, matches, message, timestamp)
+            if joined_message is None:
+                return []
+
+            output_message_body = joined_message
+            if not isinstance(joined_message, FunctionFailure):
+                output_message_body = self._run_functions(
+                    self._functions, joined_message, context, matches
+                )
+        else:
+            output_message_body = self._run_shared_functions(
+                self._functions, message, context, matches
+            )
+
+        if isinstance(output_message_body, FunctionFailure):
+            self._handle_failure(
+                context, matches, message, output_message_body, attempts + 1, timestamp
+            )
+            return []
+
+        if self._window is not None:
+            output_messages = self._add_to_window(
+                actual_source_topic, matches, output_message_body, timestamp
+            )
+        elif isinstance(output_message_body, GeneratorType):
+            return self._stream_messages(
+                actual_source_topic, matches, output_message_body, timestamp
+            )
+        else:
+            output_messages = self._create_message_with_destination(
+                actual_source_topic, output_message_body
+            )
+
+        if self._rate_limiter is not None and len(output_messages) > 0:
+            return self._rate_limiter.limit(output_messages, matches, timestamp)
+
+        return output_messages
+
+    def retry(self, failed: FailedMessage, now: float) -> List[Message]:
+        context = MessageContext(
+            TopicName(failed.source_topic), failed.properties,
+            qos=failed.qos, retain=failed.retain,
+        )
+        return list(self.process_matched_message(
+            context, failed.matches, failed.body, now, failed.attempts
+        ))
+
+    def _handle_failure(
+        self, context: MessageContext, matches: Dict[str, str], message: MessageBody,
+        failure: FunctionFailure, attempts: int, timestamp: float,
+    ):
+        failed = FailedMessage(
+            self, context.source_topic.rule, context.properties, matches, message,
+            failure, attempts, timestamp, context.qos, context.retain,
+        )
+        if self._error_policy.retry(failed, timestamp):
+            return
+
+        dead_letter_topic = self.get_dead_letter_topic(context.source_topic)
+        if dead_letter_topic is not None:
+            self._error_policy.add_dead_letter(failed, dead_letter_topic)
+
+    def get_dead_letter_topic(self, actual_source_topic: TopicName) -> Optional[TopicName]:
+        dead_letter = self._error_policy.dead_letter
+        if dead_letter is None:
+            return None
+
+        return self._get_sink_topic(actual_source_topic, dead_letter)
+
+    def _stream_messages(
+        self, actual_source_topic: TopicName, source_topic_matches: Dict[str, str],
+        stream: Generator[MessageBody, None, None], timestamp: float
+    ) -> Iterator[Message]:
+        # Messages yielded by a generator converter are routed one by one, as they are
+        # consumed by the publisher, so the whole output is never held in memory
+        sink_topic = _MISSING
+        while True:
+            try:
+                body = next(stream)
+            except StopIteration:
+                return
+            except Exception as e:
+                # Part of the stream may be sent already, so it isn't retried
+                self._error_policy.failure_log.failed(stream.__name__, e)
+                return
+
+            if body is None:
+                continue
+            elif isinstance(body, RoutedMessage):
+                output_messages = list(self._decompose_routed_messages(
+                    actual_source_topic, self._default_sink_topic, body
+                ))
+            else:
+                if sink_topic is _MISSING:
+                    sink_topic = self._get_sink_topic(actual_source_topic, self._default_sink_topic)
+                output_messages = [Message(sink_topic, body)]
+
+            if self._rate_limiter is not None and len(output_messages) > 0:
+                output_messages = self._rate_limiter.limit(
+                    output_messages, source_topic_matches, timestamp
+                )
+
+            yield from output_messages
+
+    def _add_to_window(
+        self, actual_source_topic: TopicName, source_topic_matches: Dict[str, str],
+        output_message_body: MessageBody, timestamp: float
+    ) -> List[Message]:
+        if output_message_body is None:
+            return []
+
+        if isinstance(output_message_body, RoutedMessage):
+            self._logger.error("Routed messages can't be aggregated by a window, ignoring")
+            return []
+
+        if isinstance(output_message_body, GeneratorType):
+            self._logger.error("Streamed messages can't be aggregated by a window, ignoring")
+            output_message_body.close()
+            return []
+
+        emissions = self._window.add(
+            output_message_body, actual_source_topic, source_topic_matches,
+            self._get_window_sink_topic, timestamp
+        )
+
+        return [Message(sink_topic, body) for sink_topic, body in emissions]
+
+    def _get_window_sink_topic(self, actual_source_topic: TopicName) -> TopicName:
+        return self._get_sink_topic(actual_source_topic, self._default_sink_topic)
+
+    def _join_message(
+        self, context: MessageContext, source_topic_matches: Dict[str, str],
+        message: MessageBody, timestamp: float
+    ) -> Optional[Dict[str, Any] | FunctionFailure]:
+        value = self._run_shared_functions(
+            self._input_functions, message, context, source_topic_matches
+        )
+        if value is None or isinstance(value, FunctionFailure):
+            return value
+
+        return self._join.add(
+            self._join_field, source_topic_matches[self._join.key], value, timestamp
         )
 
-    def _process_message_content(
-            self, input_message: MessageBody, actual_source_topic: TopicName,
-            source_topic_matches: Dict[str, str]
+    def _run_shared_functions(
+            self, functions: List[ProcessorFunction], input_message: MessageBody,
+            context: MessageContext, source_topic_matches: Dict[str, str]
     ) -> MessageBody:
+        shared_stages = self._shared_stages
+        if len(shared_stages) == 0:
+            return self._run_functions(
+                functions, input_message, context, source_topic_matches
+            )
+
+        # The last processor to use the stages of a message takes their outputs as they are
+        first_stage = shared_stages[0]
+        consumers = context.consumers.get(first_stage, self._stage_consumers) - 1
+        context.consumers[first_stage] = consumers
+
+        while True:
+            message = self._run_stages(
+                functions, input_message, context, source_topic_matches, consumers == 0
+            )
+            if message is not _RESTART:
+                return message
+
+    def _run_stages(
+            self, functions: List[ProcessorFunction], input_message: MessageBody,
+            context: MessageContext, source_topic_matches: Dict[str, str], owner: bool
+    ) -> MessageBody:
+        # Continues from the deepest stage already evaluated for this message by another
+        # processor. Outputs are stored unchanged, rules get them as they are and converters,
+        # which could modify them, get copies. Outputs that can't be copied aren't shared, the
+        # processors evaluate them separately.
+        shared_stages = self._shared_stages
         message = input_message
-        for function in self._functions:
-            if isinstance(message, RoutedMessage):
-                self._logger.error(
-                    "Ignoring routed message produced by `%s`, because it's followed by another function",
-                    function.callback.__name__,
-                )
+        holders: List[int] = list()
+        borrowed = False
+        start = len(shared_stages)
+        while start > 0:
+            stage = shared_stages[start - 1]
+            cached = context.stages.get(stage, _MISSING)
+            if cached is _STOPPED:
                 return None
+            if isinstance(cached, FunctionFailure):
+                return cached
 
-            try:
-                result = function.callback(message, actual_source_topic.rule, source_topic_matches)
-            except Exception:
-                self._logger.exception(
-                    "Function %s failed to execute", function.callback.__name__
-                )
+            if cached is not _MISSING and cached is not _UNSHAREABLE:
+                message, holders, borrowed = cached, [stage], True
+                break
+
+            start -= 1
+
+        for index in range(start, len(functions)):
+            function = functions[index]
+            converter = function.ptype == ProcessorFunctionType.CONVERTER
+            if converter and len(holders) > 0 and not owner:
+                copied = _copy_shared(message)
+                if copied is _UNSHAREABLE:
+                    for stage in holders:
+                        context.stages[stage] = _UNSHAREABLE
+
+                    # Other processors may have used the output already, so it is evaluated
+                    # again from an earlier stage
+                    if borrowed:
+                        return _RESTART
+
+                    copied = message
+
+                message, holders, borrowed = copied, [], False
+
+            message = self._run_function(
+                function, message, context, source_topic_matches
+            )
+            if converter:
+                holders, borrowed = [], False
+
+            if index < len(shared_stages):
+                stage = shared_stages[index]
+                if context.stages.get(stage, _MISSING) is not _UNSHAREABLE:
+                    context.stages[stage] = message
+                    holders.append(stage)
+
+            if message is _STOPPED:
                 return None
+            if isinstance(message, FunctionFailure):
+                return message
 
-            if function.ptype == ProcessorFunctionType.RULE:
-                if not result:
-                    return None
-            else:
-                message = result
+        # The output is kept by this processor, so no other one can take it as it is
+        if len(holders) > 0 and not owner:
+            context.consumers[shared_stages[0]] += 1
 
         return message
 
+    def _run_functions(
+            self, functions: List[ProcessorFunction], input_message: MessageBody,
+            context: MessageContext, source_topic_matches: Dict[str, str]
+    ) -> MessageBody:
+        message = input_message
+        for function in functions:
+            message = self._run_function(
+                function, message, context, source_topic_matches
+            )
+            if message is _STOPPED:
+                return None
+            if isinstance(message, FunctionFailure):
+                return message
+
+        return message
+
+    def _run_function(
+            self, function: ProcessorFunction, message: MessageBody,
+            context: MessageContext, source_topic_matches: Dict[str, str]
+    ) -> MessageBody:
+        if isinstance(message, RoutedMessage):
+            self._logger.error(
+                "Ignoring routed message produced by `%s`, because it's followed by another function",
+                function.name,
+            )
+            return _STOPPED
+
+        if isinstance(message, GeneratorType):
+            self._logger.error(
+                "Ignoring streamed messages produced by `%s`, because it's followed by another function",
+                message.__name__,
+            )
+            message.close()
+            return _STOPPED
+
+        try:
+            result = function.callback(
+                message, context.source_topic.rule, source_topic_matches, context.properties,
+                context.timestamp,
+            )
+        except Exception as e:
+            self._error_policy.failure_log.failed(function.name, e)
+            return FunctionFailure(function.name, e)
+
+        if function.ptype == ProcessorFunctionType.RULE:
+            return message if result else _STOPPED
+
+        return result
+
     def _create_message_with_destination(
         self, actual_source_topic: TopicName, output_message_body: MessageBody
     ) -> List[Message]:
         if output_message_body is None:
             return []
         elif isinstance(output_message_body, RoutedMessage):
-            return self._decompose_routed_messages(
+            return list(self._decompose_routed_messages(
                 actual_source_topic, self._default_sink_topic, output_message_body
-            )
+            ))
         else:
             return [
                 Message(
@@ -103,60 +421,64 @@ class SingleSourceProcessor:
         actual_source_topic: TopicName,
         default_sink_topic: Optional[TopicName],
         routed_message: RoutedMessage,
-    ) -> List[Message]:
-        outgoing_simple_messages = list()
-
-        if routed_message.is_dict_of_routes_and_messages:
-            payload_iterator = routed_message.payload.items()
+        qos: Optional[int] = None,
+        retain: Optional[bool] = None,
+    ) -> Iterator[Message]:
+        # Messages are generated one by one, so nested routed messages don't build
+        # intermediate lists. Delivery of nested routed messages takes precedence.
+        if routed_message.qos is not None:
+            qos = routed_message.qos
+        if routed_message.retain is not None:
+            retain = routed_message.retain
+
+        shape = routed_message.shape
+        if shape == RoutedMessageShape.DICT_OF_ROUTES_AND_MESSAGES:
+            for sink_topic, body in routed_message.payload.items():
+                yield from self._create_messages(
+                    actual_source_topic, TopicName(sink_topic), (body,), qos, retain
+                )
 
-        elif routed_message.is_list_of_messages_without_routes:
-            sink_topic = None if default_sink_topic is None else default_sink_topic.rule
-            payload_iterator = zip(
-                itertools.repeat(sink_topic), routed_message.payload
+        elif shape == RoutedMessageShape.LIST_OF_MESSAGES_WITHOUT_ROUTES:
+            yield from self._create_messages(
+                actual_source_topic, default_sink_topic, routed_message.payload, qos, retain
             )
 
-        elif routed_message.is_single_route_and_list_of_messages:
-            sink_topic: str = routed_message.payload[0]
-            messages: List[Any] = routed_message.payload[1]
-
-            payload_iterator = zip(itertools.repeat(sink_topic), messages)
+        elif shape in (
+            RoutedMessageShape.SINGLE_ROUTE_AND_LIST_OF_MESSAGES,
+            RoutedMessageShape.SINGLE_ROUTE_AND_SINGLE_MESSAGE,
+        ):
+            sink_topic, bodies = routed_message.payload
+            if shape == RoutedMessageShape.SINGLE_ROUTE_AND_SINGLE_MESSAGE:
+                bodies = (bodies,)
 
-        elif routed_message.is_single_route_and_single_message:
-            sink_topic: str = routed_message.payload[0]
-            body: Any = routed_message.payload[1]
-
-            payload_iterator = [(sink_topic, body)]
+            yield from self._create_messages(
+                actual_source_topic, TopicName(sink_topic), bodies, qos, retain
+            )
 
         else:
             self._logger.warning("routed message of unknown type, ignoring")
-            return []
-
-        for sink_topic, body in payload_iterator:
-            outgoing_simple_messages += self._create_message(
-                message=body,
-                actual_source_topic=actual_source_topic,
-                sink_topic=None if sink_topic is None else TopicName(sink_topic),
-            )
-
-        return outgoing_simple_messages
 
-    def _create_message(
+    def _create_messages(
         self,
-        message: RoutedMessage | MessageBody,
         actual_source_topic: TopicName,
-        sink_topic: TopicName,
-    ) -> List[Message]:
-        if isinstance(message, RoutedMessage):
-            return self._decompose_routed_messages(
-                actual_source_topic, sink_topic, message
-            )
+        sink_topic: Optional[TopicName],
+        bodies: Iterable[RoutedMessage | MessageBody],
+        qos: Optional[int],
+        retain: Optional[bool],
+    ) -> Iterator[Message]:
+        # The sink topic is composed once for all the messages sent to it
+        composed_sink_topic = _MISSING
+        for body in bodies:
+            if isinstance(body, RoutedMessage):
+                yield from self._decompose_routed_messages(
+                    actual_source_topic, sink_topic, body, qos, retain
+                )
+                continue
 
-        return [
-            Message(
-                self._get_sink_topic(actual_source_topic, sink_topic),
-                message_body=message,
-            )
-        ]
+            if composed_sink_topic is _MISSING:
+                composed_sink_topic = self._get_sink_topic(actual_source_topic, sink_topic)
+
+            yield Message(composed_sink_topic, body, qos, retain)
 
     def _get_sink_topic(
         self,
@@ -174,65 +496,478 @@ class SingleSourceProcessor:
         )
 
 
+def _copy_shared(value: Any) -> Any:
+    try:
+        return copy_value(value)
+    except Exception:
+        return _UNSHAREABLE
+
+
+def _peek_messages(messages: Iterable[Message]) -> Optional[Iterable[Message]]:
+    # Streams have to be started to find out whether they produce any message
+    if isinstance(messages, list):
+        return messages if len(messages) > 0 else None
+
+    first = next(iter(messages), _MISSING)
+    if first is _MISSING:
+        return None
+
+    return itertools.chain((first,), messages)
+
+
 class Processor:
     __name__: str
+    internal: bool
+    publish: bool
     _logger: logging.Logger
     _processors: List[SingleSourceProcessor]
+    _window: Optional[WindowStage]
+    _rate_limiter: Optional[RateLimiter]
+    _join: Optional[JoinStage]
+    _qos: Optional[int]
+    _retain: Optional[bool]
+    _output_functions: List[ProcessorFunction]
+    _error_policy: ErrorPolicy
+    _process_matches: Callable[
+        [MessageContext, List[Tuple[SingleSourceProcessor, Dict[str, str]]], MessageBody, Optional[float]],
+        Iterable[Message]
+    ]
 
     @property
     def source_topics(self) -> List[TopicName]:
         return [p.source_topic for p in self._processors]
 
+    @property
+    def source_processors(self) -> List[SingleSourceProcessor]:
+        return self._processors
+
+    @property
+    def has_timers(self) -> bool:
+        return (
+            self._window is not None or self._rate_limiter is not None
+            or self._error_policy.has_retries
+        )
+
     def __init__(
         self,
         name: str,
         functions: List[ProcessorFunction],
         sources: List[TopicName],
         sink: Optional[TopicName],
+        window: Optional[WindowStage] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        input_functions: Optional[List[ProcessorFunction]] = None,
+        join: Optional[JoinStage] = None,
+        internal: bool = False,
+        publish: bool = True,
+        qos: Optional[int] = None,
+        retain: Optional[bool] = None,
+        match_mode: SourceMatchMode = SourceMatchMode.FIRST_OUTPUT,
+        output_functions: Optional[List[ProcessorFunction]] = None,
+        error_policy: Optional[ErrorPolicy] = None,
     ):
         self._logger = logging.getLogger(__name__ + "=" + name)
-
+        self.internal = internal
+        self.publish = publish
+        self._qos = qos
+        self._retain = retain
+        self._output_functions = [] if output_functions is None else output_functions
+        self._error_policy = ErrorPolicy(name) if error_policy is None else error_policy
+        self._window = window
+        self._rate_limiter = rate_limiter
+        self._join = join
+
+        # Every message is joined just once, as the value of the first matching source
+        if join is not None:
+            match_mode = SourceMatchMode.FIRST_MATCH
+
+        self._process_matches = {
+            SourceMatchMode.FIRST_OUTPUT: self._process_first_output,
+            SourceMatchMode.FIRST_MATCH: self._process_first_match,
+            SourceMatchMode.ALL_MATCHES: self._process_all_matches,
+        }[match_mode]
+
+        # The window, the rate limiter and the join are shared, so values from all sources
+        # can be aggregated, limited and joined together
         self._processors = [
             SingleSourceProcessor(
                 name=name,
                 functions=functions,
                 source_topic_rule=topic,
                 default_sink_topic=sink,
+                window=window,
+                rate_limiter=rate_limiter,
+                input_functions=input_functions,
+                join=join,
+                join_field=None if join is None else join.fields[index],
+                error_policy=self._error_policy,
             )
-            for topic in sources
+            for index, topic in enumerate(sources)
         ]
 
-    def process_message(self, source_topic: str, message: MessageBody) -> List[Message]:
+    def process_message(
+        self, source_topic: str, message: MessageBody, timestamp: Optional[float] = None,
+        context: Optional[MessageContext] = None,
+    ) -> Iterable[Message]:
+        if context is None:
+            context = MessageContext(TopicName(source_topic))
+
+        # The matching sources are looked up once, then the functions run once per match
+        matched_processors = list()
         for processor in self._processors:
-            output_message = processor.process_message(source_topic, message)
+            matches = processor.match(context)
+            if matches is not None:
+                matched_processors.append((processor, matches))
 
-            if len(output_message) > 0:
-                return output_message
+        if len(matched_processors) == 0:
+            return []
+
+        output_messages = self._encode_messages(
+            self._process_matches(context, matched_processors, message, timestamp),
+            (matched_processors[0][0], context),
+        )
+        return set_delivery(self._add_dead_letters(output_messages), self._qos, self._retain)
+
+    @staticmethod
+    def _process_first_output(
+        context: MessageContext,
+        matched_processors: List[Tuple[SingleSourceProcessor, Dict[str, str]]],
+        message: MessageBody, timestamp: Optional[float]
+    ) -> Iterable[Message]:
+        for processor, matches in matched_processors:
+            output_messages = _peek_messages(
+                processor.process_matched_message(context, matches, message, timestamp)
+            )
+
+            if output_messages is not None:
+                return output_messages
 
         return []
 
+    @staticmethod
+    def _process_first_match(
+        context: MessageContext,
+        matched_processors: List[Tuple[SingleSourceProcessor, Dict[str, str]]],
+        message: MessageBody, timestamp: Optional[float]
+    ) -> Iterable[Message]:
+        processor, matches = matched_processors[0]
+        return processor.process_matched_message(context, matches, message, timestamp)
+
+    @staticmethod
+    def _process_all_matches(
+        context: MessageContext,
+        matched_processors: List[Tuple[SingleSourceProcessor, Dict[str, str]]],
+        message: MessageBody, timestamp: Optional[float]
+    ) -> Iterable[Message]:
+        outputs = [
+            processor.process_matched_message(context, matches, message, timestamp)
+            for processor, matches in matched_processors
+        ]
 
-class ProcessorCreator:
-    _config: ProcessorConfigModel
+        if all(isinstance(output, list) for output in outputs):
+            return [msg for output in outputs for msg in output]
 
-    def __init__(self, processor_config: ProcessorConfigModel):
-        self._config = processor_config
-        self._add_input_output_formatting()
+        return itertools.chain.from_iterable(outputs)
 
-    def _add_input_output_formatting(self):
-        if self._config.input_format == MessageFormat.STRING:
-            self._config.function.insert(
-                0, ExtendedFunctionModel(name="binary_to_string")
+    def tick(self, now: float) -> List[Message]:
+        output_messages: List[Message] = list()
+        for failed in self._error_policy.pop_due(now):
+            # The delivery of the processor takes precedence over the received one, as when
+            # the message was received
+            output_messages += set_delivery(
+                set_delivery(failed.processor.retry(failed, now), self._qos, self._retain),
+                failed.qos, failed.retain,
             )
-        elif self._config.input_format == MessageFormat.JSON:
-            self._config.function.insert(
-                0, ExtendedFunctionModel(name="binary_to_json")
+
+        if self._rate_limiter is not None:
+            output_messages += self._rate_limiter.tick(now)
+
+        if self._window is not None:
+            window_messages = [
+                Message(sink_topic, body) for sink_topic, body in self._window.tick(now)
+            ]
+            if self._rate_limiter is not None and len(window_messages) > 0:
+                window_messages = self._rate_limiter.limit(window_messages, {}, now)
+
+            output_messages += window_messages
+
+        output_messages = self._encode_messages(output_messages)
+        return set_delivery(self._add_dead_letters(output_messages), self._qos, self._retain)
+
+    def _add_dead_letters(self, messages: Iterable[Message]) -> Iterable[Message]:
+        # Dead letters carry the error metadata as JSON, so they bypass the output encoding
+        dead_letters = self._error_policy.pop_dead_letters()
+        if len(dead_letters) == 0:
+            return messages
+
+        if isinstance(messages, list):
+            return messages + dead_letters
+
+        return itertools.chain(messages, dead_letters)
+
+    def _encode_messages(
+        self, messages: Iterable[Message],
+        source: Optional[Tuple[SingleSourceProcessor, MessageContext]] = None,
+    ) -> Iterable[Message]:
+        # Bodies of all messages, including routed, streamed and aggregated ones, are encoded
+        # by the output format just before they leave the processor
+        if len(self._output_functions) == 0:
+            return messages
+
+        encoded = (
+            msg for msg in (self._encode_message(msg, source) for msg in messages)
+            if msg is not None
+        )
+
+        return list(encoded) if isinstance(messages, list) else encoded
+
+    def _encode_message(
+        self, message: Message, source: Optional[Tuple[SingleSourceProcessor, MessageContext]]
+    ) -> Optional[Message]:
+        body = message.message_body
+        sink_topic = None if message.sink_topic is None else message.sink_topic.rule
+        for function in self._output_functions:
+            try:
+                body = function.callback(body, sink_topic, {})
+            except Exception as e:
+                # The encoding would fail the same way again, so the message isn't retried
+                self._error_policy.failure_log.failed(function.name, e)
+                self._add_encoding_dead_letter(message, FunctionFailure(function.name, e), source)
+                return None
+
+        return replace(message, message_body=body)
+
+    def _add_encoding_dead_letter(
+        self, message: Message, failure: FunctionFailure,
+        source: Optional[Tuple[SingleSourceProcessor, MessageContext]],
+    ):
+        dead_letter = self._error_policy.dead_letter
+        if dead_letter is None:
+            return
+
+        if source is not None:
+            source_processor, context = source
+            failed = FailedMessage(
+                self, context.source_topic.rule, context.properties, {}, message.message_body,
+                failure, 1, time.time(),
+            )
+            sink_topic = source_processor.get_dead_letter_topic(context.source_topic)
+        elif "{" not in dead_letter.rule:
+            failed = FailedMessage(
+                self, None, None, {}, message.message_body, failure, 1, time.time()
+            )
+            sink_topic = dead_letter
+        else:
+            # Messages sent later by windows and rate limiters have no source topic
+            self._logger.error(
+                "Message for %s failed to encode, its dead-letter topic can't be composed",
+                message.sink_topic.rule,
             )
+            return
+
+        self._error_policy.add_dead_letter(failed, sink_topic)
+
+    def next_deadline(self) -> Optional[float]:
+        deadlines = [
+            stage.next_deadline()
+            for stage in (self._window, self._rate_limiter, self._error_policy)
+            if stage is not None
+        ]
+
+        return min((d for d in deadlines if d is not None), default=None)
+
+
+class ProcessorCreator:
+    _config: "ProcessorConfigModel"
+    _state_backend: Optional[StateBackend]
+
+    def __init__(
+        self, processor_config: "ProcessorConfigModel",
+        state_backend: Optional[StateBackend] = None,
+    ):
+        self._config = processor_config
+        self._state_backend = state_backend
+
+    def _create_input_functions(self) -> List[ProcessorFunction]:
+        # Imported here to keep pydantic out of the import of the routing module
+        from mqttprocessor.models import MessageFormat, ExtendedFunctionModel
+
+        functions = list()
+        if self._config.input_compression is not None:
+            functions.append(self._create_compression_function(
+                self._config.input_compression, compress=False
+            ))
+
+        input_format = self._config.input_format
+        if input_format == MessageFormat.JSON and self._config.json_fields is not None:
+            functions.append(ExtendedFunctionModel(
+                name="extract_json_fields", arguments={"fields": self._config.json_fields}
+            ))
+        else:
+            decoder = {
+                MessageFormat.STRING: "binary_to_string",
+                MessageFormat.JSON: "binary_to_json",
+                MessageFormat.MSGPACK: "msgpack_to_json",
+                MessageFormat.CBOR: "cbor_to_json",
+                MessageFormat.PROTOBUF: "protobuf_to_json",
+            }.get(input_format)
+            if decoder is not None:
+                functions.append(self._create_format_function(decoder))
+
+        return create_functions(functions)
+
+    def _create_output_functions(self) -> List[ProcessorFunction]:
+        from mqttprocessor.models import MessageFormat
+
+        functions = list()
+        encoder, probe = {
+            MessageFormat.STRING: ("string_to_binary", ""),
+            MessageFormat.JSON: ("json_to_binary", {}),
+            MessageFormat.MSGPACK: ("json_to_msgpack", {}),
+            MessageFormat.CBOR: ("json_to_cbor", {}),
+            MessageFormat.PROTOBUF: ("json_to_protobuf", {}),
+        }.get(self._config.output_format, (None, b""))
+        if encoder is not None:
+            functions.append(self._create_format_function(encoder))
+
+        if self._config.output_compression is not None:
+            functions.append(self._create_compression_function(
+                self._config.output_compression, compress=True
+            ))
+
+        output_functions = create_functions(functions)
+
+        # The encoders are tried once when the processor is created, so a missing codec,
+        # protobuf type or dictionary is reported on startup and the encoded bodies needn't
+        # be checked before they are published
+        for function in output_functions:
+            probe = function.callback(probe, "", {})
+        if len(output_functions) > 0 and not isinstance(probe, bytes):
+            raise ValueError(f"Output of processor `{self._config.name}` isn't encoded to bytes")
+
+        return output_functions
+
+    def _create_format_function(self, name: str) -> "ExtendedFunctionModel":
+        from mqttprocessor.models import ExtendedFunctionModel
+
+        arguments = None
+        if name in ("protobuf_to_json", "json_to_protobuf"):
+            arguments = {"message_type": self._config.protobuf_type}
+
+        return ExtendedFunctionModel(name=name, arguments=arguments)
+
+    @staticmethod
+    def _create_compression_function(
+        compression: "CompressionModel", compress: bool
+    ) -> "ExtendedFunctionModel":
+        from mqttprocessor.models import ExtendedFunctionModel, PayloadCompression
+
+        arguments = dict()
+        if compress:
+            arguments["level"] = compression.level
+        if compression.type == PayloadCompression.ZSTD:
+            arguments["dictionary"] = compression.dictionary
+
+        name = compression.type.value
+        return ExtendedFunctionModel(
+            name=f"binary_to_{name}" if compress else f"{name}_to_binary",
+            arguments=arguments or None,
+        )
 
     def create(self) -> Processor:
         return Processor(
             name=self._config.name,
-            functions=create_functions(self._config.function),
+            functions=create_functions(
+                self._config.function,
+                state_backend=self._state_backend,
+                state_namespace=self._get_state_namespace(),
+            ),
             sources=[TopicName(source.__root__) for source in self._config.source],
             sink=None if self._config.sink is None else TopicName(self._config.sink.__root__),
+            window=self._create_window(),
+            rate_limiter=self._create_rate_limiter(),
+            input_functions=self._create_input_functions(),
+            output_functions=self._create_output_functions(),
+            join=self._create_join(),
+            internal=self._config.internal,
+            publish=self._config.publish,
+            qos=self._config.qos,
+            retain=self._config.retain,
+            match_mode=self._config.match,
+            error_policy=self._create_error_policy(),
+        )
+
+    def _create_error_policy(self) -> Optional[ErrorPolicy]:
+        error_config = self._config.on_error
+        if error_config is None:
+            return None
+
+        return ErrorPolicy(
+            name=self._config.name,
+            retries=error_config.retries,
+            backoff=error_config.backoff,
+            max_backoff=error_config.max_backoff,
+            max_queue=error_config.max_queue,
+            dead_letter=None if error_config.dead_letter is None else TopicName(
+                error_config.dead_letter.__root__
+            ),
+            log_interval=error_config.log_interval,
+        )
+
+    def _get_state_namespace(self) -> str:
+        if "name" in self._config.__fields_set__:
+            return self._config.name
+
+        # Unnamed processors get a new name on every start, so their state is identified by
+        # the sources, the sink and the functions instead
+        import hashlib
+
+        definition = self._config.json(include={"source", "sink", "function"})
+        return "unnamed-" + hashlib.sha256(definition.encode("utf8")).hexdigest()[:16]
+
+    def _create_window(self) -> Optional[WindowStage]:
+        window_config = self._config.window
+        if window_config is None:
+            return None
+
+        return WindowStage(
+            name=self._config.name,
+            window_type=window_config.type,
+            aggregates=window_config.aggregates,
+            size=window_config.size,
+            slide=window_config.slide,
+            gap=window_config.gap,
+            key=window_config.key,
+            field=window_config.field,
+            max_keys=window_config.max_keys,
+            max_samples=window_config.max_samples,
+        )
+
+    def _create_rate_limiter(self) -> Optional[RateLimiter]:
+        rate_limit_config = self._config.rate_limit
+        if rate_limit_config is None:
+            return None
+
+        return RateLimiter(
+            name=self._config.name,
+            rate=rate_limit_config.rate,
+            burst=rate_limit_config.burst,
+            key=rate_limit_config.key,
+            mode=rate_limit_config.mode,
+            max_queue=rate_limit_config.max_queue,
+        )
+
+    def _create_join(self) -> Optional[JoinStage]:
+        join_config = self._config.join
+        if join_config is None:
+            return None
+
+        return JoinStage(
+            name=self._config.name,
+            fields=join_config.fields,
+            key=join_config.key,
+            triggers=join_config.trigger,
+            require_all=join_config.require_all,
+            max_keys=join_config.max_keys,
+            ttl=join_config.ttl,
         )
@@ -0,0 +1,64 @@
+import json
+from functools import lru_cache
+from importlib import import_module
+from typing import Any
+
+# json.dumps creates a new encoder on every call with non-default options
+_JSON_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+
+def encode_json(data: Any) -> bytes:
+    return _JSON_ENCODER.encode(data).encode("utf8")
+
+
+# The following codecs are optional dependencies, imported once a processor uses them
+
+
+def decode_msgpack(binary: bytes) -> Any:
+    return import_codec("msgpack", "msgpack").unpackb(binary, raw=False)
+
+
+def encode_msgpack(data: Any) -> bytes:
+    return import_codec("msgpack", "msgpack").packb(data, use_bin_type=True)
+
+
+def decode_cbor(binary: bytes) -> Any:
+    return import_codec("cbor2", "cbor").loads(binary)
+
+
+def encode_cbor(data: Any) -> bytes:
+    return import_codec("cbor2", "cbor").dumps(data)
+
+
+def decode_protobuf(binary: bytes, message_type: str) -> Any:
+    json_format = import_codec("google.protobuf.json_format", "protobuf")
+    message = _load_protobuf_type(message_type).FromString(binary)
+
+    return json_format.MessageToDict(message, preserving_proto_field_name=True)
+
+
+def encode_protobuf(data: Any, message_type: str) -> bytes:
+    json_format = import_codec("google.protobuf.json_format", "protobuf")
+    message = json_format.ParseDict(data, _load_protobuf_type(message_type)())
+
+    return message.SerializeToString()
+
+
+@lru_cache(maxsize=None)
+def _load_protobuf_type(message_type: str) -> type:
+    # Generated message classes are referenced by their import path, e.g. `readings_pb2.Reading`
+    module_name, _, class_name = message_type.rpartition(".")
+    if len(module_name) == 0:
+        raise ValueError(f"Protobuf message type `{message_type}` has to include its module")
+
+    return getattr(import_module(module_name), class_name)
+
+
+@lru_cache(maxsize=None)
+def import_codec(module_name: str, extra: str):
+    try:
+        return import_module(module_name)
+    except ImportError as e:
+        raise ImportError(
+            f"The {extra} format requires the `{extra}` extra (the `{module_name}` package)"
+        ) from e
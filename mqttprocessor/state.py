@@ -0,0 +1,252 @@
+import abc
+import logging
+import pickle
+import time
+from collections import OrderedDict
+from typing import (
+    Any, Callable, Hashable, Optional, Tuple, Dict, List, Iterable, Set, TYPE_CHECKING
+)
+
+if TYPE_CHECKING:
+    import sqlite3
+
+_MISSING = object()
+
+StateEntry = Tuple[Hashable, Any, float]
+
+
+class StateStore:
+    # Entries are kept in order of their last update, so both the least recently
+    # updated and the first expiring entry are always at the front
+    _entries: "OrderedDict[Hashable, Tuple[Any, float]]"
+    _max_keys: int
+    _ttl: Optional[float]
+    _clock: Callable[[], float]
+    _now: Optional[float]
+    _updated: Optional[Set[Hashable]]
+    _deleted: Optional[Set[Hashable]]
+
+    def __init__(
+        self,
+        max_keys: int = 100000,
+        ttl: Optional[float] = None,
+        clock: Callable[[], float] = time.time,
+        track_changes: bool = False,
+    ):
+        self._entries = OrderedDict()
+        self._max_keys = max_keys
+        self._ttl = ttl
+        self._clock = clock
+        self._now = None
+
+        # Changes are tracked only for stores persisted by a backend
+        self._updated = set() if track_changes else None
+        self._deleted = set() if track_changes else None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+
+        value, updated_at = entry
+        if self._ttl is not None and self._get_time() - updated_at >= self._ttl:
+            self._remove(key)
+            return default
+
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        now = self._get_time()
+
+        if key in self._entries:
+            self._entries.move_to_end(key)
+        self._entries[key] = (value, now)
+
+        if self._updated is not None:
+            self._updated.add(key)
+            self._deleted.discard(key)
+
+        self._evict(now)
+
+    def advance(self, now: float):
+        # Functions are given the time of the processed message, so the entries expire the
+        # same way in the offline replay as when the messages were received
+        self._now = now
+
+    def delete(self, key: Hashable):
+        if key in self._entries:
+            self._remove(key)
+
+    def restore(self, entries: Iterable[StateEntry]):
+        for key, value, updated_at in entries:
+            self._entries[key] = (value, updated_at)
+
+        self._evict(self._get_time())
+
+    def take_changes(self) -> Tuple[List[StateEntry], List[Hashable]]:
+        updated = [
+            (key, *self._entries[key]) for key in self._updated if key in self._entries
+        ]
+        deleted = list(self._deleted)
+
+        self._updated.clear()
+        self._deleted.clear()
+
+        return updated, deleted
+
+    def _get_time(self) -> float:
+        return self._clock() if self._now is None else self._now
+
+    def _remove(self, key: Hashable):
+        del self._entries[key]
+
+        if self._deleted is not None:
+            self._deleted.add(key)
+            self._updated.discard(key)
+
+    def _evict(self, now: float):
+        while len(self._entries) > self._max_keys:
+            self._remove(next(iter(self._entries)))
+
+        if self._ttl is None:
+            return
+
+        while self._entries:
+            key, (_, updated_at) = next(iter(self._entries.items()))
+            if now - updated_at < self._ttl:
+                break
+
+            self._remove(key)
+
+
+class StateBackend(abc.ABC):
+    _logger: logging.Logger
+    _stores: Dict[str, StateStore]
+    _snapshot_interval: float
+    _next_snapshot: float
+
+    @property
+    def next_snapshot(self) -> float:
+        return self._next_snapshot
+
+    def __init__(self, snapshot_interval: float = 10.0):
+        self._logger = logging.getLogger(__name__)
+        self._stores = dict()
+        self._snapshot_interval = snapshot_interval
+        self._next_snapshot = time.time() + snapshot_interval
+
+    def create_store(
+        self, namespace: str, max_keys: int = 100000, ttl: Optional[float] = None
+    ) -> StateStore:
+        if namespace in self._stores:
+            raise ValueError(f"State namespace `{namespace}` is already used")
+
+        store = StateStore(max_keys=max_keys, ttl=ttl, track_changes=True)
+        store.restore(self._load(namespace))
+        self._stores[namespace] = store
+
+        self._logger.info("Restored %s state entries of %s", len(store), namespace)
+        return store
+
+    def snapshot(self):
+        # Changes are written behind in one batch instead of on every update
+        changes = dict()
+        for namespace, store in self._stores.items():
+            updated, deleted = store.take_changes()
+            if len(updated) > 0 or len(deleted) > 0:
+                changes[namespace] = (updated, deleted)
+
+        if len(changes) > 0:
+            self._write(changes)
+
+        self._next_snapshot = time.time() + self._snapshot_interval
+
+    def close(self):
+        self.snapshot()
+
+    @abc.abstractmethod
+    def _load(self, namespace: str) -> Iterable[StateEntry]:
+        pass
+
+    @abc.abstractmethod
+    def _write(self, changes: Dict[str, Tuple[List[StateEntry], List[Hashable]]]):
+        pass
+
+
+class MemoryStateBackend(StateBackend):
+    _data: Dict[str, Dict[Hashable, Tuple[Any, float]]]
+
+    def __init__(self, snapshot_interval: float = 10.0):
+        super().__init__(snapshot_interval)
+        self._data = dict()
+
+    def _load(self, namespace: str) -> Iterable[StateEntry]:
+        entries = self._data.get(namespace, {})
+        return sorted(
+            ((key, value, updated_at) for key, (value, updated_at) in entries.items()),
+            key=lambda entry: entry[2]
+        )
+
+    def _write(self, changes: Dict[str, Tuple[List[StateEntry], List[Hashable]]]):
+        for namespace, (updated, deleted) in changes.items():
+            entries = self._data.setdefault(namespace, dict())
+            for key, value, updated_at in updated:
+                entries[key] = (value, updated_at)
+
+            for key in deleted:
+                entries.pop(key, None)
+
+
+class SqliteStateBackend(StateBackend):
+    _connection: "sqlite3.Connection"
+
+    def __init__(self, path: str, snapshot_interval: float = 10.0):
+        # Imported here, so the app doesn't load sqlite unless the state is persisted
+        import sqlite3
+
+        super().__init__(snapshot_interval)
+
+        self._connection = sqlite3.connect(path)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            "namespace TEXT NOT NULL, key BLOB NOT NULL, value BLOB NOT NULL, "
+            "updated_at REAL NOT NULL, PRIMARY KEY (namespace, key))"
+        )
+        self._connection.commit()
+
+    def close(self):
+        super().close()
+        self._connection.close()
+
+    def _load(self, namespace: str) -> Iterable[StateEntry]:
+        rows = self._connection.execute(
+            "SELECT key, value, updated_at FROM state WHERE namespace = ? ORDER BY updated_at",
+            (namespace,)
+        )
+
+        return [
+            (pickle.loads(key), pickle.loads(value), updated_at)
+            for key, value, updated_at in rows
+        ]
+
+    def _write(self, changes: Dict[str, Tuple[List[StateEntry], List[Hashable]]]):
+        with self._connection:
+            for namespace, (updated, deleted) in changes.items():
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO state (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)",
+                    (
+                        (namespace, pickle.dumps(key), pickle.dumps(value), updated_at)
+                        for key, value, updated_at in updated
+                    )
+                )
+                self._connection.executemany(
+                    "DELETE FROM state WHERE namespace = ? AND key = ?",
+                    ((namespace, pickle.dumps(key)) for key in deleted)
+                )
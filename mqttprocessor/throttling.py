@@ -0,0 +1,321 @@
+import logging
+import math
+from collections import deque
+from typing import Dict, List, Tuple, Hashable, Optional
+
+from mqttprocessor.definitions import RateLimitMode
+from mqttprocessor.messages import Message
+
+# Tolerances for floating point arithmetic of deadlines and tokens refilled exactly at them
+_TICK_EPSILON = 1e-6
+_EPSILON = 1e-6
+
+
+class TimingWheel:
+    # Timers are hashed to the slots of the finest level covering their delay and the coarser
+    # levels cascade down as the wheel turns, so scheduling, rescheduling and expiring a timer
+    # are O(1) regardless of the number of timers. Each key has at most one timer.
+    _resolution: float
+    _bits: int
+    _mask: int
+    _levels: List[List[Dict[Hashable, int]]]
+    _level_counts: List[int]
+    _timers: Dict[Hashable, Tuple[int, int]]
+    _current: int
+
+    def __init__(self, resolution: float = 0.01, slot_bits: int = 8, levels: int = 4):
+        self._resolution = resolution
+        self._bits = slot_bits
+        self._mask = (1 << slot_bits) - 1
+        self._levels = [[dict() for _ in range(1 << slot_bits)] for _ in range(levels)]
+        self._level_counts = [0] * levels
+        self._timers = dict()
+        self._current = 0
+
+    def __len__(self) -> int:
+        return len(self._timers)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._timers
+
+    def schedule(self, key: Hashable, deadline: float, now: float):
+        self.cancel(key)
+
+        if len(self._timers) == 0:
+            self._current = math.floor(now / self._resolution)
+
+        # A timer fires once the wheel passed its tick, so never before its deadline
+        tick = max(math.ceil(deadline / self._resolution - _TICK_EPSILON), self._current + 1)
+        self._insert(key, tick)
+
+    def cancel(self, key: Hashable):
+        position = self._timers.pop(key, None)
+        if position is None:
+            return
+
+        level, slot = position
+        del self._levels[level][slot][key]
+        self._level_counts[level] -= 1
+
+    def advance(self, now: float) -> List[Hashable]:
+        if len(self._timers) == 0:
+            if not math.isinf(now):
+                self._current = math.floor(now / self._resolution)
+            return []
+
+        if math.isinf(now):
+            expired = list(self._timers)
+            self._clear()
+            return expired
+
+        target = math.floor(now / self._resolution)
+        expired = list()
+
+        while self._current < target and len(self._timers) > 0:
+            self._skip_empty_rotations(target)
+            self._current += 1
+
+            for level in range(len(self._levels) - 1, 0, -1):
+                if self._current & ((1 << (self._bits * level)) - 1) == 0:
+                    self._cascade(level)
+
+            slot = self._levels[0][self._current & self._mask]
+            if len(slot) > 0:
+                for key in slot:
+                    del self._timers[key]
+                self._level_counts[0] -= len(slot)
+                expired += slot
+                slot.clear()
+
+        if len(self._timers) == 0:
+            self._current = target
+
+        return expired
+
+    def next_deadline(self) -> float | None:
+        if len(self._timers) == 0:
+            return None
+
+        # Timers of the coarser levels may fire right after the next cascade, so waking up
+        # then is early, but never late
+        next_cascade = ((self._current >> self._bits) + 1) << self._bits
+        if self._level_counts[0] == len(self._timers):
+            next_cascade += 1 << self._bits
+
+        if self._level_counts[0] > 0:
+            for tick in range(self._current + 1, min(self._current + self._mask + 2, next_cascade)):
+                if len(self._levels[0][tick & self._mask]) > 0:
+                    return tick * self._resolution
+
+        return next_cascade * self._resolution
+
+    def _insert(self, key: Hashable, tick: int):
+        delay = tick - self._current
+        top_level = len(self._levels) - 1
+
+        level = 0
+        while level < top_level and delay >= 1 << (self._bits * (level + 1)):
+            level += 1
+
+        # Timers beyond the range of the wheel wait in the last slot of the top level and
+        # are placed again once cascaded
+        slot_tick = min(tick, self._current + (1 << (self._bits * (top_level + 1))) - 1)
+        slot = (slot_tick >> (self._bits * level)) & self._mask
+
+        self._levels[level][slot][key] = tick
+        self._level_counts[level] += 1
+        self._timers[key] = (level, slot)
+
+    def _cascade(self, level: int):
+        slot = self._levels[level][(self._current >> (self._bits * level)) & self._mask]
+        if len(slot) == 0:
+            return
+
+        entries = list(slot.items())
+        self._level_counts[level] -= len(slot)
+        slot.clear()
+
+        for key, tick in entries:
+            del self._timers[key]
+            self._insert(key, tick)
+
+    def _skip_empty_rotations(self, target: int):
+        # Lower levels without timers don't have to be turned tick by tick, only the next
+        # cascade of the first level holding timers matters
+        empty_levels = 0
+        while empty_levels < len(self._levels) and self._level_counts[empty_levels] == 0:
+            empty_levels += 1
+
+        if empty_levels == 0:
+            return
+
+        span = 1 << (self._bits * empty_levels)
+        next_cascade = (self._current // span + 1) * span
+        self._current = max(self._current, min(next_cascade, target) - 1)
+
+    def _clear(self):
+        for level, slots in enumerate(self._levels):
+            for slot in slots:
+                slot.clear()
+            self._level_counts[level] = 0
+
+        self._timers.clear()
+
+
+class _TokenBucket:
+    __slots__ = ("tokens", "updated", "pending")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+        # Created only when needed, most buckets never hold a message
+        self.pending: Optional[deque | list] = None
+
+
+class RateLimiter:
+    _logger: logging.Logger
+    _rate: float
+    _burst: int
+    _key: str
+    _mode: RateLimitMode
+    _max_queue: int
+    _buckets: Dict[str, _TokenBucket]
+    _wheel: TimingWheel
+    _dropped: int
+
+    @property
+    def dropped(self) -> int:
+        return self._dropped
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: int = 1,
+        key: str = "topic",
+        mode: RateLimitMode = RateLimitMode.DROP,
+        max_queue: int = 1000,
+    ):
+        self._logger = logging.getLogger(__name__ + "=" + name)
+        self._rate = rate
+        self._burst = burst
+        self._key = key
+        self._mode = mode
+        self._max_queue = max_queue
+        self._buckets = dict()
+        self._wheel = TimingWheel(resolution=min(0.01, 0.1 / rate))
+        self._dropped = 0
+
+    def limit(
+        self, messages: List[Message], matches: Dict[str, str], now: float
+    ) -> List[Message]:
+        passed = list()
+
+        for message in messages:
+            key = self._get_key(message, matches)
+
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = _TokenBucket(self._burst, now)
+                self._buckets[key] = bucket
+            else:
+                self._refill(bucket, now)
+
+            # Pending messages go first, so the order of the messages is kept. The timer has
+            # to move only when a token is taken or the first message starts waiting.
+            if bucket.pending is None and bucket.tokens >= 1 - _EPSILON:
+                bucket.tokens -= 1
+                passed.append(message)
+                self._schedule(key, bucket, now)
+            elif self._mode == RateLimitMode.DROP:
+                self._drop(key)
+            elif bucket.pending is None:
+                self._add_pending(key, bucket, message)
+                self._schedule(key, bucket, now)
+            else:
+                self._add_pending(key, bucket, message)
+
+        return passed
+
+    def tick(self, now: float) -> List[Message]:
+        if math.isinf(now):
+            return self._flush()
+
+        released = list()
+        for key in self._wheel.advance(now):
+            bucket = self._buckets[key]
+            self._refill(bucket, now)
+
+            if bucket.pending is not None:
+                while len(bucket.pending) > 0 and bucket.tokens >= 1 - _EPSILON:
+                    bucket.tokens -= 1
+                    released.append(bucket.pending[0])
+                    del bucket.pending[0]
+
+                if len(bucket.pending) == 0:
+                    bucket.pending = None
+
+            # Full buckets behave as new ones, so they are dropped to bound the memory
+            if bucket.pending is None and bucket.tokens >= self._burst - _EPSILON:
+                del self._buckets[key]
+            else:
+                self._schedule(key, bucket, now)
+
+        return released
+
+    def next_deadline(self) -> float | None:
+        return self._wheel.next_deadline()
+
+    def _get_key(self, message: Message, matches: Dict[str, str]) -> str | None:
+        sink_topic = None if message.sink_topic is None else message.sink_topic.rule
+        if self._key == "topic":
+            return sink_topic
+
+        return matches.get(self._key, sink_topic)
+
+    def _add_pending(self, key: str, bucket: _TokenBucket, message: Message):
+        # Latest-wins keeps just one pending message, which is replaced by newer ones, in a
+        # list, which is much smaller than a deque
+        if self._mode == RateLimitMode.LATEST:
+            if bucket.pending is None:
+                bucket.pending = [message]
+            else:
+                bucket.pending[0] = message
+            return
+
+        if bucket.pending is None:
+            bucket.pending = deque(maxlen=self._max_queue)
+        elif len(bucket.pending) == self._max_queue:
+            self._drop(key)
+
+        bucket.pending.append(message)
+
+    def _refill(self, bucket: _TokenBucket, now: float):
+        if now > bucket.updated:
+            bucket.tokens = min(self._burst, bucket.tokens + (now - bucket.updated) * self._rate)
+            bucket.updated = now
+
+    def _schedule(self, key: str, bucket: _TokenBucket, now: float):
+        # Every bucket has a single timer, either to release the next pending message or to
+        # remove the bucket once it's full again
+        if bucket.pending is not None:
+            deadline = now + max(0.0, 1 - bucket.tokens) / self._rate
+        else:
+            deadline = now + (self._burst - bucket.tokens) / self._rate
+
+        self._wheel.schedule(key, deadline, now)
+
+    def _drop(self, key: str):
+        self._dropped += 1
+        self._logger.debug("Rate limit of `%s` exceeded, dropping message", key)
+
+    def _flush(self) -> List[Message]:
+        released = list()
+        for bucket in self._buckets.values():
+            if bucket.pending is not None:
+                released += bucket.pending
+
+        self._buckets.clear()
+        self._wheel.advance(math.inf)
+
+        return released
@@ -0,0 +1,394 @@
+import heapq
+import itertools
+import logging
+import math
+from collections import OrderedDict, deque
+from typing import Dict, List, Tuple, Optional, Any, Callable, Iterator
+
+from mqttprocessor.definitions import WindowType
+from mqttprocessor.messages import TopicName
+
+WindowEmission = Tuple[TopicName, Dict[str, Any]]
+SinkTopicFactory = Callable[[TopicName], TopicName]
+
+
+class PercentileSketch:
+    # Logarithmic buckets give quantiles with bounded relative error in memory bounded
+    # by the range of the values, not by their number
+    __slots__ = ("_log_gamma", "_positive", "_negative", "_zero", "_count")
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self._log_gamma = math.log((1 + relative_accuracy) / (1 - relative_accuracy))
+        self._positive: Dict[int, int] = dict()
+        self._negative: Dict[int, int] = dict()
+        self._zero = 0
+        self._count = 0
+
+    def add(self, value: float):
+        self._update(value, 1)
+
+    def remove(self, value: float):
+        self._update(value, -1)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self._count == 0:
+            return None
+
+        rank = q * (self._count - 1)
+        seen = 0
+
+        for bucket in sorted(self._negative, reverse=True):
+            seen += self._negative[bucket]
+            if seen > rank:
+                return -self._bucket_value(bucket)
+
+        seen += self._zero
+        if seen > rank:
+            return 0.0
+
+        for bucket in sorted(self._positive):
+            seen += self._positive[bucket]
+            if seen > rank:
+                return self._bucket_value(bucket)
+
+        return None
+
+    def _update(self, value: float, difference: int):
+        self._count += difference
+
+        if value == 0:
+            self._zero += difference
+            return
+
+        buckets = self._positive if value > 0 else self._negative
+        bucket = math.ceil(math.log(abs(value)) / self._log_gamma)
+
+        count = buckets.get(bucket, 0) + difference
+        if count == 0:
+            del buckets[bucket]
+        else:
+            buckets[bucket] = count
+
+    def _bucket_value(self, bucket: int) -> float:
+        return 2 * math.exp(bucket * self._log_gamma) / (1 + math.exp(self._log_gamma))
+
+
+class WindowAggregate:
+    __slots__ = (
+        "_count", "_sum", "_min", "_max", "_sketch", "_samples",
+        "_sequence", "_sliding", "_max_samples"
+    )
+
+    def __init__(
+        self, need_min: bool, need_max: bool, need_percentiles: bool,
+        sliding: bool, max_samples: int
+    ):
+        self._count = 0
+        self._sum = 0.0
+        self._sliding = sliding
+        self._max_samples = max_samples
+        self._sequence = 0
+        self._sketch = PercentileSketch() if need_percentiles else None
+
+        # Sliding windows keep their samples for expiration and monotonic deques of
+        # (sequence, value) for the extremes; the others just keep running extremes
+        self._samples = deque() if sliding else None
+        if sliding:
+            self._min = deque() if need_min else None
+            self._max = deque() if need_max else None
+        else:
+            self._min = math.inf if need_min else None
+            self._max = -math.inf if need_max else None
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def add(self, timestamp: float, value: float):
+        self._count += 1
+        self._sum += value
+        if self._sketch is not None:
+            self._sketch.add(value)
+
+        if not self._sliding:
+            if self._min is not None:
+                self._min = min(self._min, value)
+            if self._max is not None:
+                self._max = max(self._max, value)
+            return
+
+        sequence = self._sequence
+        self._sequence += 1
+        self._samples.append((sequence, timestamp, value))
+
+        if self._min is not None:
+            while self._min and self._min[-1][1] >= value:
+                self._min.pop()
+            self._min.append((sequence, value))
+
+        if self._max is not None:
+            while self._max and self._max[-1][1] <= value:
+                self._max.pop()
+            self._max.append((sequence, value))
+
+        if len(self._samples) > self._max_samples:
+            self._remove_oldest()
+
+    def expire(self, cutoff: float):
+        while self._samples and self._samples[0][1] < cutoff:
+            self._remove_oldest()
+
+    def result(self, aggregates: List[str]) -> Dict[str, float]:
+        result = dict()
+        for aggregate in aggregates:
+            if aggregate == "count":
+                result[aggregate] = self._count
+            elif aggregate == "sum":
+                result[aggregate] = self._sum
+            elif aggregate == "mean":
+                result[aggregate] = self._sum / self._count if self._count > 0 else None
+            elif aggregate == "min":
+                result[aggregate] = self._extreme(self._min)
+            elif aggregate == "max":
+                result[aggregate] = self._extreme(self._max)
+            else:
+                result[aggregate] = self._sketch.quantile(float(aggregate[1:]) / 100)
+
+        return result
+
+    def _remove_oldest(self):
+        sequence, _, value = self._samples.popleft()
+        self._count -= 1
+        self._sum -= value
+        if self._sketch is not None:
+            self._sketch.remove(value)
+
+        if self._min and self._min[0][0] == sequence:
+            self._min.popleft()
+        if self._max and self._max[0][0] == sequence:
+            self._max.popleft()
+
+    def _extreme(self, extreme: deque | float) -> Optional[float]:
+        if self._count == 0:
+            return None
+
+        if self._sliding:
+            return extreme[0][1]
+
+        return extreme
+
+
+class _WindowState:
+    __slots__ = ("aggregate", "start", "end", "last_timestamp", "source_topic", "sink_topic", "sequence")
+
+    def __init__(
+        self, aggregate: WindowAggregate, start: float, end: float,
+        source_topic: str, sink_topic: TopicName, sequence: int
+    ):
+        self.aggregate = aggregate
+        self.start = start
+        self.end = end
+        self.last_timestamp = start
+        self.source_topic = source_topic
+        self.sink_topic = sink_topic
+        self.sequence = sequence
+
+
+class WindowStage:
+    _logger: logging.Logger
+    _window_type: WindowType
+    _size: float | None
+    _slide: float | None
+    _gap: float | None
+    _key: str
+    _field: str | None
+    _aggregates: List[str]
+    _max_keys: int
+    _max_samples: int
+    _states: "OrderedDict[str, _WindowState]"
+    _deadlines: List[Tuple[float, int, str]]
+    _sequence: Iterator[int]
+    _next_slide: float | None
+
+    def __init__(
+        self,
+        name: str,
+        window_type: WindowType,
+        aggregates: List[str],
+        size: float | None = None,
+        slide: float | None = None,
+        gap: float | None = None,
+        key: str = "topic",
+        field: str | None = None,
+        max_keys: int = 10000,
+        max_samples: int = 10000,
+    ):
+        self._logger = logging.getLogger(__name__ + "=" + name)
+        self._window_type = window_type
+        self._size = size
+        self._slide = size if slide is None else slide
+        self._gap = gap
+        self._key = key
+        self._field = field
+        self._aggregates = aggregates
+        self._max_keys = max_keys
+        self._max_samples = max_samples
+        self._states = OrderedDict()
+        self._deadlines = list()
+        self._sequence = itertools.count()
+        self._next_slide = None
+
+    def add(
+        self, body: Any, actual_source_topic: TopicName, matches: Dict[str, str],
+        sink_topic_factory: SinkTopicFactory, timestamp: float
+    ) -> List[WindowEmission]:
+        value = self._extract_value(body)
+        if value is None:
+            return []
+
+        if self._key == "topic":
+            key = actual_source_topic.rule
+        else:
+            key = matches.get(self._key, actual_source_topic.rule)
+
+        emissions = list()
+
+        state = self._states.get(key)
+        if state is not None and self._is_state_closed(state, timestamp):
+            emissions.append(self._emit(key, state))
+            state = None
+
+        if state is None:
+            if len(self._states) >= self._max_keys:
+                evicted_key, evicted_state = self._states.popitem(last=False)
+                self._logger.warning("Too many window keys, emitting `%s` early", evicted_key)
+                emissions.append(self._create_emission(evicted_state))
+
+            state = self._create_state(key, actual_source_topic, sink_topic_factory, timestamp)
+        else:
+            self._states.move_to_end(key)
+
+            if state.source_topic != actual_source_topic.rule:
+                state.source_topic = actual_source_topic.rule
+                state.sink_topic = sink_topic_factory(actual_source_topic)
+
+        if self._window_type == WindowType.SLIDING:
+            state.aggregate.expire(timestamp - self._size)
+        elif self._window_type == WindowType.SESSION:
+            state.end = timestamp + self._gap
+
+        state.last_timestamp = max(state.last_timestamp, timestamp)
+        state.aggregate.add(timestamp, value)
+
+        return emissions
+
+    def tick(self, now: float) -> List[WindowEmission]:
+        if self._window_type == WindowType.SLIDING:
+            return self._tick_sliding(now)
+
+        emissions = list()
+        while self._deadlines and self._deadlines[0][0] <= now:
+            deadline, sequence, key = heapq.heappop(self._deadlines)
+
+            state = self._states.get(key)
+            if state is None or state.sequence != sequence:
+                continue
+
+            # Sessions extend their deadline without touching the heap
+            if state.end > deadline:
+                heapq.heappush(self._deadlines, (state.end, sequence, key))
+                continue
+
+            emissions.append(self._emit(key, state))
+
+        return emissions
+
+    def next_deadline(self) -> float | None:
+        if self._window_type == WindowType.SLIDING:
+            return self._next_slide
+
+        return self._deadlines[0][0] if self._deadlines else None
+
+    def _tick_sliding(self, now: float) -> List[WindowEmission]:
+        emissions = list()
+        while self._next_slide is not None and self._next_slide <= now:
+            window_end = self._next_slide
+            for key, state in list(self._states.items()):
+                state.aggregate.expire(window_end - self._size)
+                if state.aggregate.count == 0:
+                    del self._states[key]
+                    continue
+
+                state.start, state.end = window_end - self._size, window_end
+                emissions.append(self._create_emission(state))
+
+            self._next_slide = window_end + self._slide if self._states else None
+
+        return emissions
+
+    def _is_state_closed(self, state: _WindowState, timestamp: float) -> bool:
+        # Sliding windows never close, their samples expire instead
+        return self._window_type != WindowType.SLIDING and timestamp >= state.end
+
+    def _create_state(
+        self, key: str, actual_source_topic: TopicName,
+        sink_topic_factory: SinkTopicFactory, timestamp: float
+    ) -> _WindowState:
+        if self._window_type == WindowType.TUMBLING:
+            start = math.floor(timestamp / self._size) * self._size
+            end = start + self._size
+        elif self._window_type == WindowType.SESSION:
+            start, end = timestamp, timestamp + self._gap
+        else:
+            start, end = timestamp - self._size, timestamp
+            if self._next_slide is None:
+                self._next_slide = (math.floor(timestamp / self._slide) + 1) * self._slide
+
+        state = _WindowState(
+            aggregate=WindowAggregate(
+                need_min="min" in self._aggregates,
+                need_max="max" in self._aggregates,
+                need_percentiles=any(a.startswith("p") for a in self._aggregates),
+                sliding=self._window_type == WindowType.SLIDING,
+                max_samples=self._max_samples,
+            ),
+            start=start,
+            end=end,
+            source_topic=actual_source_topic.rule,
+            sink_topic=sink_topic_factory(actual_source_topic),
+            sequence=next(self._sequence),
+        )
+        self._states[key] = state
+
+        if self._window_type != WindowType.SLIDING:
+            heapq.heappush(self._deadlines, (end, state.sequence, key))
+
+        return state
+
+    def _emit(self, key: str, state: _WindowState) -> WindowEmission:
+        del self._states[key]
+        return self._create_emission(state)
+
+    def _create_emission(self, state: _WindowState) -> WindowEmission:
+        result = state.aggregate.result(self._aggregates)
+        result["start"] = state.start
+        result["end"] = state.last_timestamp if self._window_type == WindowType.SESSION else state.end
+
+        return state.sink_topic, result
+
+    def _extract_value(self, body: Any) -> float | None:
+        try:
+            if self._field is not None:
+                body = body[self._field]
+
+            value = float(body)
+        except (KeyError, IndexError, TypeError, ValueError):
+            self._logger.warning("Can't aggregate value of type %s", type(body).__name__)
+            return None
+
+        # NaN and infinities would poison the sums and can't be placed to a sketch bucket
+        if not math.isfinite(value):
+            self._logger.warning("Can't aggregate non-finite value %s", value)
+            return None
+
+        return value
@@ -5,6 +5,8 @@ from typing import TextIO, List
 import pytest
 from _pytest.fixtures import SubRequest
 
+import mqttprocessor.builtin.converters
+import mqttprocessor.builtin.rules
 import mqttprocessor.functions
 from mqttprocessor.functions import ProcessorFunction, create_functions
 from mqttprocessor.messages import routedmessage
@@ -25,6 +27,18 @@ def converter() -> type(mqttprocessor.functions.converter):
     return mqttprocessor.functions.converter
 
 
+@pytest.fixture(scope="function")
+def identity() -> str:
+    reload(mqttprocessor.functions)
+    reload(mqttprocessor.builtin.converters)
+
+    @mqttprocessor.functions.converter
+    def identity(x):
+        return x
+
+    return "identity"
+
+
 @pytest.fixture(scope="function")
 def config_file_stream(request: SubRequest) -> TextIO:
     path = Path("tests/testcase_files/config/" + request.param)
@@ -167,6 +181,15 @@ def processor_functions_hierarchical(request: SubRequest) -> List[ProcessorFunct
     return _create_functions(request)
 
 
+@pytest.fixture(scope="function")
+def builtin_functions(request: SubRequest) -> List[ProcessorFunction]:
+    reload(mqttprocessor.functions)
+    reload(mqttprocessor.builtin.converters)
+    reload(mqttprocessor.builtin.rules)
+
+    return _create_functions(request)
+
+
 def _create_functions(request: SubRequest) -> List[ProcessorFunction]:
     register = mqttprocessor.functions.create_processor_register()
     models = _create_function_models(request)
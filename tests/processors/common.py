@@ -1,8 +1,9 @@
-from typing import List, Tuple
+from typing import Any, Dict, List, Tuple
 
 from mqttprocessor.functions import ProcessorFunction
 from mqttprocessor.messages import TopicName
-from mqttprocessor.routing import SingleSourceProcessor
+from mqttprocessor.models import ProcessorConfigModel
+from mqttprocessor.routing import Processor, ProcessorCreator, SingleSourceProcessor
 
 
 def _create_single_source_processor(
@@ -26,3 +27,12 @@ def _create_single_source_processor(
     )
 
     return processor, source_topic, sink_topic
+
+
+def _create_processor(
+        function: str | List[str | Dict[str, Any]], source: str = "in", sink: str = "out",
+        **config: Any
+) -> Processor:
+    return ProcessorCreator(ProcessorConfigModel(
+        source=source, sink=sink, function=function, **config
+    )).create()
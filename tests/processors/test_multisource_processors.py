@@ -2,6 +2,7 @@ from typing import List
 
 import pytest
 
+from mqttprocessor.definitions import ProcessorFunctionType, SourceMatchMode
 from mqttprocessor.messages import TopicName, Message
 from mqttprocessor.functions import ProcessorFunction
 from mqttprocessor.routing import Processor
@@ -72,3 +73,50 @@ def test_processor_matching_dynamic_sink(processor_functions: List[ProcessorFunc
     ]
 
     assert proc.process_message("source/room100/dev1", "") == expected
+
+
+def _create_counting_processor(match_mode: SourceMatchMode, accept: bool = True):
+    calls = list()
+
+    def count(val, special_params):
+        calls.append(special_params["matches"])
+        return val if accept else None
+
+    function = ProcessorFunction(
+        ProcessorFunctionType.CONVERTER, count, expects_matches=True, expects_source_topic=False
+    )
+    processor = Processor(
+        "multi-processor", [function],
+        [TopicName("{w1}/dev1"), TopicName("room1/{w2}"), TopicName("room2/{w3}")],
+        TopicName("sink"),
+        match_mode=match_mode,
+    )
+
+    return processor, calls
+
+
+@pytest.mark.parametrize(
+    "match_mode, accept, expected_calls, expected_messages",
+    [
+        (SourceMatchMode.FIRST_OUTPUT, True, [{"w1": "room1"}], 1),
+        (SourceMatchMode.FIRST_OUTPUT, False, [{"w1": "room1"}, {"w2": "dev1"}], 0),
+        (SourceMatchMode.FIRST_MATCH, False, [{"w1": "room1"}], 0),
+        (SourceMatchMode.ALL_MATCHES, True, [{"w1": "room1"}, {"w2": "dev1"}], 2),
+    ]
+)
+def test_processor_match_modes(
+    match_mode: SourceMatchMode, accept: bool, expected_calls: List[dict], expected_messages: int
+):
+    processor, calls = _create_counting_processor(match_mode, accept)
+
+    output_messages = processor.process_message("room1/dev1", "value")
+
+    assert calls == expected_calls
+    assert output_messages == [Message(TopicName("sink"), "value")] * expected_messages
+
+
+def test_processor_match_mode_skips_not_matching_sources():
+    processor, calls = _create_counting_processor(SourceMatchMode.ALL_MATCHES)
+
+    assert processor.process_message("room2/dev2", "value") == [Message(TopicName("sink"), "value")]
+    assert calls == [{"w3": "dev2"}]
@@ -2,7 +2,8 @@ from typing import List
 
 import pytest
 
-from mqttprocessor.messages import TopicName, Message
+from mqttprocessor.definitions import RoutedMessageShape
+from mqttprocessor.messages import TopicName, Message, RoutedMessage
 from mqttprocessor.functions import ProcessorFunction
 
 from tests.processors.common import _create_single_source_processor
@@ -136,3 +137,26 @@ def test_routed_message_tuple_containing_single(processor_functions_routed: List
     ]
 
     assert actual == expected
+
+
+@pytest.mark.parametrize(
+    "payload,expected_shape",
+    [
+        ({"topic": "message"}, RoutedMessageShape.DICT_OF_ROUTES_AND_MESSAGES),
+        (["message1", "message2"], RoutedMessageShape.LIST_OF_MESSAGES_WITHOUT_ROUTES),
+        (("topic", ["message1", "message2"]), RoutedMessageShape.SINGLE_ROUTE_AND_LIST_OF_MESSAGES),
+        (("topic", "message"), RoutedMessageShape.SINGLE_ROUTE_AND_SINGLE_MESSAGE),
+        (("topic", "message", "message"), RoutedMessageShape.UNKNOWN),
+        ("message", RoutedMessageShape.UNKNOWN),
+    ]
+)
+def test_routed_message_shape(payload, expected_shape: RoutedMessageShape):
+    assert RoutedMessage(payload).shape == expected_shape
+
+
+def test_messages_without_dict():
+    message = Message(TopicName("topic"), "message")
+
+    assert not hasattr(message, "__dict__")
+    assert not hasattr(message.sink_topic, "__dict__")
+    assert not hasattr(RoutedMessage([]), "__dict__")
@@ -0,0 +1,87 @@
+from typing import List
+
+import pytest
+
+from mqttprocessor.functions import ProcessorFunction
+
+
+def _passes(function: ProcessorFunction, values: List, source_topic: str = "dev1/value") -> List[bool]:
+    return [bool(function.callback(value, source_topic, {})) for value in values]
+
+
+@pytest.mark.parametrize(
+    "builtin_functions",
+    [
+        [("deadband_absolute", {"threshold": 1})]
+    ], indirect=True
+)
+def test_deadband_absolute(builtin_functions: List[ProcessorFunction]):
+    function = builtin_functions[0]
+
+    assert _passes(function, [10, 10.5, 11, 11.9, 9.9]) == [True, False, True, False, True]
+    assert _passes(function, [10], source_topic="dev2/value") == [True]
+
+
+@pytest.mark.parametrize(
+    "builtin_functions",
+    [
+        [("deadband_percent", {"percent": 10})]
+    ], indirect=True
+)
+def test_deadband_percent(builtin_functions: List[ProcessorFunction]):
+    function = builtin_functions[0]
+
+    assert _passes(function, [100, 109, 110, 100, 0, 0, 1]) == [True, False, True, False, True, False, True]
+
+
+@pytest.mark.parametrize(
+    "builtin_functions",
+    [
+        ["value_changed"]
+    ], indirect=True
+)
+def test_value_changed(builtin_functions: List[ProcessorFunction]):
+    function = builtin_functions[0]
+
+    assert _passes(function, [None, None, "a", "a", {"b": 1}, {"b": 1}]) == [True, False, True, False, True, False]
+
+
+@pytest.mark.parametrize(
+    "builtin_functions",
+    [
+        [("min_interval", {"interval": 3600})]
+    ], indirect=True
+)
+def test_min_interval(builtin_functions: List[ProcessorFunction]):
+    function = builtin_functions[0]
+
+    assert _passes(function, [1, 2]) == [True, False]
+    assert _passes(function, [3], source_topic="dev2/value") == [True]
+
+
+@pytest.mark.parametrize(
+    "builtin_functions",
+    [
+        [("min_interval", {"interval": 10})]
+    ], indirect=True
+)
+def test_min_interval_timed_by_message(builtin_functions: List[ProcessorFunction]):
+    function = builtin_functions[0]
+
+    assert [
+        bool(function.callback(value, "dev1/value", {}, None, timestamp))
+        for value, timestamp in [(1, 100.0), (2, 105.0), (3, 110.0), (4, 119.0)]
+    ] == [True, False, True, False]
+
+
+@pytest.mark.parametrize(
+    "builtin_functions",
+    [
+        [("deadband_absolute", {"threshold": 1}), ("deadband_absolute", {"threshold": 1})]
+    ], indirect=True
+)
+def test_stateful_functions_have_separate_state(builtin_functions: List[ProcessorFunction]):
+    first, second = builtin_functions
+
+    assert _passes(first, [10, 10.5]) == [True, False]
+    assert _passes(second, [10.5]) == [True]
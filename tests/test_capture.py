@@ -0,0 +1,129 @@
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+
+from mqttprocessor.capture import (
+    CapturedMessage,
+    CaptureFormat,
+    CaptureWriter,
+    MappedCapture,
+    read_capture,
+)
+
+_MESSAGES = [
+    CapturedMessage("device1/temperature", b'{"value": 21.5}', qos=1, retain=True, timestamp=10.0),
+    CapturedMessage("device2/raw", b"\x00\xff\x10", qos=0, retain=False, timestamp=10.25),
+    CapturedMessage("device3/empty", b"", qos=2, retain=False, timestamp=11.0),
+]
+
+
+@pytest.mark.parametrize(
+    "capture_format", [CaptureFormat.BINARY, CaptureFormat.JSON_LINES]
+)
+def test_capture_roundtrip(capture_format: CaptureFormat):
+    stream = BytesIO()
+    writer = CaptureWriter(stream, capture_format)
+    for message in _MESSAGES:
+        writer.write(message)
+
+    stream.seek(0)
+
+    assert list(read_capture(stream)) == _MESSAGES
+
+
+def test_read_json_lines_defaults():
+    stream = BytesIO(b'{"topic": "a/b", "payload": "text"}\n\n{"topic": "c", "payload_base64": "AAE="}\n')
+
+    expected = [
+        CapturedMessage("a/b", b"text"),
+        CapturedMessage("c", b"\x00\x01"),
+    ]
+
+    assert list(read_capture(stream)) == expected
+
+
+def test_read_truncated_binary_capture():
+    stream = BytesIO()
+    CaptureWriter(stream, CaptureFormat.BINARY).write(_MESSAGES[0])
+
+    truncated = BytesIO(stream.getvalue()[:-3])
+    with pytest.raises(ValueError):
+        list(read_capture(truncated))
+
+
+def test_capture_format_from_path():
+    assert CaptureFormat.from_path("traffic.jsonl") == CaptureFormat.JSON_LINES
+    assert CaptureFormat.from_path("traffic.mqcap") == CaptureFormat.BINARY
+
+
+def _write_binary_capture(path: Path, count: int):
+    with open(path, "wb") as f:
+        writer = CaptureWriter(f, CaptureFormat.BINARY)
+        for i in range(count):
+            writer.write(CapturedMessage(f"device{i}/value", f"payload{i}".encode(), timestamp=float(i)))
+
+
+def test_mapped_capture_messages(tmp_path: Path):
+    path = tmp_path / "traffic.mqcap"
+    _write_binary_capture(path, 10)
+
+    with MappedCapture(str(path)) as capture:
+        assert len(capture) == 10
+
+        views = list(capture.messages(3, 5))
+        assert all(isinstance(view.payload, memoryview) for view in views)
+        assert [view.to_message() for view in views] == [
+            CapturedMessage("device3/value", b"payload3", timestamp=3.0),
+            CapturedMessage("device4/value", b"payload4", timestamp=4.0),
+        ]
+
+        del views
+
+
+def test_mapped_capture_index(tmp_path: Path):
+    path = tmp_path / "traffic.mqcap"
+    _write_binary_capture(path, 10)
+
+    MappedCapture(str(path)).close()
+    assert (tmp_path / "traffic.mqcap.idx").exists()
+
+    _write_binary_capture(path, 20)
+    with MappedCapture(str(path)) as capture:
+        assert len(capture) == 20
+
+
+def test_mapped_capture_find_timestamp(tmp_path: Path):
+    path = tmp_path / "traffic.mqcap"
+    _write_binary_capture(path, 10)
+
+    with MappedCapture(str(path)) as capture:
+        assert capture.find_timestamp(-1.0) == 0
+        assert capture.find_timestamp(4.0) == 4
+        assert capture.find_timestamp(4.5) == 5
+        assert capture.find_timestamp(100) == 10
+        assert [view.timestamp for view in capture.messages(capture.find_timestamp(8.5))] == [9.0]
+
+
+def test_mapped_capture_partition(tmp_path: Path):
+    path = tmp_path / "traffic.mqcap"
+    with open(path, "wb") as f:
+        writer = CaptureWriter(f, CaptureFormat.BINARY)
+        for i in range(30):
+            writer.write(CapturedMessage(f"device{i % 7}/value", f"payload{i}".encode()))
+
+    with MappedCapture(str(path)) as capture:
+        partitions = capture.partition(3)
+        assert sorted(record for records in partitions for record in records) == list(range(30))
+
+        topics = [{view.topic for view in capture.select(records)} for records in partitions]
+        assert sum(len(partition_topics) for partition_topics in topics) == 7
+        assert all(list(records) == sorted(records) for records in partitions)
+
+
+def test_mapped_capture_requires_uncompressed_binary(tmp_path: Path):
+    path = tmp_path / "traffic.jsonl"
+    path.write_bytes(b'{"topic": "a", "payload": "b"}\n')
+
+    with pytest.raises(ValueError):
+        MappedCapture(str(path))
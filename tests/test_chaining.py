@@ -0,0 +1,109 @@
+from typing import Callable
+
+import pytest
+from pydantic import ValidationError
+
+from mqttprocessor.dispatch import Dispatcher
+from mqttprocessor.messages import TopicName, Message
+from mqttprocessor.models import ConfigModel, ProcessorConfigModel
+from mqttprocessor.routing import ProcessorCreator
+from tests.processors.common import _create_processor
+
+
+@pytest.fixture
+def increment(converter: Callable) -> str:
+    @converter
+    def increment(x):
+        return int(x) + 1
+
+    return "increment"
+
+
+def _create_processors(increment: str, publish: bool):
+    return [
+        _create_processor(
+            increment, "input/{w1}", "stage/{w1}", name="first", input_format="binary",
+            internal=True, publish=publish,
+        ),
+        _create_processor(
+            increment, "stage/{w1}", "output/{w1}", name="second", input_format="binary"
+        ),
+    ]
+
+
+def test_internal_route(increment: str):
+    dispatcher = Dispatcher(_create_processors(increment, publish=False))
+
+    assert dispatcher.process_message("input/dev1", b"1") == [
+        Message(TopicName("output/dev1"), 3)
+    ]
+
+
+def _create_published_route(increment: str, **kwargs) -> Dispatcher:
+    config = ConfigModel(processors=[
+        {
+            "name": "first", "source": "input/{w1}", "sink": "stage/{w1}", "function": increment,
+            "input_format": "binary", "internal": True, "publish": True,
+        },
+        {
+            "name": "second", "source": "stage/{w1}", "sink": "output/{w1}", "function": increment,
+            "input_format": "binary",
+        },
+    ])
+
+    return Dispatcher(
+        [ProcessorCreator(processor).create() for processor in config.processors], **kwargs
+    )
+
+
+def test_internal_route_published(increment: str):
+    dispatcher = _create_published_route(increment)
+
+    # The published message is tagged, so its echo from the broker is dropped
+    assert dispatcher.process_message("input/dev1", b"1") == [
+        Message(TopicName("output/dev1"), 3),
+        Message(TopicName("stage/dev1"), 2, echo=True),
+    ]
+
+
+def test_internal_route_published_without_echo_tags(increment: str):
+    dispatcher = _create_published_route(increment, tag_echoes=False)
+
+    # The subscribed processor receives the published message from the broker only
+    assert dispatcher.process_message("input/dev1", b"1") == [
+        Message(TopicName("stage/dev1"), 2),
+    ]
+    assert dispatcher.process_message("stage/dev1", b"2") == [
+        Message(TopicName("output/dev1"), 3)
+    ]
+
+
+def test_internal_route_depth_is_limited(increment: str):
+    processor = _create_processor(
+        increment, "loop/{w1}", "loop/{w1}", name="loop", input_format="binary",
+        internal=True, publish=False,
+    )
+
+    assert Dispatcher([processor]).process_message("loop/dev1", b"1") == []
+
+
+def test_processor_publish_default():
+    assert ProcessorConfigModel(source="a", sink="b", function="f").publish
+    assert not ProcessorConfigModel(source="a", sink="b", function="f", internal=True).publish
+
+    with pytest.raises(ValidationError):
+        ProcessorConfigModel(source="a", sink="b", function="f", publish=False)
+
+
+def test_internal_route_cycle():
+    processors = [
+        {"name": "first", "source": "a/{w1}", "sink": "b/{w1}", "function": "f", "internal": True},
+        {"name": "second", "source": "b/{w1}", "sink": "c/{w1}", "function": "f", "internal": True},
+        {"name": "third", "source": "c/dev1", "sink": "a/dev1", "function": "f", "internal": True},
+    ]
+
+    with pytest.raises(ValidationError, match="first -> second -> third -> first"):
+        ConfigModel(processors=processors)
+
+    processors[2]["internal"] = False
+    ConfigModel(processors=processors)
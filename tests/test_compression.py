@@ -0,0 +1,112 @@
+import json
+from pathlib import Path
+
+import pytest
+from pydantic import ValidationError
+
+from mqttprocessor import compression
+from mqttprocessor.messages import Message, TopicName
+from mqttprocessor.models import ProcessorConfigModel
+from tests.processors.common import _create_processor
+
+DOCUMENT = {"device": "d1", "values": list(range(100))}
+
+
+@pytest.mark.parametrize("compression_type, module", [
+    ("gzip", "gzip"), ("zstd", "zstandard"), ("lz4", "lz4"),
+])
+def test_compression_round_trip(identity: str, compression_type: str, module: str):
+    pytest.importorskip(module)
+    compressor = _create_processor(
+        identity, output_format="json", output_compression={"type": compression_type, "level": 1}
+    )
+    decompressor = _create_processor(identity, input_compression=compression_type)
+
+    compressed, = compressor.process_message("in", json.dumps(DOCUMENT).encode("utf8"))
+    assert len(compressed.message_body) < len(json.dumps(DOCUMENT))
+    assert decompressor.process_message("in", compressed.message_body) == [
+        Message(TopicName("out"), DOCUMENT)
+    ]
+
+
+def test_compression_without_output_format(identity: str):
+    processor = _create_processor(identity, input_format="string", output_compression="gzip")
+
+    output, = processor.process_message("in", b"text")
+    assert compression.gzip_decompress(output.message_body) == b"text"
+
+
+def test_gzip_compression_deterministic():
+    assert compression.gzip_compress(b"data") == compression.gzip_compress(b"data")
+
+
+def test_zstd_dictionary(identity: str, tmp_path: Path):
+    zstandard = pytest.importorskip("zstandard")
+    samples = [
+        json.dumps({"device": f"device-{n}", "temperature": n % 30, "status": "ok"}).encode("utf8")
+        for n in range(1000)
+    ]
+    dictionary = tmp_path / "readings.dict"
+    dictionary.write_bytes(zstandard.train_dictionary(1024, samples).as_bytes())
+
+    config = {"type": "zstd", "dictionary": str(dictionary)}
+    compressor = _create_processor(identity, input_format="binary", output_compression=config)
+    decompressor = _create_processor(identity, input_format="binary", input_compression=config)
+
+    compressed, = compressor.process_message("in", samples[42])
+    assert len(compressed.message_body) < len(compression.zstd_compress(samples[42]))
+    assert decompressor.process_message("in", compressed.message_body) == [
+        Message(TopicName("out"), samples[42])
+    ]
+
+
+@pytest.mark.parametrize("codec, module", [
+    ("gzip", "gzip"), ("zstd", "zstandard"), ("lz4", "lz4"),
+])
+def test_multiple_frames(codec: str, module: str):
+    pytest.importorskip(module)
+    compress = getattr(compression, f"{codec}_compress")
+    decompress = getattr(compression, f"{codec}_decompress")
+
+    assert decompress(compress(b"first") + compress(b"second")) == b"firstsecond"
+
+
+@pytest.mark.parametrize("codec, module", [
+    ("gzip", "gzip"), ("zstd", "zstandard"), ("lz4", "lz4"),
+])
+def test_decompressed_size_limited(codec: str, module: str, monkeypatch: pytest.MonkeyPatch):
+    pytest.importorskip(module)
+    monkeypatch.setattr(compression, "MAX_DECOMPRESSED_SIZE", 1024)
+    compress = getattr(compression, f"{codec}_compress")
+    decompress = getattr(compression, f"{codec}_decompress")
+
+    assert decompress(compress(b"\0" * 1024)) == b"\0" * 1024
+    with pytest.raises(ValueError):
+        decompress(compress(b"\0" * 1025))
+    with pytest.raises(ValueError):
+        decompress(compress(b"\0" * 1000) + compress(b"\0" * 1000))
+
+
+def test_truncated_payload():
+    with pytest.raises(EOFError):
+        compression.gzip_decompress(compression.gzip_compress(b"data" * 100)[:-4])
+
+
+def test_compression_model():
+    config = ProcessorConfigModel(source="in", sink="out", function="f", input_compression="zstd")
+    assert config.input_compression.type.value == "zstd"
+
+    with pytest.raises(ValidationError):
+        ProcessorConfigModel(
+            source="in", sink="out", function="f",
+            output_compression={"type": "gzip", "dictionary": "gzip.dict"},
+        )
+
+
+def test_missing_dictionary_reported_on_creation(identity: str, tmp_path: Path):
+    pytest.importorskip("zstandard")
+
+    with pytest.raises(FileNotFoundError):
+        _create_processor(
+            identity, output_compression={"type": "zstd", "dictionary": str(tmp_path / "missing")}
+        )
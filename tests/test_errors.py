@@ -0,0 +1,175 @@
+import json
+import logging
+from typing import Callable, List
+
+import pytest
+from pydantic import ValidationError
+
+from mqttprocessor.definitions import ProcessorFunctionType
+from mqttprocessor.dispatch import Dispatcher
+from mqttprocessor.errors import ErrorPolicy, FailureLog
+from mqttprocessor.functions import ProcessorFunction, create_functions, create_processor_register
+from mqttprocessor.messages import Message, TopicName
+from mqttprocessor.models import ExtendedFunctionModel, ProcessorConfigModel
+from mqttprocessor.routing import Processor
+from tests.processors.common import _create_processor
+
+
+def _failing(converter: Callable, failures: int, calls: List[bytes], name: str = "parse") -> str:
+    def parse(val):
+        calls.append(val)
+        if len(calls) <= failures:
+            raise ValueError(f"attempt {len(calls)}")
+        return val.decode("utf8").upper()
+
+    converter(parse, name=name)
+    return name
+
+
+def _create_functions(name: str) -> List[ProcessorFunction]:
+    return create_functions([ExtendedFunctionModel(name=name)], create_processor_register())
+
+
+def _create_failing_processor(function: str, **policy) -> Processor:
+    return _create_processor(
+        function, "{w1}/in", "{w1}/out", name="p", input_format="binary", on_error=policy
+    )
+
+
+def test_failed_message_retried_with_backoff(converter: Callable):
+    calls = list()
+    processor = _create_failing_processor(_failing(converter, 2, calls), retries=3, backoff=1.0)
+
+    assert processor.has_timers
+    assert processor.process_message("a/in", b"x", timestamp=0) == []
+    assert processor.next_deadline() == 1.0
+
+    assert processor.tick(0.5) == []
+    assert processor.tick(1.0) == []
+    assert processor.next_deadline() == 3.0
+
+    assert processor.tick(3.0) == [Message(TopicName("a/out"), "X")]
+    assert processor.next_deadline() is None
+    assert calls == [b"x"] * 3
+
+
+def test_failed_message_sent_to_dead_letter_topic(converter: Callable):
+    calls = list()
+    processor = _create_failing_processor(
+        _failing(converter, 10, calls), retries=1, backoff=2.0, dead_letter="{w1}/dead"
+    )
+
+    assert processor.process_message("a/in", b"x", timestamp=0) == []
+    dead_letter, = processor.tick(2.0)
+
+    assert dead_letter.sink_topic == TopicName("a/dead")
+    assert json.loads(dead_letter.message_body) == {
+        "processor": "p",
+        "source_topic": "a/in",
+        "function": "parse",
+        "error": "ValueError",
+        "error_message": "attempt 2",
+        "attempts": 2,
+        "timestamp": 2.0,
+        "payload": "x",
+    }
+
+
+def test_dead_letter_without_retries(converter: Callable):
+    processor = _create_failing_processor(_failing(converter, 1, list()), dead_letter="dead")
+
+    dead_letter, = processor.process_message("a/in", b"\xff", timestamp=0)
+    assert json.loads(dead_letter.message_body)["payload_base64"] == "/w=="
+    assert not processor.has_timers
+
+
+def test_dead_letter_when_retry_queue_full(converter: Callable):
+    processor = _create_failing_processor(
+        _failing(converter, 10, list()), retries=1, max_queue=1, dead_letter="dead"
+    )
+
+    assert processor.process_message("a/in", b"x", timestamp=0) == []
+    assert len(processor.process_message("a/in", b"y", timestamp=0)) == 1
+
+
+def test_dead_letter_bypasses_output_encoding(converter: Callable):
+    def encode(val, special_params):
+        return b"encoded"
+
+    processor = Processor(
+        "p", _create_functions(_failing(converter, 1, list())), [TopicName("in")], TopicName("out"),
+        output_functions=[ProcessorFunction(ProcessorFunctionType.CONVERTER, encode, False, False)],
+        error_policy=ErrorPolicy("p", dead_letter=TopicName("dead")),
+    )
+
+    dead_letter, = processor.process_message("in", b"x")
+    assert json.loads(dead_letter.message_body)["function"] == "parse"
+    assert processor.process_message("in", b"x") == [Message(TopicName("out"), b"encoded")]
+
+
+def test_encoding_failure_sent_to_dead_letter_topic(
+        converter: Callable, caplog: pytest.LogCaptureFixture
+):
+    def encode(val, special_params):
+        raise TypeError("unsupported")
+
+    processor = Processor(
+        "p", _create_functions(_failing(converter, 0, list())),
+        [TopicName("{w1}/in")], TopicName("{w1}/out"),
+        output_functions=[ProcessorFunction(ProcessorFunctionType.CONVERTER, encode, False, False)],
+        error_policy=ErrorPolicy("p", dead_letter=TopicName("{w1}/dead")),
+    )
+
+    with caplog.at_level(logging.ERROR):
+        dead_letter, = processor.process_message("a/in", b"x", timestamp=0)
+        assert len(processor.process_message("a/in", b"y", timestamp=0)) == 1
+
+    assert dead_letter.sink_topic == TopicName("a/dead")
+    assert json.loads(dead_letter.message_body)["function"] == "encode"
+    assert json.loads(dead_letter.message_body)["payload"] == "X"
+    assert len(caplog.records) == 1
+
+
+def test_failure_log_rate_limited(caplog: pytest.LogCaptureFixture):
+    log = FailureLog(logging.getLogger("test"), interval=10.0)
+
+    with caplog.at_level(logging.ERROR):
+        for now in range(25):
+            log.failed("parse", ValueError("bad"), now=float(now))
+
+    assert [record.getMessage() for record in caplog.records] == [
+        "Function parse failed to execute",
+        "Function parse failed to execute (9 more failures since the last report)",
+        "Function parse failed to execute (9 more failures since the last report)",
+    ]
+    assert caplog.records[0].exc_info is not None
+
+
+def test_error_policy_model():
+    config = ProcessorConfigModel(
+        source="{w1}/in", sink="out", function="f",
+        on_error={"retries": 2, "dead_letter": "{w1}/dead"},
+    )
+    assert config.on_error.dead_letter.__root__ == "{w1}/dead"
+
+    with pytest.raises(ValidationError):
+        ProcessorConfigModel(
+            source=["{w1}/a", "{w1}/b"], sink="out", function="f",
+            join={"key": "w1"}, on_error={"retries": 1},
+        )
+
+
+def test_retried_message_keeps_delivery(converter: Callable):
+    dispatcher = Dispatcher([
+        _create_failing_processor(_failing(converter, 1, list()), retries=1, backoff=1.0),
+        _create_processor(
+            _failing(converter, 1, list(), name="parse_again"), "{w1}/in", "{w1}/qos",
+            name="q", input_format="binary", qos=2, on_error={"retries": 1, "backoff": 1.0},
+        ),
+    ])
+
+    assert dispatcher.process_message("a/in", b"x", 0, qos=1, retain=True) == []
+    assert dispatcher.tick(1.0) == [
+        Message(TopicName("a/out"), "X", qos=1, retain=True),
+        Message(TopicName("a/qos"), "X", qos=2, retain=True),
+    ]
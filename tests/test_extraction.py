@@ -0,0 +1,111 @@
+import json
+from typing import List
+
+import pytest
+from pydantic import ValidationError
+
+import mqttprocessor.extraction
+from mqttprocessor.extraction import JsonFieldExtractor, _skip_value
+from mqttprocessor.functions import ProcessorFunction
+from mqttprocessor.models import ProcessorConfigModel
+
+DOCUMENT = {
+    "device": "d1",
+    "status": {"code": 1, "text": "ok", "flags": [1, 2]},
+    "samples": [{"t": 1, "v": 0.5}, {"t": 2, "v": 1.0}],
+    "name \"quoted\"": "x",
+    "summary": {"mean": 0.75},
+}
+
+
+@pytest.mark.parametrize("paths, expected", [
+    (["device"], {"device": "d1"}),
+    (["status.code", "summary.mean"], {"status": {"code": 1}, "summary": {"mean": 0.75}}),
+    (["status", "status.code"], {"status": DOCUMENT["status"]}),
+    (["status.code", "status"], {"status": DOCUMENT["status"]}),
+    (["samples"], {"samples": DOCUMENT["samples"]}),
+    (["name \"quoted\""], {"name \"quoted\"": "x"}),
+    (["missing", "device"], {"device": "d1"}),
+    (["samples.t"], {}),
+    (["status.missing"], {"status": {}}),
+])
+def test_extract_fields(paths, expected):
+    extractor = JsonFieldExtractor(paths)
+
+    assert extractor.extract(json.dumps(DOCUMENT).encode("utf8")) == expected
+    assert extractor.extract(json.dumps(DOCUMENT, indent=2)) == expected
+
+
+def test_extract_stops_after_fields_found():
+    extractor = JsonFieldExtractor(["device", "status.code"])
+
+    assert extractor.extract(b'{"device": "d1", "status": {"code": 1, "text": "ok"}, "rest": [') == {
+        "device": "d1", "status": {"code": 1},
+    }
+
+
+def test_extract_falls_back_to_full_decode():
+    extractor = JsonFieldExtractor(["device"])
+
+    assert extractor.extract(b'[{"device": "d1"}]') == {}
+    with pytest.raises(ValueError):
+        extractor.extract(b'{"other": tru, "device": "d1"}')
+
+
+@pytest.mark.parametrize("skipped", [
+    [{"t": n, "v": n * 0.5, "tags": ["a]", "{b", "\\\"c\\"]} for n in range(20000)],
+    "x" * 100000 + "\\\\",
+    [[[[[[[["nested", {"a": ["]", "}"]}]]]]]]]],
+    [1, -2.5e-3, True, False, None, {}, []],
+])
+def test_extract_skips_members_before_field(skipped, monkeypatch: pytest.MonkeyPatch):
+    def _fail(document, tree):
+        raise AssertionError("Document decoded as a whole")
+
+    monkeypatch.setattr(mqttprocessor.extraction, "_extract_decoded", _fail)
+    extractor = JsonFieldExtractor(["device"])
+    document = json.dumps({"skipped": skipped, "other": skipped, "device": "d1"})
+
+    assert extractor.extract(document) == {"device": "d1"}
+    assert extractor.extract(document.replace(", ", ",\n ")) == {"device": "d1"}
+
+
+@pytest.mark.parametrize("container", [
+    '{"a": {"b": [1, {"c": []}], "d": {}}}',
+    '[[["]", "[", "\\"]"], {"}": "{"}], []]',
+    '{"a" : [ { "b" : [ ] } , "x" ] }',
+])
+def test_skip_nested_container(container: str):
+    text = f'{container}, "device": "d1"'
+
+    assert _skip_value(text, 0) == len(container)
+    assert JsonFieldExtractor(["device", "a.d"]).extract(
+        f'{{"skipped": {container}, "a": {{"b": {container}, "d": 1}}, "device": "d1"}}'
+    ) == {"device": "d1", "a": {"d": 1}}
+
+
+def test_extract_invalid_paths():
+    with pytest.raises(ValueError):
+        JsonFieldExtractor([])
+
+    with pytest.raises(ValueError):
+        JsonFieldExtractor(["status..code"])
+
+
+@pytest.mark.parametrize(
+    "builtin_functions", [[("extract_json_fields", {"fields": ["status.code"]})]], indirect=True
+)
+def test_extract_json_fields_converter(builtin_functions: List[ProcessorFunction]):
+    extract, = builtin_functions
+
+    assert extract.callback(json.dumps(DOCUMENT).encode("utf8"), "in", {}) == {"status": {"code": 1}}
+
+
+def test_processor_json_fields_model():
+    with pytest.raises(ValidationError):
+        ProcessorConfigModel(
+            source="in", sink="out", function="f", input_format="string", json_fields=["a"]
+        )
+
+    with pytest.raises(ValidationError):
+        ProcessorConfigModel(source="in", sink="out", function="f", json_fields=["a..b"])
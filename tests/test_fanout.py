@@ -0,0 +1,234 @@
+import threading
+from importlib import reload
+from typing import Any, List
+
+import pytest
+
+import mqttprocessor.functions
+import mqttprocessor.routing
+from mqttprocessor.dispatch import Dispatcher
+from mqttprocessor.fanout import copy_value
+from tests.processors.common import _create_processor
+
+
+@pytest.fixture(scope="function")
+def calls() -> List[str]:
+    reload(mqttprocessor.functions)
+    converter = mqttprocessor.functions.converter
+    rule = mqttprocessor.functions.rule
+    calls = list()
+
+    @converter
+    def decode(x):
+        calls.append("decode")
+        return {"value": int(x), "tags": []}
+
+    @converter
+    def tag(x, name):
+        calls.append("tag")
+        x["tags"].append(name)
+        return x
+
+    @rule
+    def is_positive(x):
+        calls.append("is_positive")
+        return x["value"] > 0
+
+    @converter
+    def count(x, state):
+        calls.append("count")
+        state.set("count", state.get("count", 0) + 1)
+        return x
+
+    return calls
+
+
+def test_shared_prefix_is_evaluated_once(calls: List[str]):
+    dispatcher = Dispatcher([
+        _create_processor(
+            ["decode", {"name": "tag", "arguments": {"name": "a"}}],
+            "{w1}/value", "a/{w1}", input_format="binary",
+        ),
+        _create_processor(
+            ["decode", {"name": "tag", "arguments": {"name": "b"}}],
+            "{w1}/value", "b/{w1}", input_format="binary",
+        ),
+        _create_processor(
+            ["decode", {"name": "tag", "arguments": {"name": "a"}}],
+            "{w1}/value", "c/{w1}", input_format="binary",
+        ),
+    ])
+
+    messages = dispatcher.process_message("dev1/value", b"5")
+
+    assert calls == ["decode", "tag", "tag"]
+    assert {msg.sink_topic.rule: msg.message_body["tags"] for msg in messages} == {
+        "a/dev1": ["a"], "b/dev1": ["b"], "c/dev1": ["a"]
+    }
+
+
+def test_shared_rule_stops_all_branches(calls: List[str]):
+    dispatcher = Dispatcher([
+        _create_processor(
+            ["decode", "is_positive"], "{w1}/value", "a/{w1}", input_format="binary"
+        ),
+        _create_processor(
+            ["decode", "is_positive", {"name": "tag", "arguments": {"name": "b"}}],
+            "{w1}/value", "b/{w1}", input_format="binary",
+        ),
+    ])
+
+    assert dispatcher.process_message("dev1/value", b"-1") == []
+    assert calls == ["decode", "is_positive"]
+
+
+def test_different_sources_and_stateful_functions_are_not_shared(calls: List[str]):
+    dispatcher = Dispatcher([
+        _create_processor(["decode", "count"], "{w1}/value", "a/{w1}", input_format="binary"),
+        _create_processor(["decode", "count"], "{w1}/value", "b/{w1}", input_format="binary"),
+        _create_processor(["decode"], "dev1/value", "c", input_format="binary"),
+    ])
+
+    assert len(dispatcher.process_message("dev1/value", b"1")) == 3
+    assert calls == ["decode", "count", "count", "decode"]
+
+
+def test_stages_not_shared_when_disabled(calls: List[str]):
+    dispatcher = Dispatcher(
+        [
+            _create_processor(["decode"], "{w1}/value", "a/{w1}", input_format="binary"),
+            _create_processor(["decode"], "{w1}/value", "b/{w1}", input_format="binary"),
+        ],
+        shared_stages=False,
+    )
+
+    dispatcher.process_message("dev1/value", b"1")
+    assert calls == ["decode", "decode"]
+
+
+def test_uncopyable_outputs_are_evaluated_per_processor(calls: List[str]):
+    @mqttprocessor.functions.converter
+    def lock(x):
+        calls.append("lock")
+        return {"value": x["value"], "lock": threading.Lock()}
+
+    @mqttprocessor.functions.converter
+    def unlock(x):
+        return x["value"]
+
+    dispatcher = Dispatcher([
+        _create_processor(
+            ["decode", "lock", "unlock"],
+            "{w1}/value", "a/{w1}", input_format="binary",
+        ),
+        _create_processor(
+            ["decode", "lock", "unlock"],
+            "{w1}/value", "b/{w1}", input_format="binary",
+        ),
+        _create_processor(["decode", "lock"], "{w1}/value", "c/{w1}", input_format="binary"),
+    ])
+
+    messages = dispatcher.process_message("dev1/value", b"5")
+
+    # The output of unlock is shared again, only processor c evaluates lock once more
+    assert calls == ["decode", "lock", "lock"]
+    assert [msg.message_body for msg in messages[:2]] == [5, 5]
+    assert len(messages) == 3
+
+
+def _count_copies(monkeypatch: pytest.MonkeyPatch) -> List[Any]:
+    copied = list()
+
+    def count_copy(value):
+        copied.append(value)
+        return copy_value(value)
+
+    monkeypatch.setattr(mqttprocessor.routing, "copy_value", count_copy)
+    return copied
+
+
+def test_only_converters_of_other_processors_get_copies(
+    calls: List[str], monkeypatch: pytest.MonkeyPatch
+):
+    copied = _count_copies(monkeypatch)
+    dispatcher = Dispatcher([
+        _create_processor(
+            ["decode", "is_positive", {"name": "tag", "arguments": {"name": name}}],
+            "{w1}/value", f"{name}/{{w1}}", input_format="binary",
+        )
+        for name in ("a", "b", "c")
+    ])
+
+    messages = dispatcher.process_message("dev1/value", b"5")
+
+    # The rule gets the decoded value as it is and the last processor takes it over
+    assert len(copied) == 2
+    assert {msg.sink_topic.rule: msg.message_body["tags"] for msg in messages} == {
+        "a/dev1": ["a"], "b/dev1": ["b"], "c/dev1": ["c"]
+    }
+
+
+def test_rules_get_shared_outputs_without_copies(
+    calls: List[str], monkeypatch: pytest.MonkeyPatch
+):
+    copied = _count_copies(monkeypatch)
+    dispatcher = Dispatcher([
+        _create_processor(
+            ["decode", "is_positive"], "{w1}/value", "a/{w1}", input_format="binary"
+        ),
+        _create_processor(
+            ["decode", "is_positive"], "{w1}/value", "b/{w1}", input_format="binary"
+        ),
+    ])
+
+    assert len(dispatcher.process_message("dev1/value", b"5")) == 2
+    assert copied == []
+
+
+def test_shared_output_kept_by_processor_is_not_taken_over(calls: List[str]):
+    dispatcher = Dispatcher([
+        _create_processor(["decode"], "{w1}/value", "a/{w1}", input_format="binary"),
+        _create_processor(
+            ["decode", {"name": "tag", "arguments": {"name": "b"}}],
+            "{w1}/value", "b/{w1}", input_format="binary",
+        ),
+    ])
+
+    messages = dispatcher.process_message("dev1/value", b"5")
+
+    assert {msg.sink_topic.rule: msg.message_body["tags"] for msg in messages} == {
+        "a/dev1": [], "b/dev1": ["b"]
+    }
+
+
+def test_only_matched_processors_are_offered_message(calls: List[str]):
+    processors = [
+        _create_processor(["decode"], "{w1}/value", "a/{w1}", input_format="binary"),
+        _create_processor(["decode"], "dev2/value", "b", input_format="binary"),
+        _create_processor(["decode"], "dev1/{w1}", "c/{w1}", input_format="binary"),
+    ]
+    offered = list()
+    for index, processor in enumerate(processors):
+        def process_message(*args, _index=index, _process=processor.process_message):
+            offered.append(_index)
+            return _process(*args)
+
+        processor.process_message = process_message
+
+    messages = Dispatcher(processors).process_message("dev1/value", b"5")
+
+    assert offered == [0, 2]
+    assert [msg.sink_topic.rule for msg in messages] == ["a/dev1", "c/value"]
+
+
+def test_copy_value():
+    value = {"a": [1, {"b": 2}], "c": "text", "d": bytearray(b"x")}
+    copied = copy_value(value)
+
+    assert copied == value
+    assert copied["a"] is not value["a"]
+    assert copied["a"][1] is not value["a"][1]
+    assert copied["d"] is not value["d"]
+
+    text = "text"
+    assert copy_value(text) is text
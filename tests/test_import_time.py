@@ -0,0 +1,76 @@
+import subprocess
+import sys
+from typing import Dict, Set, Tuple
+
+import pytest
+
+# Imported only when a config is loaded, a feature is enabled or a format is used
+_HEAVY_DEPENDENCIES = [
+    "paho", "pydantic", "yaml", "sqlite3", "hashlib", "gzip", "zstandard", "lz4", "msgpack",
+    "cbor2", "google.protobuf", "mqttprocessor.capture", "mqttprocessor.recorder",
+]
+# The time of importing the app modules is compared with the time of importing the deferred
+# dependencies in the same environment, so the budget holds on slow and loaded machines too
+_DEFERRED_DEPENDENCIES = ["pydantic", "yaml", "paho.mqtt.client"]
+_IMPORT_TIME_BUDGET = 0.5
+_IMPORT_TIME_RUNS = 3
+
+
+def _import_profile(statement: str) -> Dict[str, Tuple[int, int]]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True, text=True, check=True
+    )
+
+    # Self and cumulative microseconds of the modules. Names of the modules imported by
+    # other ones stay indented.
+    profile = dict()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+
+        self_time, cumulative, name = line[len("import time:"):].split("|")
+        profile[name[1:].rstrip()] = (int(self_time), int(cumulative))
+
+    return profile
+
+
+def _imported_modules(module: str) -> Set[str]:
+    return {name.strip() for name in _import_profile(f"import {module}")}
+
+
+def _app_import_time() -> int:
+    profile = _import_profile("import mqttprocessor.app")
+
+    return sum(
+        self_time for name, (self_time, _) in profile.items()
+        if name.strip().startswith("mqttprocessor")
+    )
+
+
+def _dependencies_import_time() -> int:
+    profile = _import_profile(f"import {', '.join(_DEFERRED_DEPENDENCIES)}")
+
+    return sum(profile[name][1] for name in _DEFERRED_DEPENDENCIES)
+
+
+@pytest.mark.parametrize(
+    "module",
+    [
+        "mqttprocessor.app",
+        "mqttprocessor.functions",
+        "mqttprocessor.routing",
+    ]
+)
+def test_import_skips_heavy_dependencies(module: str):
+    imported_modules = _imported_modules(module)
+
+    for dependency in _HEAVY_DEPENDENCIES:
+        assert dependency not in imported_modules
+
+
+def test_import_time_budget():
+    app_time = min(_app_import_time() for _ in range(_IMPORT_TIME_RUNS))
+    dependencies_time = min(_dependencies_import_time() for _ in range(_IMPORT_TIME_RUNS))
+
+    assert app_time < dependencies_time * _IMPORT_TIME_BUDGET
@@ -0,0 +1,111 @@
+import pytest
+from pydantic import ValidationError
+
+from mqttprocessor.definitions import ProcessorFunctionType
+from mqttprocessor.functions import ProcessorFunction
+from mqttprocessor.joining import JoinStage
+from mqttprocessor.messages import TopicName, Message
+from mqttprocessor.models import ProcessorConfigModel
+from mqttprocessor.routing import Processor
+
+
+def _converter(callback) -> ProcessorFunction:
+    return ProcessorFunction(
+        ProcessorFunctionType.CONVERTER, lambda val, special_params: callback(val),
+        expects_matches=False, expects_source_topic=False
+    )
+
+
+def test_join_waits_for_all_values():
+    join = JoinStage("join", ["temperature", "humidity"], key="w1")
+
+    assert join.add("temperature", "dev1", 21.5, 1) is None
+    assert join.add("humidity", "dev2", 40, 2) is None
+    assert join.add("humidity", "dev1", 45, 3) == {"temperature": 21.5, "humidity": 45}
+    assert join.add("temperature", "dev1", 22, 4) == {"temperature": 22, "humidity": 45}
+
+
+def test_join_trigger_and_partial_values():
+    join = JoinStage(
+        "join", ["temperature", "humidity"], key="w1", triggers=["temperature"], require_all=False
+    )
+
+    assert join.add("temperature", "dev1", 21.5, 1) == {"temperature": 21.5}
+    assert join.add("humidity", "dev1", 45, 2) is None
+    assert join.add("temperature", "dev1", 22, 3) == {"temperature": 22, "humidity": 45}
+
+
+def test_join_ttl():
+    join = JoinStage("join", ["temperature", "humidity"], key="w1", ttl=10)
+
+    join.add("temperature", "dev1", 21.5, 0)
+    assert join.add("humidity", "dev1", 45, 10) is None
+    assert join.add("temperature", "dev1", 22, 11) == {"temperature": 22, "humidity": 45}
+
+    join.add("temperature", "dev2", 20, 12)
+    join.add("temperature", "dev3", 20, 30)
+    assert len(join) == 1
+
+
+def test_join_max_keys():
+    join = JoinStage("join", ["temperature", "humidity"], key="w1", max_keys=2)
+
+    join.add("temperature", "dev1", 1, 1)
+    join.add("temperature", "dev2", 2, 2)
+    join.add("temperature", "dev1", 3, 3)
+    join.add("temperature", "dev3", 4, 4)
+
+    assert len(join) == 2
+    assert join.add("humidity", "dev1", 45, 5) == {"temperature": 3, "humidity": 45}
+    assert join.add("humidity", "dev2", 45, 5) is None
+
+
+def test_processor_join():
+    processor = Processor(
+        name="comfort",
+        functions=[_converter(lambda values: values["temperature"] - values["humidity"] / 10)],
+        sources=[TopicName("{w1}/temperature"), TopicName("{w1}/humidity")],
+        sink=TopicName("{w1}/comfort"),
+        input_functions=[_converter(float)],
+        join=JoinStage("comfort", ["temperature", "humidity"], key="w1"),
+    )
+
+    assert processor.process_message("dev1/temperature", b"21.5", timestamp=1) == []
+    assert processor.process_message("dev1/pressure", b"1000", timestamp=2) == []
+    assert processor.process_message("dev1/humidity", b"40", timestamp=3) == [
+        Message(TopicName("dev1/comfort"), 17.5)
+    ]
+
+
+def test_join_model():
+    config = ProcessorConfigModel(
+        source=["{w1}/temperature", "{w1}/humidity"],
+        sink="{w1}/comfort",
+        function="comfort",
+        join={"key": "w1", "trigger": "{w1}/temperature"},
+    )
+    assert config.join.fields == ["{w1}/temperature", "{w1}/humidity"]
+    assert config.join.trigger == ["{w1}/temperature"]
+
+    with pytest.raises(ValidationError):
+        ProcessorConfigModel(
+            source=["{w1}/temperature", "{w2}/humidity"], function="comfort", join={"key": "w1"}
+        )
+
+    with pytest.raises(ValidationError):
+        ProcessorConfigModel(
+            source=["{w1}/temperature", "{w1}/humidity"], function="comfort",
+            join={"key": "w1", "fields": ["temperature"]}
+        )
+
+    with pytest.raises(ValidationError):
+        ProcessorConfigModel(
+            source=["{w1}/temperature", "{w1}/humidity"], function="comfort",
+            join={"key": "w1", "fields": ["temperature", "humidity"], "trigger": "pressure"}
+        )
+
+    with pytest.raises(ValidationError):
+        ProcessorConfigModel(
+            source=["{w1}/temperature", "{w1}/humidity"], function="comfort",
+            join={"key": "w1"}, match="all_matches"
+        )
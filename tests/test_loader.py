@@ -1,10 +1,12 @@
 from io import StringIO
+from pathlib import Path
 from typing import TextIO
 
 import pytest
 from pydantic import ValidationError
 
-from mqttprocessor.loader import load_config
+import mqttprocessor.loader
+from mqttprocessor.loader import load_config, load_config_cached
 
 
 @pytest.mark.parametrize(
@@ -54,3 +56,50 @@ def test_load_invalid_config(config_file_stream: TextIO):
 def test_load_function_name(config_file_stream: TextIO, expected_name: str):
     config = load_config(config_file_stream)
     assert config.processors[0].name[:len(expected_name)] == expected_name
+
+
+def test_load_config_cached(tmp_path: Path):
+    config_path = "tests/testcase_files/config/config_multiple_functions.yaml"
+
+    expected = load_config_cached(config_path, str(tmp_path))
+    assert len(list(tmp_path.glob("config-*.pickle"))) == 1
+
+    actual = load_config_cached(config_path, str(tmp_path))
+    assert actual == expected
+
+
+def test_load_config_cached_invalidated_by_models(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    config_path = "tests/testcase_files/config/config_simple.yaml"
+    models_path = tmp_path / "models.py"
+    models_path.write_text("class ConfigModel: ...")
+    monkeypatch.setattr(mqttprocessor.loader, "_MODEL_SOURCES", (str(models_path),))
+
+    load_config_cached(config_path, str(tmp_path / "cache"))
+    models_path.write_text("class ConfigModel: pass")
+    load_config_cached(config_path, str(tmp_path / "cache"))
+
+    assert len(list((tmp_path / "cache").glob("config-*.pickle"))) == 2
+
+
+def test_load_config_cached_skips_validation(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    config_path = "tests/testcase_files/config/config_simple.yaml"
+    load_config_cached(config_path, str(tmp_path))
+
+    def _fail(stream: TextIO):
+        raise AssertionError("Config validated despite precompiled artifact")
+
+    monkeypatch.setattr(mqttprocessor.loader, "load_config", _fail)
+    config = load_config_cached(config_path, str(tmp_path))
+
+    assert config.processors[0].function[0].name.__root__ == "some_function"
+
+
+def test_load_config_cached_corrupted_artifact(tmp_path: Path):
+    config_path = "tests/testcase_files/config/config_simple.yaml"
+    load_config_cached(config_path, str(tmp_path))
+
+    for artifact in tmp_path.glob("config-*.pickle"):
+        artifact.write_bytes(b"corrupted")
+
+    config = load_config_cached(config_path, str(tmp_path))
+    assert config.processors[0].function[0].name.__root__ == "some_function"
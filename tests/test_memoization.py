@@ -0,0 +1,173 @@
+from typing import Callable
+
+import pytest
+
+import mqttprocessor.functions
+from mqttprocessor.memoization import ResultCache
+from mqttprocessor.models import ExtendedFunctionModel
+
+
+def _create_function(name: str, **arguments):
+    return mqttprocessor.functions.create_functions(
+        [ExtendedFunctionModel(name=name, arguments=arguments or None)],
+        mqttprocessor.functions.create_processor_register(),
+    )[0]
+
+
+def test_pure_converter_called_once_per_payload(converter: Callable):
+    calls = list()
+
+    @converter(pure=True)
+    def scale(x, factor):
+        calls.append(x)
+        return x * factor
+
+    function = _create_function("scale", factor=2)
+
+    assert function.callback(1, "in", {}) == 2
+    assert function.callback(1, "in", {}) == 2
+    assert function.callback(2, "in", {}) == 4
+    assert calls == [1, 2]
+
+    cache, = mqttprocessor.functions.get_result_caches()
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert cache.hit_rate == pytest.approx(1 / 3)
+
+
+def test_pure_converter_cache_shared_by_equal_arguments(converter: Callable):
+    calls = list()
+
+    @converter(pure=True)
+    def scale(x, factor):
+        calls.append(x)
+        return x * factor
+
+    first, second, other = (
+        _create_function("scale", factor=2),
+        _create_function("scale", factor=2),
+        _create_function("scale", factor=3),
+    )
+
+    assert first.callback(1, "in", {}) == 2
+    assert second.callback(1, "in", {}) == 2
+    assert other.callback(1, "in", {}) == 3
+    assert len(calls) == 2
+    assert len(mqttprocessor.functions.get_result_caches()) == 2
+
+
+def test_pure_converter_keyed_by_used_special_parameters(converter: Callable):
+    @converter(pure=True)
+    def with_topic(x, source_topic):
+        return f"{x}<{source_topic}>"
+
+    @converter(pure=True)
+    def with_matches(x, matches):
+        return f"{x}<{matches['w1']}>"
+
+    topic, matches = _create_function("with_topic"), _create_function("with_matches")
+
+    assert topic.callback("x", "a", {}) == "x<a>"
+    assert topic.callback("x", "b", {}) == "x<b>"
+    assert matches.callback("x", "a/b", {"w1": "a"}) == "x<a>"
+    assert matches.callback("x", "a/b", {"w1": "b"}) == "x<b>"
+
+
+def test_pure_converter_source_topic_ignored_when_unused(converter: Callable):
+    calls = list()
+
+    @converter(pure=True)
+    def upper(x):
+        calls.append(x)
+        return x.upper()
+
+    function = _create_function("upper")
+    function.callback("x", "a", {})
+    function.callback("x", "b", {"w1": "b"})
+
+    assert calls == ["x"]
+
+
+def test_pure_converter_cached_output_not_modified(converter: Callable):
+    @converter(pure=True)
+    def wrap(x):
+        return {"values": [x]}
+
+    function = _create_function("wrap")
+
+    function.callback(1, "in", {})["values"].append(2)
+    output = function.callback(1, "in", {})
+    output["values"].append(3)
+
+    assert function.callback(1, "in", {}) == {"values": [1]}
+
+
+def test_pure_converter_decoded_payload(converter: Callable):
+    calls = list()
+
+    @converter(pure=True)
+    def total(x):
+        calls.append(x)
+        return sum(x["values"])
+
+    function = _create_function("total")
+
+    assert function.callback({"values": [1, 2]}, "in", {}) == 3
+    assert function.callback({"values": [1, 2]}, "in", {}) == 3
+    assert function.callback({"values": [1, 3]}, "in", {}) == 4
+    assert len(calls) == 2
+
+
+def test_pure_converter_exceptions_not_cached(converter: Callable):
+    calls = list()
+
+    @converter(pure=True)
+    def failing(x):
+        calls.append(x)
+        raise ValueError()
+
+    function = _create_function("failing")
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            function.callback(1, "in", {})
+
+    assert len(calls) == 2
+
+
+def test_pure_converter_invalid(converter: Callable):
+    with pytest.raises(ValueError):
+        @converter(pure=True)
+        def stateful(x, state):
+            return x
+
+    with pytest.raises(ValueError):
+        @converter(pure=True)
+        def generator(x):
+            yield x
+
+    with pytest.raises(ValueError):
+        @converter(pure=True, cache_size=0)
+        def uncached(x):
+            return x
+
+
+def test_result_cache_evicts_least_recently_used():
+    cache = ResultCache("f", 2)
+    cache.get_or_call("a", lambda: 1)
+    cache.get_or_call("b", lambda: 2)
+    cache.get_or_call("a", lambda: 1)
+    cache.get_or_call("c", lambda: 3)
+
+    assert cache.get_or_call("a", lambda: None) == 1
+    assert cache.get_or_call("b", lambda: None) is None
+    assert len(cache) == 2
+
+
+def test_result_cache_distinguishes_types():
+    cache = ResultCache("f", 10)
+    wrapped = cache.wrap(lambda val, special_params: type(val).__name__)
+
+    assert wrapped(1, {}) == "int"
+    assert wrapped(True, {}) == "bool"
+    assert wrapped(1.0, {}) == "float"
+    assert wrapped(b"1", {}) == "bytes"
+    assert wrapped("1", {}) == "str"
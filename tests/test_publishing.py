@@ -0,0 +1,201 @@
+from typing import Callable
+
+import pytest
+from paho.mqtt.client import MQTTMessage
+from pydantic import ValidationError
+
+from mqttprocessor.definitions import ProcessorFunctionType
+from mqttprocessor.dispatch import Dispatcher
+from mqttprocessor.functions import ProcessorFunction, create_functions, create_processor_register
+from mqttprocessor.messages import TopicName, Message, MessageProperties, RoutedMessage
+from mqttprocessor.models import ExtendedFunctionModel, ProcessorConfigModel
+from mqttprocessor.publishing import ECHO_PROPERTY, TopicAliasTable, Publisher
+from mqttprocessor.routing import Processor
+
+
+class _FakeClient:
+    def __init__(self):
+        self.published = list()
+
+    def publish(self, topic, payload, qos=0, retain=False, properties=None):
+        self.published.append((topic, payload, qos, properties))
+
+
+def test_topic_alias_assigned_once():
+    table = TopicAliasTable(2)
+
+    assert table.resolve("a") == ("a", 1)
+    assert table.resolve("b") == ("b", 2)
+    assert table.resolve("a") == ("", 1)
+    assert table.resolve("b") == ("", 2)
+
+
+def test_topic_alias_of_least_recently_used_topic_reassigned():
+    table = TopicAliasTable(2)
+    table.resolve("a")
+    table.resolve("b")
+    table.resolve("a")
+
+    assert table.resolve("c") == ("c", 2)
+    assert table.resolve("a") == ("", 1)
+    assert table.resolve("b") == ("b", 2)
+    assert len(table) == 2
+
+
+def test_topic_alias_disabled():
+    table = TopicAliasTable(0)
+
+    assert table.resolve("a") == ("a", None)
+    assert table.resolve("a") == ("a", None)
+
+
+def test_topic_aliases_reset_on_connection():
+    table = TopicAliasTable(2)
+    table.resolve("a")
+    table.reset(1)
+
+    assert table.resolve("a") == ("a", 1)
+    assert table.maximum == 1
+
+
+def test_publisher_v5_properties():
+    client = _FakeClient()
+    publisher = Publisher(client, v5=True, message_expiry=60, topic_alias_maximum=10)
+    publisher.connected(5)
+
+    publisher.publish(
+        [Message(TopicName("out"), "1"), Message(TopicName("out"), "2")], qos=0, retain=False,
+        user_properties=(("key", "value"),),
+    )
+
+    (first_topic, _, _, first), (second_topic, _, _, second) = client.published
+    assert (first_topic, first.TopicAlias) == ("out", 1)
+    assert (second_topic, second.TopicAlias) == ("", 1)
+    assert first.MessageExpiryInterval == 60
+    assert first.UserProperty == [("key", "value")]
+
+
+def test_publisher_v5_without_aliases_for_qos_above_0():
+    client = _FakeClient()
+    publisher = Publisher(client, v5=True, topic_alias_maximum=10)
+    publisher.connected(10)
+
+    publisher.publish([Message(TopicName("out"), "1")] * 2, qos=1, retain=False)
+
+    assert [topic for topic, *_ in client.published] == ["out", "out"]
+    assert not hasattr(client.published[1][3], "TopicAlias")
+
+
+def test_publisher_v311():
+    client = _FakeClient()
+    Publisher(client).publish([Message(TopicName("out"), "1")], qos=0, retain=False)
+
+    assert client.published == [("out", b"1", 0, None)]
+
+
+def test_publisher_message_delivery_overrides_received():
+    client = _FakeClient()
+    Publisher(client).publish(
+        [Message(TopicName("a"), "1", qos=0), Message(TopicName("b"), "2", retain=True)],
+        qos=2, retain=False,
+    )
+
+    assert client.published == [("a", b"1", 0, None), ("b", b"2", 2, None)]
+
+
+def test_publisher_normalizes_payloads():
+    client = _FakeClient()
+    Publisher(client).publish(
+        [
+            Message(TopicName("a"), {"value": 1}), Message(TopicName("b"), object()),
+            Message(TopicName("c"), 1.5),
+        ],
+        qos=0, retain=False,
+    )
+
+    assert client.published == [("a", b'{"value":1}', 0, None), ("c", b"1.5", 0, None)]
+
+
+def test_publisher_tags_echoes():
+    client = _FakeClient()
+    publisher = Publisher(client, v5=True, echo_tag="app")
+
+    publisher.publish(
+        [Message(TopicName("a"), "1", echo=True), Message(TopicName("b"), "2")],
+        qos=0, retain=False, user_properties=(("key", "value"),),
+    )
+
+    (_, _, _, echo), (_, _, _, other) = client.published
+    assert echo.UserProperty == [("key", "value"), (ECHO_PROPERTY, "app")]
+    assert other.UserProperty == [("key", "value")]
+
+    received = MQTTMessage(topic=b"a")
+    received.properties = echo
+    assert publisher.is_echo(received)
+    assert not Publisher(client, v5=True, echo_tag="other").is_echo(received)
+    assert not Publisher(client, echo_tag="app").tags_echoes
+
+
+def _converter(callback) -> ProcessorFunction:
+    return ProcessorFunction(
+        ProcessorFunctionType.CONVERTER, lambda val, special_params: callback(val),
+        expects_matches=False, expects_source_topic=False
+    )
+
+
+def test_processor_delivery():
+    processor = Processor(
+        "p", [_converter(lambda val: val)], [TopicName("in")], TopicName("out"),
+        qos=0, retain=True,
+    )
+
+    assert processor.process_message("in", "x") == [
+        Message(TopicName("out"), "x", qos=0, retain=True)
+    ]
+
+
+def test_routed_message_delivery_overrides_processor():
+    processor = Processor(
+        "p",
+        [_converter(lambda val: RoutedMessage({
+            "alert": RoutedMessage([val], qos=1),
+            "data": val,
+        }, retain=False))],
+        [TopicName("in")], TopicName("out"), qos=0, retain=True,
+    )
+
+    assert processor.process_message("in", "x") == [
+        Message(TopicName("alert"), "x", qos=1, retain=False),
+        Message(TopicName("data"), "x", qos=0, retain=False),
+    ]
+
+
+def test_routed_message_invalid_qos():
+    with pytest.raises(ValueError):
+        RoutedMessage([], qos=3)
+
+
+def test_processor_config_invalid_qos():
+    with pytest.raises(ValidationError):
+        ProcessorConfigModel(source="in", sink="out", function="f", qos=3)
+
+
+def test_properties_passed_to_functions(converter: Callable):
+    @converter
+    def content_type(x, properties):
+        return f"{x}<{properties.content_type}><{dict(properties.user_properties)}>"
+
+    functions = create_functions(
+        [ExtendedFunctionModel(name="content_type")], create_processor_register()
+    )
+    dispatcher = Dispatcher([
+        Processor("p", functions, [TopicName("in")], TopicName("out"))
+    ])
+
+    properties = MessageProperties("text/plain", (("key", "value"),))
+    assert dispatcher.process_message("in", "x", properties=properties) == [
+        Message(TopicName("out"), "x<text/plain><{'key': 'value'}>")
+    ]
+    assert dispatcher.process_message("in", "x") == [
+        Message(TopicName("out"), "x<None><{}>")
+    ]
@@ -0,0 +1,91 @@
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from mqttprocessor.capture import CapturedMessage, CaptureCompression, open_capture, read_capture
+from mqttprocessor.recorder import CaptureRecorder
+
+
+def _read_segments(recorder: CaptureRecorder) -> List[List[CapturedMessage]]:
+    segments = list()
+    index = 0
+    while recorder.segment_path(index).exists():
+        with open_capture(str(recorder.segment_path(index))) as stream:
+            segments.append(list(read_capture(stream)))
+        index += 1
+
+    return segments
+
+
+def _record(recorder: CaptureRecorder, count: int):
+    recorder.start()
+    for i in range(count):
+        recorder.record(f"device{i}/value", f"payload{i}".encode(), i % 3, i % 2 == 0)
+    recorder.stop()
+
+
+@pytest.mark.parametrize(
+    "compression", [CaptureCompression.NONE, CaptureCompression.GZIP]
+)
+def test_recorder_writes_messages(tmp_path: Path, compression: CaptureCompression):
+    recorder = CaptureRecorder(str(tmp_path / "traffic.mqcap"), compression=compression)
+    _record(recorder, 10)
+
+    segments = _read_segments(recorder)
+    assert len(segments) == 1
+
+    messages = segments[0]
+    assert [m.topic for m in messages] == [f"device{i}/value" for i in range(10)]
+    assert [m.payload for m in messages] == [f"payload{i}".encode() for i in range(10)]
+    assert [m.qos for m in messages] == [i % 3 for i in range(10)]
+    assert [m.retain for m in messages] == [i % 2 == 0 for i in range(10)]
+    assert [m.timestamp for m in messages] == sorted(m.timestamp for m in messages)
+
+
+def test_recorder_zstd(tmp_path: Path):
+    pytest.importorskip("zstandard")
+
+    recorder = CaptureRecorder(str(tmp_path / "traffic.mqcap"), compression=CaptureCompression.ZSTD)
+    _record(recorder, 5)
+
+    assert len(_read_segments(recorder)[0]) == 5
+
+
+def test_recorder_rotation(tmp_path: Path):
+    recorder = CaptureRecorder(str(tmp_path / "traffic.mqcap"), max_bytes=100)
+    _record(recorder, 20)
+
+    segments = _read_segments(recorder)
+    assert len(segments) > 1
+    assert [m.topic for segment in segments for m in segment] == [f"device{i}/value" for i in range(20)]
+
+
+def test_recorder_appends_new_segment(tmp_path: Path):
+    path = str(tmp_path / "traffic.mqcap")
+    _record(CaptureRecorder(path), 3)
+
+    recorder = CaptureRecorder(path)
+    _record(recorder, 2)
+
+    assert [len(segment) for segment in _read_segments(recorder)] == [3, 2]
+
+
+def test_recorder_drops_messages_when_queue_is_full(tmp_path: Path):
+    recorder = CaptureRecorder(str(tmp_path / "traffic.mqcap"), max_queue=2)
+    for i in range(5):
+        recorder.record(f"device{i}/value", b"payload", 0, False)
+
+    assert recorder.dropped == 3
+
+    recorder.start()
+    recorder.stop()
+    assert [m.topic for m in _read_segments(recorder)[0]] == ["device0/value", "device1/value"]
+
+
+def test_recorder_segment_open_failure(tmp_path: Path):
+    recorder = CaptureRecorder(str(tmp_path / "missing" / "traffic.mqcap"), max_queue=1)
+    # The writer fails at once and stopping doesn't wait for it to consume the full queue
+    _record(recorder, 5)
+
+    assert not recorder.segment_path(0).exists()
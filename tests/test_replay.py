@@ -0,0 +1,160 @@
+from io import BytesIO
+from pathlib import Path
+from typing import Callable, List
+
+import pytest
+
+from mqttprocessor.capture import CapturedMessage, CaptureFormat, CaptureWriter, read_capture
+from mqttprocessor.dispatch import Dispatcher
+from mqttprocessor.functions import ProcessorFunction
+from mqttprocessor.messages import TopicName
+from mqttprocessor.replay import replay, replay_parallel
+from mqttprocessor.routing import Processor
+
+
+def _create_dispatcher(functions: List[ProcessorFunction]) -> Dispatcher:
+    return Dispatcher([
+        Processor(
+            "replay-processor", functions,
+            [TopicName("sensors/{w1}")], TopicName("processed/{w1}")
+        )
+    ])
+
+
+@pytest.mark.parametrize(
+    "processor_functions",
+    [
+        ["dummy_rule_true"]
+    ], indirect=True
+)
+def test_replay_writes_outputs(processor_functions: List[ProcessorFunction]):
+    captured_messages = [
+        CapturedMessage("sensors/dev1", b"payload1", qos=1, retain=True, timestamp=1.0),
+        CapturedMessage("unrelated/dev2", b"payload2", timestamp=2.0),
+        CapturedMessage("sensors/dev3", b"payload3", timestamp=3.0),
+    ]
+
+    output = BytesIO()
+    statistics = replay(
+        _create_dispatcher(processor_functions), captured_messages,
+        CaptureWriter(output, CaptureFormat.JSON_LINES)
+    )
+
+    output.seek(0)
+    expected = [
+        CapturedMessage("processed/dev1", b"payload1", qos=1, retain=True, timestamp=1.0),
+        CapturedMessage("processed/dev3", b"payload3", timestamp=3.0),
+    ]
+
+    assert list(read_capture(output)) == expected
+    assert statistics.input_messages == 3
+    assert statistics.output_messages == 2
+    assert statistics.failed_messages == 0
+
+
+@pytest.mark.parametrize(
+    "processor_functions",
+    [
+        ["dummy_rule_true"]
+    ], indirect=True
+)
+def test_replay_recorded_pace(processor_functions: List[ProcessorFunction]):
+    captured_messages = [
+        CapturedMessage("sensors/dev1", b"", timestamp=100.0),
+        CapturedMessage("sensors/dev1", b"", timestamp=100.2),
+    ]
+
+    statistics = replay(
+        _create_dispatcher(processor_functions), captured_messages, recorded_pace=True
+    )
+
+    assert statistics.elapsed_seconds >= 0.2
+    assert statistics.output_messages == 2
+
+
+def test_replay_parallel(converter: Callable, tmp_path: Path):
+    @converter
+    def replay_uppercase(x):
+        return x.upper()
+
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text(
+        "processors:\n"
+        "  - source: sensors/{w1}\n"
+        "    sink: processed/{w1}\n"
+        "    input_format: binary\n"
+        "    function: replay_uppercase\n"
+    )
+
+    capture_path = tmp_path / "traffic.mqcap"
+    with open(capture_path, "wb") as f:
+        writer = CaptureWriter(f, CaptureFormat.BINARY)
+        for i in range(100):
+            writer.write(CapturedMessage(f"sensors/dev{i}", f"value{i}".encode(), timestamp=float(i)))
+
+    output_path = tmp_path / "output.mqcap"
+    statistics = replay_parallel(
+        str(config_path), [str(capture_path)], 4, str(output_path)
+    )
+
+    outputs = list()
+    for part_path in sorted(tmp_path.glob("output.*.mqcap")):
+        with open(part_path, "rb") as f:
+            outputs += list(read_capture(f))
+
+    # Parts are split by topic, the order is kept within each of them
+    outputs.sort(key=lambda m: m.timestamp)
+
+    assert statistics.input_messages == 100
+    assert statistics.output_messages == 100
+    assert [m.payload for m in outputs] == [f"VALUE{i}".encode() for i in range(100)]
+    assert [m.topic for m in outputs] == [f"processed/dev{i}" for i in range(100)]
+
+
+def test_replay_parallel_keeps_state_per_topic(converter: Callable, tmp_path: Path):
+    @converter
+    def replay_count(x, source_topic, state):
+        state.set(source_topic, state.get(source_topic, 0) + 1)
+        return str(state.get(source_topic))
+
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text(
+        "processors:\n"
+        "  - source: sensors/{w1}\n"
+        "    sink: counted/{w1}\n"
+        "    input_format: binary\n"
+        "    function: replay_count\n"
+    )
+
+    capture_path = tmp_path / "traffic.mqcap"
+    with open(capture_path, "wb") as f:
+        writer = CaptureWriter(f, CaptureFormat.BINARY)
+        for i in range(60):
+            writer.write(CapturedMessage(f"sensors/dev{i % 3}", b"", timestamp=float(i)))
+
+    output_path = tmp_path / "output.mqcap"
+    replay_parallel(str(config_path), [str(capture_path)], 4, str(output_path))
+
+    counts = dict()
+    for part_path in tmp_path.glob("output.*.mqcap"):
+        with open(part_path, "rb") as f:
+            for msg in read_capture(f):
+                counts.setdefault(msg.topic, list()).append(int(msg.payload))
+
+    assert counts == {f"counted/dev{i}": list(range(1, 21)) for i in range(3)}
+
+
+def test_replay_parallel_rejects_state_across_topics(tmp_path: Path):
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text(
+        "processors:\n"
+        "  - source: sensors/{w1}/{w2}\n"
+        "    sink: averages/{w1}\n"
+        "    function: f\n"
+        "    window:\n"
+        "      size: 60\n"
+        "      key: w1\n"
+    )
+
+    with pytest.raises(ValueError, match="keeps state across topics"):
+        replay_parallel(str(config_path), [], 2)
@@ -0,0 +1,90 @@
+import json
+
+import pytest
+from pydantic import ValidationError
+
+import mqttprocessor.functions
+from mqttprocessor.messages import Message, RoutedMessage, TopicName
+from mqttprocessor.models import ProcessorConfigModel
+from mqttprocessor.serialization import import_codec
+from tests.processors.common import _create_processor
+
+DOCUMENT = {"device": "d1", "value": 21.5, "tags": ["a", "b"]}
+
+
+def test_output_format_json(identity: str):
+    processor = _create_processor(identity, output_format="json")
+
+    output, = processor.process_message("in", json.dumps(DOCUMENT).encode("utf8"))
+    assert json.loads(output.message_body) == DOCUMENT
+
+
+def test_output_format_encodes_routed_messages(identity: str):
+    @mqttprocessor.functions.converter
+    def split(x):
+        return RoutedMessage({"a": {"value": x["value"]}, "b": RoutedMessage([x["tags"], x["device"]])})
+
+    processor = _create_processor("split", output_format="json")
+
+    assert processor.process_message("in", json.dumps(DOCUMENT).encode("utf8")) == [
+        Message(TopicName("a"), b'{"value":21.5}'),
+        Message(TopicName("b"), b'["a","b"]'),
+        Message(TopicName("b"), b'"d1"'),
+    ]
+
+
+def test_output_format_string(identity: str):
+    processor = _create_processor(identity, input_format="string", output_format="string")
+
+    assert processor.process_message("in", "č".encode("utf8")) == [
+        Message(TopicName("out"), "č".encode("utf8"))
+    ]
+
+
+def test_output_format_verified_on_creation(identity: str):
+    with pytest.raises(ImportError):
+        _create_processor(
+            identity, output_format="protobuf", protobuf_type="mqttprocessor_missing_pb2.Reading"
+        )
+
+
+def test_output_format_failure_drops_message(identity: str):
+    processor = _create_processor(identity, input_format="string", output_format="json")
+
+    assert processor.process_message("in", b"\xff") == []
+
+
+@pytest.mark.parametrize("message_format, encode", [
+    ("msgpack", lambda data: pytest.importorskip("msgpack").packb(data)),
+    ("cbor", lambda data: pytest.importorskip("cbor2").dumps(data)),
+])
+def test_binary_formats(identity: str, message_format: str, encode):
+    payload = encode(DOCUMENT)
+    processor = _create_processor(identity, input_format=message_format, output_format=message_format)
+
+    output, = processor.process_message("in", payload)
+    assert output.message_body == payload
+
+
+def test_protobuf_format(identity: str):
+    struct_pb2 = pytest.importorskip("google.protobuf.struct_pb2")
+    struct = struct_pb2.Struct()
+    struct.update(DOCUMENT)
+
+    processor = _create_processor(
+        identity, input_format="protobuf", output_format="json",
+        protobuf_type="google.protobuf.struct_pb2.Struct",
+    )
+
+    output, = processor.process_message("in", struct.SerializeToString())
+    assert json.loads(output.message_body) == DOCUMENT
+
+
+def test_protobuf_format_requires_type():
+    with pytest.raises(ValidationError):
+        ProcessorConfigModel(source="in", sink="out", function="f", output_format="protobuf")
+
+
+def test_missing_codec():
+    with pytest.raises(ImportError, match="`missing` extra"):
+        import_codec("mqttprocessor_missing_codec", "missing")
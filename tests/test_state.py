@@ -0,0 +1,167 @@
+import pytest
+
+from mqttprocessor.models import ProcessorConfigModel
+from mqttprocessor.routing import ProcessorCreator
+from mqttprocessor.state import StateBackend, StateStore, MemoryStateBackend, SqliteStateBackend
+
+
+class _FakeClock:
+    now: float
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_state_store_get_set():
+    store = StateStore()
+    store.set("a", 1)
+    store.set("b", None)
+
+    assert store.get("a") == 1
+    assert store.get("missing", "default") == "default"
+    assert "b" in store
+    assert "missing" not in store
+
+    store.delete("a")
+    assert "a" not in store
+
+
+def test_state_store_max_keys():
+    store = StateStore(max_keys=2)
+    store.set("a", 1)
+    store.set("b", 2)
+    store.set("a", 3)
+    store.set("c", 4)
+
+    assert len(store) == 2
+    assert "b" not in store
+    assert store.get("a") == 3
+
+
+def test_state_store_ttl():
+    clock = _FakeClock()
+    store = StateStore(ttl=10, clock=clock)
+
+    store.set("a", 1)
+    clock.now = 5
+    store.set("b", 2)
+
+    clock.now = 10
+    assert store.get("a") is None
+    assert store.get("b") == 2
+
+    clock.now = 16
+    store.set("c", 3)
+    assert len(store) == 1
+
+
+def test_memory_state_backend_restores_snapshot():
+    backend = MemoryStateBackend()
+    store = backend.create_store("processor/0/rule")
+    store.set("a", 1)
+    store.set("b", {"value": 2})
+    backend.snapshot()
+
+    store.set("c", 3)
+    store.delete("a")
+    backend.snapshot()
+
+    restored = MemoryStateBackend()
+    restored._data = backend._data
+    restored_store = restored.create_store("processor/0/rule")
+
+    assert "a" not in restored_store
+    assert restored_store.get("b") == {"value": 2}
+    assert restored_store.get("c") == 3
+
+
+def test_sqlite_state_backend_restores_snapshot(tmp_path):
+    path = str(tmp_path / "state.sqlite")
+
+    backend = SqliteStateBackend(path)
+    store = backend.create_store("processor/0/rule", max_keys=2)
+    other_store = backend.create_store("processor/1/rule")
+    store.set(("sensor", 1), 1.5)
+    store.set("b", 2)
+    store.set("c", 3)
+    other_store.set("b", "other")
+    backend.close()
+
+    restored = SqliteStateBackend(path)
+    restored_store = restored.create_store("processor/0/rule", max_keys=2)
+
+    assert len(restored_store) == 2
+    assert ("sensor", 1) not in restored_store
+    assert restored_store.get("b") == 2
+    assert restored_store.get("c") == 3
+    restored.close()
+
+
+def test_state_backend_duplicate_namespace():
+    backend = MemoryStateBackend()
+    backend.create_store("processor/0/rule")
+
+    with pytest.raises(ValueError):
+        backend.create_store("processor/0/rule")
+
+
+def test_unnamed_processor_state_is_restored(converter):
+    @converter
+    def count(x, state):
+        state.set("count", state.get("count", 0) + 1)
+        return state.get("count")
+
+    def create_processor(backend: MemoryStateBackend):
+        config = ProcessorConfigModel(source="in", sink="out", function="count", input_format="binary")
+        return ProcessorCreator(config, backend).create()
+
+    backend = MemoryStateBackend()
+    processor = create_processor(backend)
+    assert processor.process_message("in", b"a")[0].message_body == 1
+    backend.close()
+
+    restored = MemoryStateBackend()
+    restored._data = backend._data
+    processor = create_processor(restored)
+    assert processor.process_message("in", b"a")[0].message_body == 2
+
+
+def test_state_backend_is_abstract():
+    with pytest.raises(TypeError):
+        StateBackend()
+
+
+def test_state_ttl_uses_message_timestamp(converter):
+    @converter
+    def seen(x, source_topic, state):
+        result = source_topic in state
+        state.set(source_topic, True)
+        return result
+
+    config = ProcessorConfigModel(
+        source="in", sink="out", function={"name": "seen", "state": {"ttl": 10}},
+        input_format="binary",
+    )
+    processor = ProcessorCreator(config).create()
+
+    bodies = [
+        processor.process_message("in", b"a", timestamp)[0].message_body
+        for timestamp in (0, 5, 20)
+    ]
+    assert bodies == [False, True, False]
+
+
+def test_reserved_argument_name(converter):
+    @converter
+    def shift(x, timestamp):
+        return x
+
+    config = ProcessorConfigModel(
+        source="in", sink="out", function={"name": "shift", "arguments": {"timestamp": 1}},
+        input_format="binary",
+    )
+    with pytest.raises(ValueError, match="reserved"):
+        ProcessorCreator(config).create()
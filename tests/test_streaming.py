@@ -0,0 +1,123 @@
+from typing import Callable
+
+from mqttprocessor.dispatch import Dispatcher
+from mqttprocessor.messages import TopicName, Message, RoutedMessage
+from mqttprocessor.publishing import Publisher
+from tests.processors.common import _create_processor
+
+_STREAM = dict(source="in/{w1}", sink="out/{w1}", input_format="binary")
+
+
+def test_stream_consumed_lazily(converter: Callable):
+    produced = list()
+
+    @converter
+    def split(x):
+        for value in x.split(","):
+            produced.append(value)
+            yield value
+
+    dispatcher = Dispatcher([_create_processor(["split"], **_STREAM)])
+    messages = iter(dispatcher.process_message("in/a", "1,2,3"))
+
+    # Just the first message is produced to find out the processor has an output
+    assert produced == ["1"]
+    assert next(messages) == Message(TopicName("out/a"), "1")
+    assert produced == ["1"]
+    assert list(messages) == [Message(TopicName("out/a"), "2"), Message(TopicName("out/a"), "3")]
+
+
+def test_stream_of_routed_messages(converter: Callable):
+    @converter
+    def split_routed(x):
+        for value in x.split(","):
+            yield RoutedMessage((f"out/{{w1}}/{value}", value), qos=1)
+
+    processor = _create_processor(["split_routed"], **_STREAM, retain=True)
+
+    assert list(processor.process_message("in/a", "1,2")) == [
+        Message(TopicName("out/a/1"), "1", qos=1, retain=True),
+        Message(TopicName("out/a/2"), "2", qos=1, retain=True),
+    ]
+
+
+def test_empty_stream(converter: Callable):
+    @converter
+    def nothing(x):
+        yield from ()
+
+    processor = _create_processor(["nothing"], **_STREAM)
+
+    assert processor.process_message("in/a", "1") == []
+
+
+def test_stream_failing(converter: Callable):
+    @converter
+    def failing(x):
+        yield x
+        raise ValueError()
+
+    processor = _create_processor(["failing"], **_STREAM)
+
+    assert list(processor.process_message("in/a", "1")) == [Message(TopicName("out/a"), "1")]
+
+
+def test_stream_followed_by_function(converter: Callable):
+    @converter
+    def split(x):
+        yield from x.split(",")
+
+    @converter
+    def identity(x):
+        return x
+
+    processor = _create_processor(["split", "identity"], **_STREAM)
+
+    assert processor.process_message("in/a", "1,2") == []
+
+
+def test_streams_are_not_shared(converter: Callable):
+    @converter
+    def split(x):
+        yield from x.split(",")
+
+    dispatcher = Dispatcher([
+        _create_processor(["split"], **_STREAM), _create_processor(["split"], **_STREAM)
+    ])
+
+    assert len(list(dispatcher.process_message("in/a", "1,2"))) == 4
+
+
+class _BufferingClient:
+    class _Info:
+        rc = 0
+
+        def __init__(self, client):
+            self._client = client
+            self.published = False
+
+        def wait_for_publish(self, timeout=None):
+            self._client.sent += 1
+            self.published = True
+
+        def is_published(self):
+            return self.published
+
+    def __init__(self):
+        self.buffered = 0
+        self.sent = 0
+        self.max_buffered = 0
+
+    def publish(self, topic, payload, qos=0, retain=False, properties=None):
+        self.buffered += 1
+        self.max_buffered = max(self.max_buffered, self.buffered - self.sent)
+        return self._Info(self)
+
+
+def test_publisher_limits_buffered_messages():
+    client = _BufferingClient()
+    Publisher(client, max_buffered=10).publish(
+        (Message(TopicName("out"), str(index)) for index in range(1000)), qos=0, retain=False
+    )
+
+    assert client.max_buffered == 11
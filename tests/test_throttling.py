@@ -0,0 +1,157 @@
+import random
+
+import pytest
+from pydantic import ValidationError
+
+from mqttprocessor.definitions import RateLimitMode
+from mqttprocessor.messages import TopicName, Message
+from mqttprocessor.models import RateLimitModel
+from mqttprocessor.routing import Processor
+from mqttprocessor.throttling import TimingWheel, RateLimiter
+
+
+def _messages(*topics_and_bodies) -> list:
+    return [Message(TopicName(topic), body) for topic, body in topics_and_bodies]
+
+
+def _bodies(messages) -> list:
+    return [msg.message_body for msg in messages]
+
+
+def test_timing_wheel_fires_at_deadline():
+    wheel = TimingWheel(resolution=1, slot_bits=2, levels=3)
+    wheel.schedule("a", 3, now=0)
+    wheel.schedule("b", 30, now=0)
+    wheel.schedule("c", 1000, now=0)
+
+    assert wheel.advance(2.5) == []
+    assert wheel.advance(3) == ["a"]
+    assert wheel.advance(29) == []
+    assert wheel.advance(31) == ["b"]
+    assert wheel.advance(999) == []
+    assert wheel.advance(1000) == ["c"]
+    assert len(wheel) == 0
+
+
+def test_timing_wheel_reschedule_and_cancel():
+    wheel = TimingWheel(resolution=1, slot_bits=2, levels=2)
+    wheel.schedule("a", 5, now=0)
+    wheel.schedule("a", 2, now=0)
+    wheel.schedule("b", 2, now=0)
+    wheel.cancel("b")
+
+    assert wheel.advance(2) == ["a"]
+    assert "b" not in wheel
+    assert wheel.next_deadline() is None
+
+
+def test_timing_wheel_against_sorted_deadlines():
+    rng = random.Random(42)
+    wheel = TimingWheel(resolution=0.5, slot_bits=3, levels=3)
+
+    deadlines = dict()
+    now = 0.0
+    for step in range(2000):
+        key = rng.randrange(300)
+        deadline = now + rng.expovariate(0.05)
+        wheel.schedule(key, deadline, now)
+        deadlines[key] = deadline
+
+        now += rng.expovariate(2)
+        next_deadline = wheel.next_deadline()
+        assert next_deadline is None or next_deadline <= min(deadlines.values()) + 0.5
+
+        expired = wheel.advance(now)
+        expected = [key for key, deadline in deadlines.items() if deadline <= now - 0.5]
+        assert set(expected) <= set(expired)
+        for key in expired:
+            assert deadlines.pop(key) <= now
+
+    assert set(wheel.advance(now + 10 ** 6)) == set(deadlines)
+
+
+def test_rate_limiter_drop():
+    limiter = RateLimiter("drop", rate=1, burst=2)
+
+    passed = limiter.limit(_messages(("a", 1), ("a", 2), ("a", 3), ("b", 4)), {}, now=0)
+    assert _bodies(passed) == [1, 2, 4]
+    assert limiter.dropped == 1
+
+    assert _bodies(limiter.limit(_messages(("a", 5), ("a", 6)), {}, now=1)) == [5]
+    assert limiter.tick(10) == []
+
+
+def test_rate_limiter_latest_wins():
+    limiter = RateLimiter("latest", rate=2, mode=RateLimitMode.LATEST)
+
+    passed = limiter.limit(_messages(("a", 1), ("a", 2), ("a", 3)), {}, now=0)
+    assert _bodies(passed) == [1]
+    assert limiter.tick(0.4) == []
+    assert _bodies(limiter.tick(0.5)) == [3]
+    assert limiter.tick(2) == []
+
+
+def test_rate_limiter_queue():
+    limiter = RateLimiter("queue", rate=10, mode=RateLimitMode.QUEUE, max_queue=3)
+
+    passed = limiter.limit(_messages(*[("a", i) for i in range(5)]), {}, now=0)
+    assert _bodies(passed) == [0]
+    assert limiter.dropped == 1
+
+    released = list()
+    now = 0.0
+    while limiter.next_deadline() is not None:
+        now = limiter.next_deadline()
+        released += [(round(now, 2), msg.message_body) for msg in limiter.tick(now)]
+
+    assert released == [(0.1, 2), (0.2, 3), (0.3, 4)]
+
+
+def test_rate_limiter_key_by_match_group():
+    limiter = RateLimiter("grouped", rate=1, key="w1")
+
+    passed = limiter.limit(_messages(("room1/dev1", 1)), {"w1": "room1"}, now=0)
+    passed += limiter.limit(_messages(("room1/dev2", 2)), {"w1": "room1"}, now=0)
+    passed += limiter.limit(_messages(("room2/dev1", 3)), {"w1": "room2"}, now=0)
+
+    assert _bodies(passed) == [1, 3]
+
+
+def test_rate_limiter_flushes_at_end():
+    limiter = RateLimiter("flush", rate=1, mode=RateLimitMode.QUEUE)
+    limiter.limit(_messages(("a", 1), ("a", 2), ("b", 3), ("b", 4)), {}, now=0)
+
+    assert sorted(_bodies(limiter.tick(float("inf")))) == [2, 4]
+    assert limiter.next_deadline() is None
+
+
+def test_processor_rate_limit():
+    processor = Processor(
+        name="limited",
+        functions=[],
+        sources=[TopicName("{w1}/temperature")],
+        sink=TopicName("{w1}/limited"),
+        rate_limiter=RateLimiter("limited", rate=1, mode=RateLimitMode.LATEST),
+    )
+
+    assert processor.has_timers
+    assert processor.process_message("dev1/temperature", b"1", timestamp=0) == [
+        Message(TopicName("dev1/limited"), b"1")
+    ]
+    assert processor.process_message("dev1/temperature", b"2", timestamp=0.5) == []
+    assert processor.process_message("dev2/temperature", b"3", timestamp=0.5) == [
+        Message(TopicName("dev2/limited"), b"3")
+    ]
+    assert processor.tick(1) == [Message(TopicName("dev1/limited"), b"2")]
+
+
+def test_rate_limit_model():
+    model = RateLimitModel(rate=5, mode="queue")
+    assert model.mode == RateLimitMode.QUEUE
+    assert model.burst == 1
+
+    with pytest.raises(ValidationError):
+        RateLimitModel(rate=0)
+
+    with pytest.raises(ValidationError):
+        RateLimitModel(rate=1, mode="unknown")
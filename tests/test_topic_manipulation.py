@@ -1,6 +1,10 @@
 import pytest
 
-from mqttprocessor.messages import RegexPatternCreator, TopicName
+import random
+
+from mqttprocessor.messages import (
+    RegexPatternCreator, SegmentMatcher, TopicName, TopicRuleIndex, topic_rules_overlap
+)
 
 
 def test_topic_name_invalid_rule():
@@ -148,4 +152,96 @@ def test_pattern_creator_extract_complex():
     assert actual == expected
 
 
-
+@pytest.mark.parametrize(
+    "rule, topic, expected",
+    [
+        ("a/{w1}/c", "a/b/c", {"w1": "b"}),
+        ("a/{w1}/c", "a//c", None),
+        ("a/{W1}/c", "a/b/x/c", {"W1": "b/x"}),
+        ("a/{W1}/c", "a//c", None),
+        ("a/{W1}/c", "a///c", {"W1": "/"}),
+        ("{W1}/{W2}", "a/b/c", {"W1": "a/b", "W2": "c"}),
+        ("{W1}/x/{W1}", "a/b/x/a/b", {"W1": "a/b"}),
+        ("{w1}/{w1}", "a/b", None),
+        ("a/{W1}", "a/b/", {"W1": "b/"}),
+        ("/a/{w1}", "/a/b", {"w1": "b"}),
+        ("a/{w1}/c", "a/b/c/d", None),
+    ]
+)
+def test_segment_matcher(rule: str, topic: str, expected):
+    assert SegmentMatcher.create(rule).match(topic) == expected
+
+
+def test_segment_matcher_only_for_whole_level_placeholders():
+    assert SegmentMatcher.create("a/{w1}/{W1}") is not None
+    assert SegmentMatcher.create("a/foo{w1}") is None
+
+
+def test_segment_matcher_matches_as_regex():
+    random.seed(0)
+    rule_levels = ["a", "b", "", "{w1}", "{w2}", "{W1}", "{W2}"]
+    topic_levels = ["a", "b", "", "c"]
+
+    for _ in range(2000):
+        rule = "/".join(random.choices(rule_levels, k=random.randint(1, 4)))
+        matcher = SegmentMatcher.create(rule)
+        regex = RegexPatternCreator(rule).create_regex()
+
+        for _ in range(10):
+            topic = "/".join(random.choices(topic_levels, k=random.randint(1, 6)))
+            search_result = regex.search(topic)
+
+            expected = None if search_result is None else search_result.groupdict()
+            assert matcher.match(topic) == expected, (rule, topic)
+
+
+def test_rule_index_matches_all_rules():
+    index = TopicRuleIndex(["a/{w1}", "a/b", "{W1}/b", "a/x{w1}", "{w1}/{w1}", "c/{W1}"])
+
+    assert index.match("a/b") == {"a/b": {}, "a/{w1}": {"w1": "b"}, "{W1}/b": {"W1": "a"}}
+    assert index.match("a/xb") == {"a/{w1}": {"w1": "xb"}, "a/x{w1}": {"w1": "b"}}
+    assert index.match("c/c") == {"{w1}/{w1}": {"w1": "c"}, "c/{W1}": {"W1": "c"}}
+    assert index.match("d/e/f") == {}
+    assert "a/b" in index and "a/c" not in index
+
+
+def test_rule_index_matches_as_topic_names():
+    random.seed(0)
+    rule_levels = ["a", "b", "{w1}", "{w2}", "{W1}", "{W2}", "x{w1}", "{w2}b"]
+    topic_levels = ["a", "b", "", "c", "xa", "ab"]
+
+    for _ in range(200):
+        rules = {
+            "/".join(random.choices(rule_levels, k=random.randint(1, 4)))
+            for _ in range(random.randint(1, 20))
+        }
+        index = TopicRuleIndex(rules)
+
+        for _ in range(50):
+            topic = "/".join(random.choices(topic_levels, k=random.randint(1, 6)))
+            expected = dict()
+            for rule in rules:
+                matches = TopicName(rule).matches(TopicName(topic))
+                if matches is not None:
+                    expected[rule] = matches
+
+            assert index.match(topic) == expected, topic
+
+
+@pytest.mark.parametrize(
+    "first, second, expected",
+    [
+        ("device/property", "device/property", True),
+        ("device/property", "device/other", False),
+        ("device/{w1}", "device/property", True),
+        ("device/{w1}", "device/property/value", False),
+        ("device/{W1}", "device/property/value", True),
+        ("device/{W1}/value", "device/value", False),
+        ("dev{w1}/value", "device/value", True),
+        ("dev{w1}/value", "sensor/value", False),
+        ("{w1}/value", "{w2}/{w3}", True),
+    ]
+)
+def test_topic_rules_overlap(first: str, second: str, expected: bool):
+    assert topic_rules_overlap(first, second) == expected
+    assert topic_rules_overlap(second, first) == expected
@@ -0,0 +1,225 @@
+import json
+from importlib import reload
+from typing import List
+
+import pytest
+from pydantic import ValidationError
+
+import mqttprocessor.builtin.converters
+import mqttprocessor.functions
+from mqttprocessor.definitions import WindowType
+from mqttprocessor.functions import ProcessorFunction
+from mqttprocessor.messages import TopicName, Message
+from mqttprocessor.models import ProcessorConfigModel, WindowModel
+from mqttprocessor.routing import Processor, ProcessorCreator
+from mqttprocessor.windowing import PercentileSketch, WindowAggregate, WindowStage
+
+
+def _sink_topic_factory(source_topic: TopicName) -> TopicName:
+    return TopicName("aggregated/" + source_topic.rule)
+
+
+def _add(window: WindowStage, topic: str, value, timestamp: float):
+    return window.add(value, TopicName(topic), {}, _sink_topic_factory, timestamp)
+
+
+def _results(emissions) -> List[dict]:
+    return [body for _, body in emissions]
+
+
+def test_tumbling_window():
+    window = WindowStage("tumbling", WindowType.TUMBLING, ["count", "sum", "mean", "min", "max"], size=10)
+
+    for timestamp, value in [(1, 4), (2, 2), (9, 6)]:
+        assert _add(window, "dev1", value, timestamp) == []
+
+    assert window.next_deadline() == 10
+    assert window.tick(9.9) == []
+
+    emissions = window.tick(10)
+    assert emissions[0][0] == TopicName("aggregated/dev1")
+    assert _results(emissions) == [
+        {"count": 3, "sum": 12.0, "mean": 4.0, "min": 2.0, "max": 6.0, "start": 0, "end": 10}
+    ]
+    assert window.next_deadline() is None
+
+
+def test_tumbling_window_closed_by_message():
+    window = WindowStage("tumbling", WindowType.TUMBLING, ["count"], size=10)
+
+    _add(window, "dev1", 1, 1)
+    emissions = _add(window, "dev1", 1, 12)
+
+    assert _results(emissions) == [{"count": 1, "start": 0, "end": 10}]
+    assert _results(window.tick(20)) == [{"count": 1, "start": 10, "end": 20}]
+
+
+def test_tumbling_window_keys():
+    window = WindowStage("tumbling", WindowType.TUMBLING, ["count"], size=10)
+
+    _add(window, "dev1", 1, 1)
+    _add(window, "dev2", 1, 2)
+    _add(window, "dev1", 1, 3)
+
+    emissions = window.tick(10)
+    assert {topic.rule: body["count"] for topic, body in emissions} == {
+        "aggregated/dev1": 2, "aggregated/dev2": 1
+    }
+
+
+def test_window_key_by_match_group():
+    window = WindowStage("grouped", WindowType.TUMBLING, ["count"], size=10, key="w1")
+
+    window.add(1, TopicName("room1/dev1"), {"w1": "room1"}, _sink_topic_factory, 1)
+    window.add(1, TopicName("room1/dev2"), {"w1": "room1"}, _sink_topic_factory, 2)
+
+    emissions = window.tick(10)
+    assert len(emissions) == 1
+    assert emissions[0][0] == TopicName("aggregated/room1/dev2")
+    assert emissions[0][1]["count"] == 2
+
+
+def test_sliding_window():
+    window = WindowStage("sliding", WindowType.SLIDING, ["count", "min", "max"], size=10, slide=5)
+
+    _add(window, "dev1", 5, 1)
+    _add(window, "dev1", 1, 4)
+
+    assert window.next_deadline() == 5
+    assert _results(window.tick(5)) == [{"count": 2, "min": 1.0, "max": 5.0, "start": -5, "end": 5}]
+
+    _add(window, "dev1", 3, 7)
+    assert _results(window.tick(10)) == [{"count": 3, "min": 1.0, "max": 5.0, "start": 0, "end": 10}]
+    assert _results(window.tick(12)) == []
+    assert _results(window.tick(15)) == [{"count": 1, "min": 3.0, "max": 3.0, "start": 5, "end": 15}]
+    assert _results(window.tick(20)) == []
+    assert window.next_deadline() is None
+
+
+def test_session_window():
+    window = WindowStage("session", WindowType.SESSION, ["count"], gap=5)
+
+    _add(window, "dev1", 1, 1)
+    _add(window, "dev1", 1, 4)
+    assert window.tick(6) == []
+    _add(window, "dev1", 1, 8)
+
+    assert window.tick(12) == []
+    assert _results(window.tick(13)) == [{"count": 3, "start": 1, "end": 8}]
+
+
+def test_window_max_keys():
+    window = WindowStage("bounded", WindowType.TUMBLING, ["count"], size=10, max_keys=2)
+
+    _add(window, "dev1", 1, 1)
+    _add(window, "dev2", 1, 1)
+    emissions = _add(window, "dev3", 1, 1)
+
+    assert emissions[0][0] == TopicName("aggregated/dev1")
+    assert len(window.tick(10)) == 2
+
+
+def test_window_field_and_invalid_values():
+    window = WindowStage("field", WindowType.TUMBLING, ["sum"], size=10, field="temperature")
+
+    _add(window, "dev1", {"temperature": 20}, 1)
+    _add(window, "dev1", {"humidity": 20}, 2)
+    _add(window, "dev1", {"temperature": "NaN?"}, 3)
+
+    assert _results(window.tick(10)) == [{"sum": 20.0, "start": 0, "end": 10}]
+
+
+@pytest.mark.parametrize("value", ["nan", "inf", "-Infinity", float("nan"), float("inf")])
+def test_window_ignores_non_finite_values(value):
+    window = WindowStage("finite", WindowType.TUMBLING, ["sum", "p50"], size=10)
+
+    _add(window, "dev1", value, 1)
+    _add(window, "dev1", 4, 2)
+
+    assert _results(window.tick(10)) == [{"sum": 4.0, "p50": pytest.approx(4, rel=0.02), "start": 0, "end": 10}]
+
+
+def test_sliding_aggregate_monotonic_extremes():
+    aggregate = WindowAggregate(True, True, False, sliding=True, max_samples=100)
+    values = [5, 3, 8, 1, 9, 2, 7]
+    for timestamp, value in enumerate(values):
+        aggregate.add(timestamp, value)
+
+    for cutoff in range(len(values)):
+        aggregate.expire(cutoff)
+        expected = values[cutoff:]
+        assert aggregate.result(["min", "max", "count"]) == {
+            "min": min(expected), "max": max(expected), "count": len(expected)
+        }
+
+
+def test_sliding_aggregate_max_samples():
+    aggregate = WindowAggregate(True, False, False, sliding=True, max_samples=3)
+    for timestamp, value in enumerate([1, 2, 3, 4, 5]):
+        aggregate.add(timestamp, value)
+
+    assert aggregate.result(["count", "sum", "min"]) == {"count": 3, "sum": 12.0, "min": 3}
+
+
+def test_percentile_sketch():
+    sketch = PercentileSketch(relative_accuracy=0.01)
+    for value in range(1, 1001):
+        sketch.add(value)
+
+    assert sketch.quantile(0.5) == pytest.approx(500, rel=0.02)
+    assert sketch.quantile(0.99) == pytest.approx(990, rel=0.02)
+
+    for value in range(1, 501):
+        sketch.remove(value)
+
+    assert sketch.quantile(0) == pytest.approx(501, rel=0.02)
+
+
+def test_window_model_validation():
+    assert WindowModel(type="sliding", size=60, aggregates=["mean", "p99"]).slide is None
+
+    with pytest.raises(ValidationError):
+        WindowModel(type="session", size=60)
+
+    with pytest.raises(ValidationError):
+        WindowModel(size=60, aggregates=["median"])
+
+
+@pytest.mark.parametrize(
+    "processor_functions",
+    [
+        ["dummy_rule_true"]
+    ], indirect=True
+)
+def test_processor_with_window(processor_functions: List[ProcessorFunction]):
+    processor = Processor(
+        "windowed-processor", processor_functions,
+        [TopicName("sensors/{w1}")], TopicName("averages/{w1}"),
+        window=WindowStage("windowed-processor", WindowType.TUMBLING, ["mean"], size=60)
+    )
+
+    assert processor.has_timers
+    assert processor.process_message("sensors/dev1", "10", timestamp=1) == []
+    assert processor.process_message("sensors/dev1", "20", timestamp=2) == []
+
+    assert processor.tick(60) == [
+        Message(TopicName("averages/dev1"), {"mean": 15.0, "start": 0, "end": 60})
+    ]
+
+
+def test_processor_with_window_and_output_format():
+    reload(mqttprocessor.functions)
+    reload(mqttprocessor.builtin.converters)
+
+    processor = ProcessorCreator(ProcessorConfigModel(
+        source="sensors/{w1}", sink="averages/{w1}", function="binary_to_json",
+        input_format="binary", output_format="json",
+        window={"size": 60, "aggregates": ["mean"]},
+    )).create()
+
+    assert processor.process_message("sensors/dev1", b"10", timestamp=1) == []
+    assert processor.process_message("sensors/dev1", b"20", timestamp=2) == []
+
+    emission, = processor.tick(60)
+    assert emission.sink_topic == TopicName("averages/dev1")
+    assert json.loads(emission.message_body) == {"mean": 15.0, "start": 0, "end": 60}